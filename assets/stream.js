@@ -0,0 +1,41 @@
+// Clientside callbacks of the streaming quote mode (lib/quote_stream.py, registered in dashboard_app/callbacks.py)
+// Stream diffs only hold the changed values, so they are applied here instead of re-rendering the table and chart on the server
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    stream: {
+        // Writes a page rendered by the server to the option chain table, or patches the shown rows that changed in a stream diff
+        table_data: function(page, diff, data) {
+            var triggered = dash_clientside.callback_context.triggered.map(function(trigger) { return trigger.prop_id; });
+
+            if (triggered.indexOf('storage-stream-diff.data') < 0) {
+                return page ? page : dash_clientside.no_update;
+            }
+
+            if (!diff || !data) {
+                return dash_clientside.no_update;
+            }
+
+            var changed = false;
+            var patched = data.map(function(row) {
+                var values = diff.rows[row.id];
+                if (values === undefined) {
+                    return row;
+                }
+                changed = true;
+                return Object.assign({}, row, values);
+            });
+
+            return changed ? patched : dash_clientside.no_update;
+        },
+
+        // Replaces the upper (trace 0) and lower (trace 1) bounds of the probability cone with those of the streamed stock price:
+        // extending each trace by the whole cone while keeping only as many points drops the previous cone
+        cone_extend: function(diff, tab) {
+            if (!diff || !diff.cone || tab !== 'prob_cone_tab') {
+                return dash_clientside.no_update;
+            }
+
+            var cone = diff.cone;
+            return [{x: [cone.x, cone.x], y: [cone.upper, cone.lower]}, [0, 1], cone.x.length];
+        }
+    }
+});
@@ -0,0 +1,71 @@
+# Compares encode/decode times of the processed option chain between the JSON round trip used before
+# (df.to_json(orient='split') / pd.read_json) and the binary columnar format of lib/frame_codec.py
+# Usage (from the repository root): python -m benchmarks.bench_frame_codec --rows 1000 10000 100000
+import io
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+
+from lib.frame_codec import encode_frame, decode_frame
+from lib.option_chain import OPTION_CHAIN_COLUMNS
+from benchmarks.timing import best_time, print_table
+
+# Builds a processed option chain Dataframe (same columns and dtypes as lib.option_chain.process_option_chain) with random values
+def synthetic_chain_frame(rows:int, seed:int=0) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    exp_days = rng.integers(0, 100, rows)
+
+    return pd.DataFrame({
+        'ticker': np.full(rows, 'SPY', dtype=object),
+        'exp_date': pd.Timestamp('2021-01-01').to_datetime64() + exp_days.astype('timedelta64[D]'),
+        'option_type': rng.choice(np.array(['CALL', 'PUT'], dtype=object), rows),
+        'strike_price': np.round(rng.uniform(100, 500, rows), 1),
+        'exp_days': exp_days,
+        'delta': np.round(rng.uniform(-1, 1, rows), 3),
+        'prob_val': rng.uniform(0, 1, rows),
+        'open_interest': rng.integers(0, 10000, rows),
+        'total_volume': rng.integers(0, 10000, rows),
+        'premium': np.round(rng.uniform(0, 2000, rows), 2),
+        'option_leverage': np.round(rng.uniform(0, 50, rows), 3),
+        'bid_size': rng.integers(0, 500, rows),
+        'ask_size': rng.integers(0, 500, rows),
+        'roi_val': np.round(rng.uniform(0, 5, rows), 2),
+        'lower_bound': np.round(rng.uniform(250, 300, rows), 2),
+        'upper_bound': np.round(rng.uniform(300, 350, rows), 2),
+    }, columns=OPTION_CHAIN_COLUMNS)
+
+def run(row_counts:list, repeat:int=5) -> list:
+
+    results = []
+
+    for rows in row_counts:
+        df = synthetic_chain_frame(rows)
+
+        json_data = df.to_json(orient='split')
+        binary_data = encode_frame(df)
+        pickle_data = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+
+        for name, encode, decode, data in [
+            ('json', lambda: df.to_json(orient='split'), lambda: pd.read_json(io.StringIO(json_data), orient='split'), json_data),
+            ('frame_codec', lambda: encode_frame(df), lambda: decode_frame(binary_data), binary_data),
+            ('pickle', lambda: pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), lambda: pickle.loads(pickle_data), pickle_data),
+        ]:
+            results.append({
+                'rows': rows,
+                'format': name,
+                'bytes': len(data),
+                'encode_ms': best_time(encode, repeat) * 1000,
+                'decode_ms': best_time(decode, repeat) * 1000,
+            })
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Option chain Dataframe serialization benchmark')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000], help='Number of option contracts')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per case (best time is reported)')
+    args = parser.parse_args()
+
+    print_table(run(args.rows, args.repeat))
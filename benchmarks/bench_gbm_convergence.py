@@ -0,0 +1,68 @@
+# Convergence report of the Monte Carlo probability engine of lib/gbm.py: standard error (across independent batches) and
+# error against the exact lognormal probabilities for each sampler, with and without the S_T control variate, by number of paths
+# paths_needed is the number of paths that reaches the standard error of --reference-paths pseudo-random paths (the dashboard's
+# former N = 1,000,000) at the measured convergence rate, reduction is how many times fewer paths that is
+# Usage (from the repository root): python -m benchmarks.bench_gbm_convergence --paths 1024 16384 131072 --steps 1
+import time
+import argparse
+import numpy as np
+
+from lib.lazy_import import preload
+from lib.gbm import SAMPLERS, MC_BATCHES, prob_curve_mc_stats, prob_curve_lognormal
+from benchmarks.timing import print_table
+
+# GBM parameters of the probability chart in dashboard_app/callbacks.py (30 days to expiry), prices within 15% of spot
+S, T, R, Q, SIGMA = 100.0, 30/252, 0.01, 0.007, 0.3
+VALUES = np.linspace(85, 115, 13)
+
+def run(path_counts:list, steps:int=1, batches:int=MC_BATCHES, reference_paths:int=1000000, seed:int=0) -> list:
+
+    # Quasi-random samplers import scipy.stats on first use, which is not timed
+    preload(['scipy.stats.qmc'])
+
+    exact_under, _ = prob_curve_lognormal(VALUES, S, T, R, Q, SIGMA)
+
+    # Standard error of reference_paths pseudo-random paths: binomial error of the worst (closest to 50%) probability
+    reference_stderr = np.sqrt(exact_under*(1 - exact_under)/reference_paths).max()
+
+    results = []
+    for sampler in SAMPLERS:
+        for control_variate in (False, True):
+            previous = None
+            for N in path_counts:
+                start = time.perf_counter()
+                under, _, under_stderr, _ = prob_curve_mc_stats(VALUES, S, T, R, Q, SIGMA, steps, N, sampler, control_variate, batches, seed)
+                seconds = time.perf_counter() - start
+
+                stderr = under_stderr.max()
+
+                # Convergence rate from the previous path count (0.5 for plain Monte Carlo, up to about 1 for quasi-random)
+                rate = np.log(previous[1]/stderr)/np.log(N/previous[0]) if previous is not None and stderr > 0 else 0.5
+                rate = max(rate, 0.5)
+                paths_needed = N*(stderr/reference_stderr)**(1/rate)
+                previous = (N, stderr)
+
+                results.append({
+                    'sampler': sampler,
+                    'control_variate': control_variate,
+                    'paths': N,
+                    'stderr': f'{stderr:.2e}',
+                    'max_abs_error': f'{np.abs(under - exact_under).max():.2e}',
+                    'rate': rate,
+                    'paths_needed': int(np.ceil(paths_needed)),
+                    'reduction': reference_paths/paths_needed,
+                    'ms': seconds*1000,
+                })
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='GBM Monte Carlo variance reduction convergence report')
+    parser.add_argument('--paths', type=int, nargs='+', default=[2**10, 2**14, 2**17], help='Number of simulated paths (powers of 2 suit the Sobol sampler)')
+    parser.add_argument('--steps', type=int, default=1, help='Time steps per path (quasi-random dimensions), more than 1 for path-dependent payoffs')
+    parser.add_argument('--batches', type=int, default=MC_BATCHES, help='Independent batches the standard error is estimated from')
+    parser.add_argument('--reference-paths', type=int, default=1000000, help='Pseudo-random paths whose standard error paths_needed reaches')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulations')
+    args = parser.parse_args()
+
+    print_table(run(sorted(args.paths), args.steps, args.batches, args.reference_paths, args.seed))
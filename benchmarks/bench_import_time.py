@@ -0,0 +1,109 @@
+# Cold start report: imports modules in fresh interpreters with python -X importtime and reports the cumulative import time
+# of each module (module and everything it imported first), then checks the total against a budget (exit status 1 if over,
+# or if a lazily loaded module of lib/lazy_import.py was imported eagerly)
+# Usage (from the repository root): python -m benchmarks.bench_import_time --modules dashboard_app.callbacks --budget 1.5 --top 25
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+from lib.lazy_import import LAZY_MODULES
+from benchmarks.timing import print_table
+
+# Seconds a cold import of each module may take (best of --runs fresh interpreters)
+IMPORT_BUDGETS = {
+    'dashboard_app.callbacks': 1.5,     # Callbacks and lib/
+    'dashboard': 2.0,                   # App setup (what a server worker imports)
+}
+
+# Modules that must not be imported at startup: the lazily loaded ones and those they replaced
+EAGER_BLACKLIST = sorted(set(LAZY_MODULES) | {'scipy.stats', 'matplotlib.pyplot'})
+
+# 'import time:       self [us] |  cumulative | imported package' lines of -X importtime, nesting is the indentation of the name
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports module in a new interpreter, returns its imports as dicts (name, depth, self_s, cumulative_s) in the order they finished
+def import_times(module:str) -> list:
+
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise ValueError(f"Importing '{module}' failed:\n{process.stderr}")
+
+    imports = []
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({'name': name, 'depth': len(indent) // 2, 'self_s': int(self_us) / 1e6, 'cumulative_s': int(cumulative_us) / 1e6})
+
+    return imports
+
+# Import time (self) summed per top level package, e.g. 'pandas' sums every pandas.* module while numpy counts in 'numpy'
+def package_times(imports:list) -> dict:
+
+    packages = {}
+    for entry in imports:
+        package = entry['name'].split('.')[0]
+        packages[package] = packages.get(package, 0.0) + entry['self_s']
+
+    return dict(sorted(packages.items(), key=lambda item: -item[1]))
+
+def run(modules:list, runs:int=3, top:int=25) -> tuple:
+
+    results = []
+    reports = {}
+
+    for module in modules:
+        timings = [import_times(module) for _ in range(runs)]
+        totals = [sum(entry['self_s'] for entry in imports) for imports in timings]
+        best = timings[totals.index(min(totals))]
+
+        eager = sorted(name for name in EAGER_BLACKLIST if any(entry['name'] == name for entry in best))
+
+        results.append({
+            'module': module,
+            'first_s': totals[0],
+            'best_s': min(totals),
+            'budget_s': IMPORT_BUDGETS.get(module, ''),
+            'modules': len(best),
+            'eager_heavy': ','.join(eager) or '-',
+        })
+        reports[module] = {
+            'modules': sorted(best, key=lambda entry: -entry['cumulative_s'])[:top],
+            'packages': package_times(best),
+        }
+
+    return results, reports
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', type=str, nargs='+', default=list(IMPORT_BUDGETS), help='Modules to import, e.g. dashboard_app.callbacks lib.gbm')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per module, the first one may also compile the .pyc files')
+    parser.add_argument('--top', type=int, default=25, help='Modules listed per report, by cumulative import time')
+    parser.add_argument('--budget', type=float, default=None, help='Seconds every module may take (Default: IMPORT_BUDGETS)')
+    args = parser.parse_args()
+
+    if args.budget is not None:
+        IMPORT_BUDGETS.update({module: args.budget for module in args.modules})
+
+    results, reports = run(args.modules, args.runs, args.top)
+
+    for module, report in reports.items():
+        print(f'\n{module}: slowest modules (cumulative)')
+        print_table([{'module': '  ' * entry['depth'] + entry['name'], 'self_s': entry['self_s'], 'cumulative_s': entry['cumulative_s']} for entry in report['modules']])
+
+        print(f'\n{module}: top level packages')
+        print_table([{'package': package, 'seconds': seconds} for package, seconds in list(report['packages'].items())[:args.top]])
+
+    print()
+    print_table(results)
+
+    failed = [row for row in results if (row['budget_s'] != '' and row['best_s'] > row['budget_s']) or row['eager_heavy'] != '-']
+    for row in failed:
+        print(f"FAILED {row['module']}: {row['best_s']:.3f}s (budget {row['budget_s']}s), eagerly imported: {row['eager_heavy']}")
+
+    sys.exit(1 if failed else 0)
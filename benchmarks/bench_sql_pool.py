@@ -0,0 +1,194 @@
+# Times the connection pool, batched inserts and streaming exports of lib/sql_connection.py against a local SQLite database,
+# and checks the pool's failure handling (exit status 1 if a check fails):
+#   acquire/release    connections are reused and pool_size is never exceeded
+#   reconnect failure  a dropped connection whose reconnect fails frees its slot (the next connection() does not block)
+#   rollback failure   a broken connection whose rollback fails is dropped instead of returned to the pool
+#   exhaustion         connection() raises TimeoutError once every connection stayed in use for the pool timeout
+# Usage (from the repository root): python -m benchmarks.bench_sql_pool --rows 10000 100000
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+from lib.sql_connection import ConnectionPool, create_sqlite_pool, sql_import_frame, sql_export, sql_export_frames
+from benchmarks.timing import best_time, print_table
+
+# Stand-in for a MySQL connection: is_connected() reports whether the server dropped it, rollback() fails once broken
+class FakeConnection:
+
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return self.connected
+
+    def rollback(self):
+        if not self.connected:
+            raise sqlite3.OperationalError('Lost connection to server.')
+
+    def close(self):
+        self.closed = True
+
+# Connection factory of FakeConnections, raising for the calls listed in fail_on (1 based call numbers)
+class FakeConnect:
+
+    def __init__(self, fail_on=()):
+        self.calls = 0
+        self.fail_on = set(fail_on)
+        self.connections = []
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise sqlite3.OperationalError("Can't connect to server.")
+        conn = FakeConnection()
+        self.connections.append(conn)
+        return conn
+
+def check_acquire_release() -> str:
+
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, pool_size=2, timeout=1)
+
+    for _ in range(10):
+        with pool.connection():
+            pass
+
+    barrier = threading.Barrier(2)
+    def borrow():
+        with pool.connection():
+            barrier.wait()
+    threads = [threading.Thread(target=borrow) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert connect.calls == 2, f'{connect.calls} connections opened for pool_size=2'
+    return f'{connect.calls} connections for 12 borrows'
+
+def check_reconnect_failure() -> str:
+
+    connect = FakeConnect(fail_on=[2])
+    pool = ConnectionPool(connect, pool_size=1, timeout=1)
+
+    with pool.connection() as conn:
+        conn.connected = False # Dropped by the server while idle
+
+    try:
+        with pool.connection():
+            raise AssertionError('connection() succeeded although reconnecting failed')
+    except sqlite3.OperationalError:
+        pass
+
+    # The slot of the failed reconnect is free again, so this opens a new connection instead of waiting for the timeout
+    with pool.connection() as conn:
+        assert conn.connected
+    assert pool._created == 1, f'_created is {pool._created}'
+
+    return 'slot freed, next connection() reconnects'
+
+def check_rollback_failure() -> str:
+
+    connect = FakeConnect()
+    pool = ConnectionPool(connect, pool_size=1, timeout=1)
+
+    try:
+        with pool.connection() as conn:
+            conn.connected = False
+            raise ValueError('Query failed.')
+    except ValueError:
+        pass
+
+    assert connect.connections[0].closed, 'broken connection not closed'
+    with pool.connection() as conn:
+        assert conn is not connect.connections[0], 'broken connection returned to the pool'
+
+    return 'broken connection dropped'
+
+def check_exhaustion(timeout:float=0.2) -> str:
+
+    pool = ConnectionPool(FakeConnect(), pool_size=1, timeout=timeout)
+
+    with pool.connection():
+        try:
+            with pool.connection():
+                raise AssertionError('second connection() succeeded with pool_size=1')
+        except TimeoutError as error:
+            return str(error)
+
+CHECKS = [
+    ('acquire/release', check_acquire_release),
+    ('reconnect failure', check_reconnect_failure),
+    ('rollback failure', check_rollback_failure),
+    ('exhaustion', check_exhaustion),
+]
+
+def run_checks() -> list:
+
+    results = []
+    for name, check in CHECKS:
+        try:
+            results.append({'check': name, 'status': 'ok', 'detail': check()})
+        except AssertionError as error:
+            results.append({'check': name, 'status': 'FAILED', 'detail': str(error)})
+
+    return results
+
+def run(row_counts:list, batch_sizes:list, repeat:int=3) -> list:
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'bench.db')
+        pool = create_sqlite_pool(database)
+
+        # Borrowing a pooled connection vs opening one per call (what sql_import/sql_export did before the pool)
+        def new_connection():
+            conn = sqlite3.connect(database)
+            conn.execute('SELECT 1').fetchall()
+            conn.close()
+        def pooled_connection():
+            with pool.connection() as conn:
+                conn.execute('SELECT 1').fetchall()
+
+        results.append({'case': 'connect_per_call', 'rows': 1, 'batch_size': '', 'ms': best_time(new_connection, repeat) * 1000})
+        results.append({'case': 'pooled_connection', 'rows': 1, 'batch_size': '', 'ms': best_time(pooled_connection, repeat) * 1000})
+
+        for rows in row_counts:
+            rng = np.random.default_rng(0)
+            df = pd.DataFrame({'strike_price': np.round(rng.uniform(100, 500, rows), 1), 'premium': rng.uniform(0, 2000, rows), 'open_interest': rng.integers(0, 10000, rows)})
+
+            for batch_size in batch_sizes:
+                def insert():
+                    sql_export('DROP TABLE IF EXISTS chain', pool=pool)
+                    sql_export('CREATE TABLE chain (strike_price REAL, premium REAL, open_interest INTEGER)', pool=pool)
+                    return sql_import_frame('chain', df, batch_size=batch_size, pool=pool)
+
+                results.append({'case': 'sql_import_frame', 'rows': rows, 'batch_size': batch_size, 'ms': best_time(insert, repeat) * 1000})
+
+            results.append({'case': 'sql_export', 'rows': rows, 'batch_size': '', 'ms': best_time(lambda: sql_export('SELECT * FROM chain', pool=pool), repeat) * 1000})
+            results.append({'case': 'sql_export_frames', 'rows': rows, 'batch_size': '', 'ms': best_time(lambda: sum(len(frame) for frame in sql_export_frames('SELECT * FROM chain', pool=pool)), repeat) * 1000})
+
+        pool.close()
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SQL connection pool, bulk insert and streaming export benchmark (SQLite)')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Rows inserted and exported')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Rows per executemany() call')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per case (best time is reported)')
+    args = parser.parse_args()
+
+    checks = run_checks()
+    print_table(checks)
+    print()
+    print_table(run(args.rows, args.batch_sizes, args.repeat))
+
+    sys.exit(1 if any(check['status'] != 'ok' for check in checks) else 0)
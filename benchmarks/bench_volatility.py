@@ -0,0 +1,117 @@
+# Times every get_hist_volatility estimator across price history lengths, and checks the range based estimators
+# against the previous rolling(...).apply() implementation (max absolute difference is reported)
+# Also checks that the streaming lib.stats.OnlineVolatility matches get_hist_volatility(...).iloc[-1] for each estimator
+# after every candle (exit status 1 if the difference exceeds ONLINE_TOLERANCE)
+# Usage (from the repository root): python -m benchmarks.bench_volatility --candles 252 1260 20000
+import sys
+import math
+import argparse
+import numpy as np
+import pandas as pd
+
+from lib.stats import get_hist_volatility, OnlineVolatility
+from benchmarks.timing import best_time, print_table
+
+VOL_ESTIMATORS = ['log_returns', 'garman_klass', 'hodges_tompkins', 'parkinson', 'rogers_satchell', 'yang_zhang']
+
+# Max absolute difference allowed between the streaming and the rolling volatility
+ONLINE_TOLERANCE = 1e-9
+
+# Builds a daily OHLC price Dataframe (same columns as the TOS price history candles) from a random walk
+def synthetic_price_frame(candles:int, seed:int=0) -> pd.DataFrame:
+
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, candles)))
+    open_ = close * np.exp(rng.normal(0, 0.005, candles))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, candles)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, candles)))
+
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': rng.integers(1000, 100000, candles)})
+
+# Previous implementation of the range based estimators (Python callback per window position)
+def reference_volatility(price_df, window, estimator, trading_periods=252):
+
+    log_hl = np.log(price_df['high'] / price_df['low'])
+    log_co = np.log(price_df['close'] / price_df['open'])
+    log_ho = np.log(price_df['high'] / price_df['open'])
+    log_lo = np.log(price_df['low'] / price_df['open'])
+
+    if estimator == 'garman_klass':
+        rs = 0.5 * log_hl**2 - (2*math.log(2)-1) * log_co**2
+    elif estimator == 'parkinson':
+        rs = (1.0 / (4.0 * math.log(2.0))) * log_hl**2.0
+    elif estimator == 'rogers_satchell':
+        rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
+
+    def f(v):
+        return (trading_periods * v.mean())**0.5
+
+    return rs.rolling(window=window, center=False).apply(func=f).dropna()
+
+def run(candle_counts:list, window:int=30, repeat:int=3) -> list:
+
+    results = []
+
+    for candles in candle_counts:
+        price_df = synthetic_price_frame(candles)
+
+        for estimator in VOL_ESTIMATORS:
+            row = {
+                'candles': candles,
+                'estimator': estimator,
+                'ms': best_time(lambda: get_hist_volatility(price_df, window, estimator=estimator), repeat) * 1000,
+                'reference_ms': '',
+                'max_abs_diff': '',
+            }
+
+            if estimator in ('garman_klass', 'parkinson', 'rogers_satchell'):
+                row['reference_ms'] = best_time(lambda: reference_volatility(price_df, window, estimator), 1) * 1000
+                diff = (get_hist_volatility(price_df, window, estimator=estimator) - reference_volatility(price_df, window, estimator)).abs().max()
+                row['max_abs_diff'] = f'{diff:.2e}'
+
+            results.append(row)
+
+    return results
+
+# Streams every candle through OnlineVolatility and compares each value with the rolling estimator of the same candles
+def check_online(candle_counts:list, window:int=30) -> list:
+
+    results = []
+
+    for candles in candle_counts:
+        price_df = synthetic_price_frame(candles)
+        ohlc = price_df[['open', 'high', 'low', 'close']].to_numpy()
+
+        for estimator in VOL_ESTIMATORS:
+            online_vol = OnlineVolatility(window, estimator)
+            online = np.array([online_vol.update(*candle) for candle in ohlc])
+
+            # Rolling values of every prefix (hodges_tompkins depends on the number of returns seen, so each prefix is computed on its own)
+            if estimator == 'hodges_tompkins':
+                checked = range(window + 1, candles + 1, max(1, candles // 50))
+                reference = np.array([get_hist_volatility(price_df.iloc[:end], window, estimator=estimator).iloc[-1] for end in checked])
+                online = online[[end - 1 for end in checked]]
+            else:
+                rolling = get_hist_volatility(price_df, window, estimator=estimator)
+                reference = rolling.to_numpy()
+                online = online[rolling.index.to_numpy()]
+
+            diff = float(np.nanmax(np.abs(online - reference))) if len(reference) else 0.0
+            results.append({'candles': candles, 'estimator': estimator, 'max_abs_diff': f'{diff:.2e}', 'status': 'ok' if diff <= ONLINE_TOLERANCE else 'FAILED'})
+
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Historical volatility estimator benchmark')
+    parser.add_argument('--candles', type=int, nargs='+', default=[252, 1260, 20000], help='Price history lengths (1Y, 5Y daily, intraday)')
+    parser.add_argument('--window', type=int, default=30, help='Rolling window')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed runs per case (best time is reported)')
+    args = parser.parse_args()
+
+    print_table(run(args.candles, args.window, args.repeat))
+
+    checks = check_online(args.candles, args.window)
+    print()
+    print_table(checks)
+
+    sys.exit(1 if any(check['status'] != 'ok' for check in checks) else 0)
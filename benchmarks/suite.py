@@ -0,0 +1,296 @@
+# Benchmark suite of lib/ and of every Dash callback in dashboard_app/callbacks.py, run offline on synthetic data
+# Inputs are parameterized by option chain size (strikes per expiry), price history length (candles) and number of GBM paths
+# Results can be saved as a baseline JSON and later runs compared against it to catch slowdowns before deploying
+# Usage (from the repository root):
+#   python -m benchmarks.suite --save benchmarks/baseline.json
+#   python -m benchmarks.suite --compare benchmarks/baseline.json --threshold 0.25
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from lib.gbm import geo_brownian_paths, gbm_sim
+from lib.stats import VOL_ESTIMATORS, get_hist_volatility, get_hist_volatility_matrix, prob_cone, get_prob
+from lib.option_chain import process_option_chain, get_skew
+from lib.tos_replay import RecordingAdapter, ReplayAdapter, SyntheticMarket
+from lib.tos_client import mount_adapter
+from lib.tos_cache import response_cache
+from lib.price_store import PriceStore
+from lib.data_store import DataStore
+from lib.prefetch import PrefetchScheduler
+from lib.quote_stream import StreamingChain, SimulatedQuoteSource
+from benchmarks.timing import best_time, print_table
+from benchmarks.bench_volatility import synthetic_price_frame
+
+GROUPS = ('gbm', 'volatility', 'prob', 'ingestion', 'stream', 'callbacks')
+
+# Default parameters and the smaller set of --quick runs
+DEFAULTS = {'strikes': [20, 60, 200], 'candles': [252, 1260, 5040], 'paths': [10000, 100000, 1000000]}
+QUICK = {'strikes': [20], 'candles': [252], 'paths': [10000]}
+
+# GBM parameters of the probability chart in dashboard_app/callbacks.py
+S, T, R, Q, SIGMA = 100.0, 30/252, 0.01, 0.007, 0.3
+
+def _case_id(group:str, name:str, params:dict) -> str:
+    return f"{group}.{name}[{','.join(f'{key}={value}' for key, value in params.items())}]"
+
+def gbm_cases(strikes:list, candles:list, paths:list) -> list:
+
+    price_df = synthetic_price_frame(252)
+    cases = []
+
+    for N in paths:
+        cases.append(('gbm', 'geo_brownian_paths', {'N': N}, lambda N=N: geo_brownian_paths(S, T, R, Q, SIGMA, 1, N)))
+        for engine in ('monte_carlo', 'lognormal'):
+            cases.append(('gbm', f'gbm_sim_{engine}', {'N': N}, lambda N=N, engine=engine: gbm_sim(price_df, S, T, R, Q, SIGMA, 1, N, bin_size=10, engine=engine)))
+        for sampler in ('antithetic', 'sobol'):
+            cases.append(('gbm', f'gbm_sim_monte_carlo_{sampler}', {'N': N}, lambda N=N, sampler=sampler: gbm_sim(price_df, S, T, R, Q, SIGMA, 1, N, bin_size=10, engine='monte_carlo', sampler=sampler)))
+
+    return cases
+
+def volatility_cases(strikes:list, candles:list, paths:list) -> list:
+
+    cases = []
+
+    for count in candles:
+        price_df = synthetic_price_frame(count)
+        for estimator in VOL_ESTIMATORS:
+            cases.append(('volatility', estimator, {'candles': count}, lambda price_df=price_df, estimator=estimator: get_hist_volatility(price_df, 30, estimator=estimator)))
+        cases.append(('volatility', 'matrix', {'candles': count}, lambda price_df=price_df: get_hist_volatility_matrix(price_df, [14, 30, 90, 252])))
+
+    return cases
+
+def _chain_market(strike_count:int) -> SyntheticMarket:
+    return SyntheticMarket(seed=0, expiries=12, strikes=strike_count)
+
+def prob_cases(strikes:list, candles:list, paths:list) -> list:
+
+    rng = np.random.default_rng(0)
+    cases = []
+
+    for strike_count in strikes:
+        # One value per contract of a chain of this size (12 weekly + 12 monthly expiries, calls and puts)
+        contracts = 2 * 24 * strike_count
+        strike_price = rng.uniform(50, 150, contracts)
+        days_ahead = rng.integers(0, 365, contracts)
+
+        cases.append(('prob', 'prob_cone', {'contracts': contracts}, lambda days_ahead=days_ahead: prob_cone(S, SIGMA, days_ahead, 0.7)))
+        cases.append(('prob', 'get_prob', {'contracts': contracts}, lambda strike_price=strike_price, days_ahead=days_ahead: get_prob(S, strike_price, SIGMA, days_ahead)))
+
+    return cases
+
+def ingestion_cases(strikes:list, candles:list, paths:list) -> list:
+
+    cases = []
+
+    for strike_count in strikes:
+        chain = _chain_market(strike_count).option_chain('BENCH')
+        params = {'contracts': chain['numberOfContracts']}
+
+        cases.append(('ingestion', 'process_option_chain', params, lambda chain=chain: process_option_chain(chain, 'BENCH', chain['underlyingPrice'], SIGMA, 365, 0.7)))
+        cases.append(('ingestion', 'get_skew', params, lambda chain=chain: get_skew(chain, 'BENCH')))
+
+    return cases
+
+# Ticks applied to a streamed chain, compare with ingestion.process_option_chain (the full recomputation of a Submit)
+def stream_cases(strikes:list, candles:list, paths:list) -> list:
+
+    cases = []
+
+    for strike_count in strikes:
+        chain = _chain_market(strike_count).option_chain('BENCH')
+        streaming_chain = StreamingChain(chain, 'BENCH', chain['underlyingPrice'], SIGMA, 365, 0.7)
+        params = {'contracts': chain['numberOfContracts']}
+
+        # Bids of 5% of the contracts move on every tick, ticks alternate between two states so every apply changes values
+        source = SimulatedQuoteSource(seed=0, contract_share=0.05)
+        source.subscribe('BENCH', chain['underlyingPrice'], streaming_chain.contract_bids())
+        contract_ticks = [[tick for tick in source.poll() if tick['key'] != 'BENCH'] for _ in range(2)]
+        price_ticks = [[{'key': 'BENCH', 'lastPrice': chain['underlyingPrice'] * move}] for move in (1.001, 0.999)]
+        page_keys = streaming_chain.keys[:10].tolist()
+
+        def apply_ticks(streaming_chain=streaming_chain, ticks=None, state=[0]):
+            state[0] += 1
+            streaming_chain.apply(ticks[state[0] % 2])
+
+        cases.append(('stream', 'underlying_tick', params, lambda apply_ticks=apply_ticks, ticks=price_ticks: apply_ticks(ticks=ticks)))
+        cases.append(('stream', 'contract_ticks', params, lambda apply_ticks=apply_ticks, ticks=contract_ticks: apply_ticks(ticks=ticks)))
+        cases.append(('stream', 'page_diff', params, lambda streaming_chain=streaming_chain, page_keys=page_keys: streaming_chain.diff(0, page_keys)))
+
+    return cases
+
+# Collects the callbacks registered by register_callbacks() by function name, so they can be called directly
+class _CallbackCollector:
+
+    def __init__(self):
+        self.callbacks = {}
+
+    def callback(self, *args, **kwargs):
+        def register(func):
+            self.callbacks[func.__name__] = func
+            return func
+        return register
+
+    def clientside_callback(self, *args, **kwargs):
+        pass
+
+def callback_cases(strikes:list, candles:list, paths:list) -> list:
+
+    # Responses are generated once and replayed from recordings, so callback timings include JSON decoding but not data generation
+    recordings_dir = tempfile.mkdtemp(prefix='tos_bench_recordings_')
+    for strike_count in strikes:
+        mount_adapter(RecordingAdapter(recordings_dir, ReplayAdapter(None, _chain_market(strike_count))))
+        response_cache.clear()
+        ticker = f'BENCH{strike_count}'
+        collector = _CallbackCollector()
+        _register(collector)
+        collector.callbacks['get_ticker_data'](1, ticker, 30, 'log_returns', 365, 0.7, 0, 1, None)
+        collector.callbacks['update_search'](ticker, True, None)
+        for tab in ('price_tab_1', 'price_tab_2', 'price_tab_3', 'price_tab_5'):
+            collector.callbacks['on_data_set_price_history'](None, tab, ticker)
+    mount_adapter(ReplayAdapter(recordings_dir))
+
+    cases = []
+
+    for strike_count in strikes:
+        collector = _CallbackCollector()
+        _register(collector)
+        callbacks = collector.callbacks
+
+        ticker = f'BENCH{strike_count}'
+        response_cache.clear()
+        hist_handle, quotes_handle, chain_handle, ticker_rows, _ = callbacks['get_ticker_data'](1, ticker, 30, 'log_returns', 365, 0.7, 0, 1, None)
+        params = {'contracts': 2 * 24 * strike_count}
+
+        # Submit of a watchlist ticker, read from a prefetched snapshot
+        prefetcher = PrefetchScheduler([ticker], 'benchmark', PriceStore(tempfile.mkdtemp(prefix='tos_bench_prices_')), derived_params=[(30, 'log_returns', 365, 0.7)])
+        prefetcher.refresh_all()
+        prefetch_collector = _CallbackCollector()
+        _register(prefetch_collector, prefetcher)
+
+        def fetch(ticker=ticker, callbacks=callbacks):
+            # Cold response cache, as on the first Submit of a ticker
+            response_cache.clear()
+            callbacks['get_ticker_data'](1, ticker, 30, 'log_returns', 365, 0.7, 0, 1, None)
+
+        def filter_only(ticker=ticker, callbacks=callbacks, hist_handle=hist_handle, state=[0]):
+            # Submit changing only the ROI filter (alternating, so every call is a change), the raw data of the session is reused
+            state[0] += 1
+            callbacks['get_ticker_data'](1, ticker, 30, 'log_returns', 365, 0.7, state[0] % 2, 1, hist_handle)
+
+        def table_new_filter(callbacks=callbacks, handles=(chain_handle, hist_handle), state=[0]):
+            # Filter set not seen before, the filtered table and its sort order are built
+            state[0] += 1
+            callbacks['on_data_set_table'](1, *handles, 0, 10, [{'column_id': 'roi_val', 'direction': 'desc'}], state[0] * 1e-9, 1)
+
+        def vol_history_cold(hist_handle=hist_handle, callbacks=callbacks, data_store=collector.data_store, ticker=ticker):
+            data_store.backend.delete(f"{hist_handle['session']}/vol_matrix")
+            callbacks['on_data_set_vol_history'](hist_handle, 'vol_tab_1M', ticker)
+
+        cases += [
+            ('callbacks', 'toggle_collapse', params, lambda callbacks=callbacks: callbacks['toggle_collapse'](1, False)),
+            ('callbacks', 'update_search', params, lambda callbacks=callbacks, ticker=ticker: callbacks['update_search'](ticker, True, None)),
+            ('callbacks', 'get_ticker_data', params, fetch),
+            ('callbacks', 'get_ticker_data_filter_only', params, filter_only),
+            ('callbacks', 'get_ticker_data_prefetched', params, lambda callbacks=prefetch_collector.callbacks, ticker=ticker: callbacks['get_ticker_data'](1, ticker, 30, 'log_returns', 365, 0.7, 0, 1, None)),
+            ('callbacks', 'on_data_set_price_history_1Y', params, lambda callbacks=callbacks, ticker=ticker, hist_handle=hist_handle: callbacks['on_data_set_price_history'](hist_handle, 'price_tab_4', ticker)),
+            ('callbacks', 'on_data_set_price_history_5Y', params, lambda callbacks=callbacks, ticker=ticker, hist_handle=hist_handle: callbacks['on_data_set_price_history'](hist_handle, 'price_tab_5', ticker)),
+            ('callbacks', 'on_data_set_prob_cone', params, lambda callbacks=callbacks, ticker=ticker, handles=(chain_handle, hist_handle, quotes_handle): callbacks['on_data_set_prob_cone'](*handles, 'prob_cone_tab', ticker, 365, 0.7)),
+            ('callbacks', 'on_data_set_prob_cone_gbm', params, lambda callbacks=callbacks, ticker=ticker, handles=(chain_handle, hist_handle, quotes_handle): callbacks['on_data_set_prob_cone'](*handles, 'gbm_sim_tab', ticker, 365, 0.7)),
+            ('callbacks', 'on_data_set_vol_history_cold', params, vol_history_cold),
+            ('callbacks', 'on_data_set_vol_history_warm', params, lambda callbacks=callbacks, ticker=ticker, hist_handle=hist_handle: callbacks['on_data_set_vol_history'](hist_handle, 'vol_tab_3M', ticker)),
+            ('callbacks', 'on_data_init_open_interest_vol', params, lambda callbacks=callbacks, ticker=ticker, chain_handle=chain_handle: callbacks['on_data_init_open_interest_vol'](chain_handle, ticker, 365, None)),
+            ('callbacks', 'on_data_set_ticker_table', params, lambda callbacks=callbacks, ticker_rows=ticker_rows: callbacks['on_data_set_ticker_table'](ticker_rows, 0, 10, [])),
+            ('callbacks', 'on_data_set_table', params, lambda callbacks=callbacks, handles=(chain_handle, hist_handle): callbacks['on_data_set_table'](1, *handles, 0, 10, [{'column_id': 'roi_val', 'direction': 'desc'}], 0, 1)),
+            ('callbacks', 'on_data_set_table_new_filter', params, table_new_filter),
+        ]
+
+    return cases
+
+# Registers the callbacks on collector with an in-memory data store and a price store in a temporary directory
+def _register(collector:_CallbackCollector, prefetcher=None):
+
+    from dashboard_app.callbacks import register_callbacks
+
+    collector.data_store = DataStore()
+    register_callbacks(collector, 'benchmark', collector.data_store, PriceStore(tempfile.mkdtemp(prefix='tos_bench_prices_')), prefetcher)
+
+CASE_BUILDERS = {'gbm': gbm_cases, 'volatility': volatility_cases, 'prob': prob_cases, 'ingestion': ingestion_cases, 'stream': stream_cases, 'callbacks': callback_cases}
+
+# Runs the cases of groups, returns rows of {'case', 'seconds'}
+def run(groups:list, strikes:list, candles:list, paths:list, repeat:int=5) -> list:
+
+    results = []
+
+    for group in groups:
+        for case_group, name, params, func in CASE_BUILDERS[group](strikes, candles, paths):
+            results.append({'case': _case_id(case_group, name, params), 'seconds': best_time(func, repeat)})
+
+    return results
+
+def save_baseline(path:str, results:list):
+
+    baseline = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__, 'machine': platform.machine(), 'platform': platform.platform()},
+        'results': {row['case']: row['seconds'] for row in results},
+    }
+
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+# Adds the baseline time and ratio to each result row, returns the rows slower than the baseline by more than threshold (0.25 = 25%)
+def compare(results:list, baseline_path:str, threshold:float=0.25) -> list:
+
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+
+    regressions = []
+
+    for row in results:
+        baseline_seconds = baseline.get(row['case'])
+        row['baseline'] = '' if baseline_seconds is None else baseline_seconds
+        row['ratio'] = '' if baseline_seconds is None else row['seconds'] / baseline_seconds
+        row['status'] = 'new'
+
+        if baseline_seconds is not None:
+            if row['ratio'] > 1 + threshold:
+                row['status'] = 'SLOWER'
+                regressions.append(row)
+            elif row['ratio'] < 1 / (1 + threshold):
+                row['status'] = 'faster'
+            else:
+                row['status'] = 'ok'
+
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark suite of lib/ and the Dash callbacks')
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=list(GROUPS), help='Benchmark groups to run')
+    parser.add_argument('--strikes', type=int, nargs='+', default=None, help='Strikes per expiry of the synthetic option chains')
+    parser.add_argument('--candles', type=int, nargs='+', default=None, help='Daily price history lengths')
+    parser.add_argument('--paths', type=int, nargs='+', default=None, help='Number of GBM paths')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs per case (best time is reported)')
+    parser.add_argument('--quick', action='store_true', help='Smallest input of each parameter only')
+    parser.add_argument('--save', help='Save the results as a baseline JSON file')
+    parser.add_argument('--compare', help='Compare the results against a baseline JSON file (exit status 1 on regressions)')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    defaults = QUICK if args.quick else DEFAULTS
+    results = run(args.groups, args.strikes or defaults['strikes'], args.candles or defaults['candles'], args.paths or defaults['paths'], args.repeat)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    print_table(results)
+
+    if args.save:
+        save_baseline(args.save, results)
+        print(f'Baseline saved to {args.save}')
+
+    if regressions:
+        print(f'{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}')
+        sys.exit(1)
@@ -0,0 +1,25 @@
+import time
+
+# Returns the best wall time (in seconds) of repeat calls to func, the least noisy estimate of its cost
+def best_time(func, repeat:int=5) -> float:
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return min(timings)
+
+# Prints rows (list of dicts) as an aligned text table
+def print_table(rows:list):
+
+    if not rows:
+        return
+
+    columns = list(rows[0].keys())
+    cells = [[column for column in columns]] + [[f'{row[column]:.4f}' if isinstance(row[column], float) else str(row[column]) for column in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+
+    for line in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(line, widths)))
@@ -6,6 +6,15 @@ import dash_bootstrap_components as dbc
 # Source guide: Callbacks layout separation (https://community.plotly.com/t/dash-callback-in-a-separate-file/14122/16)
 from dashboard_app.layout import app_layout
 from dashboard_app.callbacks import register_callbacks
+from lib.data_store import create_data_store
+from lib.price_store import PriceStore
+from lib.tos_replay import configure_api_mode
+from lib.metrics import instrument_app
+from lib.tos_client import set_rate_limit
+from lib.screener import parse_tickers
+from lib.prefetch import PrefetchScheduler, PREFETCH_BUDGET
+from lib.quote_stream import create_quote_stream
+from lib.lazy_import import preload, preload_in_background
 
 # app = dash.Dash(__name__)
 app = dash.Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -18,13 +27,74 @@ args = parser.parse_args()
 # API credentials 
 API_KEY = os.environ.get('TOS_API_KEY')
 
+# API mode: 'live' (default), 'record' (live, responses saved to TOS_RECORDINGS_DIR), 'replay' (recorded responses only) or 'synthetic' (generated data)
+API_MODE = os.environ.get('TOS_API_MODE', 'live')
+configure_api_mode(API_MODE, os.environ.get('TOS_RECORDINGS_DIR'),
+                    latency=float(os.environ.get('TOS_REPLAY_LATENCY', 0)), jitter=float(os.environ.get('TOS_REPLAY_JITTER', 0)),
+                    error_rate=float(os.environ.get('TOS_REPLAY_ERROR_RATE', 0)), seed=int(os.environ.get('TOS_REPLAY_SEED', 0)))
+
+# API requests per minute shared by all callbacks and the screener (0 disables the limit)
+set_rate_limit(int(os.environ.get('TOS_RATE_LIMIT', 120)), 60.0)
+
+# Offline modes do not need a real API key
+if API_KEY is None and API_MODE in ('replay', 'synthetic'):
+    API_KEY = 'offline'
+
+# Server-side data store: 'memory' (single worker process) or 'disk' (shared by multiple worker processes)
+DATA_STORE_BACKEND = os.environ.get('TOS_DATA_STORE', 'memory')
+# Directory of the 'disk' backend (Default: ~/.tos_dashboard/store), must only be writable by the user running the dashboard
+DATA_STORE_DIR = os.environ.get('TOS_DATA_STORE_DIR')
+
+# Local daily price history store (Default: ~/.tos_dashboard/price_history)
+PRICE_STORE_DIR = os.environ.get('TOS_PRICE_STORE_DIR')
+
+# Watchlist tickers (separated by commas or spaces) refreshed in the background, their Submits read the prefetched data
+WATCHLIST = parse_tickers(os.environ.get('TOS_WATCHLIST', ''))
+
+# API requests per minute the watchlist refreshes may use on average
+WATCHLIST_BUDGET = float(os.environ.get('TOS_PREFETCH_BUDGET', PREFETCH_BUDGET))
+
+# Streaming quotes of the submitted option chain: 'off' (default), 'simulated' (local random walk) or 'polling' (TOS API polled every few seconds)
+STREAM_SOURCE = os.environ.get('TOS_STREAM', 'off')
+
+# Heavy dependencies of the callbacks (lib.lazy_import.LAZY_MODULES): 'background' (default, loaded in a thread once the app is set up),
+# 'eager' (loaded at import, e.g. before gunicorn --preload forks the workers) or 'lazy' (loaded by the first callback using them)
+PRELOAD = os.environ.get('TOS_PRELOAD', 'background')
+if PRELOAD not in ('background', 'eager', 'lazy'):
+    raise ValueError(f"Unknown TOS_PRELOAD '{PRELOAD}', expected 'background', 'eager' or 'lazy'.")
+
 # ------------------------------------------------------------------------------
 # App layout
 app.layout = app_layout
 
+# ------------------------------------------------------------------------------
+# Instrumentation: callback and API timings served at /metrics, cProfile dumps of callbacks slower than TOS_PROFILE_THRESHOLD seconds in TOS_PROFILE_DIR
+if os.environ.get('TOS_METRICS', '1') == '1':
+    callback_app = instrument_app(app, os.environ.get('TOS_PROFILE_DIR'), float(os.environ.get('TOS_PROFILE_THRESHOLD', 1.0)))
+else:
+    callback_app = app
+
 # ------------------------------------------------------------------------------
 # Connect the Plotly graphs with Dash Components
-register_callbacks(app, API_KEY)
+price_store = PriceStore(PRICE_STORE_DIR)
+
+# The debug server's reloader imports this module in a watcher process that serves nothing, only the serving process runs background threads
+serving = __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+
+prefetcher = None
+if WATCHLIST and serving:
+    prefetcher = PrefetchScheduler(WATCHLIST, API_KEY, price_store, budget=WATCHLIST_BUDGET).start()
+
+quote_stream = create_quote_stream(STREAM_SOURCE, API_KEY, seed=int(os.environ.get('TOS_REPLAY_SEED', 0)))
+if quote_stream is not None and serving:
+    quote_stream.start()
+
+register_callbacks(callback_app, API_KEY, create_data_store(DATA_STORE_BACKEND, DATA_STORE_DIR), price_store, prefetcher, quote_stream)
+
+if PRELOAD == 'eager':
+    preload()
+elif PRELOAD == 'background' and serving:
+    preload_in_background()
 
 if __name__ == '__main__':
     if args.docker:
@@ -1,19 +1,51 @@
+import time
 import collections
+import numpy as np
 import pandas as pd
 import statistics as stat
 from datetime import datetime, timedelta, date
 
-import plotly.graph_objects as go
-
-from dash.dependencies import Input, Output, State
+import dash
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from dash.exceptions import PreventUpdate
 from dashboard_app.layout import base_df_columns, ticker_df_columns, option_chain_df_columns
-from lib.tos_api_calls import tos_search, tos_get_quotes, tos_get_option_chain, tos_get_price_hist
-from lib.gbm import gbm_sim
-from lib.stats import get_hist_volatility, prob_cone, get_prob
-
-
-def register_callbacks(app, API_KEY):
+from lib.tos_api_calls import tos_search, tos_get_price_hist, tos_get_ticker_data
+from lib.gbm import gbm_sim, select_engine
+from lib.stats import VOL_ESTIMATORS, get_hist_volatility_matrix, prob_cone
+from lib.option_chain import filter_option_chain
+from lib.table_query import TableQuery, QueryCache
+from lib.data_store import DataStore
+from lib.price_store import PriceStore
+from lib.metrics import stage
+from lib.screener import parse_tickers, start_screen, screen_progress
+from lib.prefetch import TickerSnapshot, describe_freshness
+from lib.pipeline import SUBMIT_STAGES, SessionCache, changed_stages
+from lib.quote_stream import StreamingChain
+from lib.lazy_import import lazy_module
+
+# Loaded by the first figure callback
+go = lazy_module('plotly.graph_objects')
+
+# Columns of the option chain tables, in the order of the table
+OPTION_TABLE_COLUMNS = [column['id'] for column in option_chain_df_columns]
+
+# data_store: server-side store of the fetched datasets (lib.data_store.DataStore), the browser stores only hold handles to them
+# price_store: local store of daily price history (lib.price_store.PriceStore), warm tickers only fetch their newest candles
+# prefetcher: optional lib.prefetch.PrefetchScheduler, Submits of its watchlist tickers read its snapshots instead of calling the API
+# quote_stream: optional lib.quote_stream.QuoteStream, the option chain of each Submit is then streamed and its changes patched in the browser
+def register_callbacks(app, API_KEY, data_store=None, price_store=None, prefetcher=None, quote_stream=None):
+
+    if data_store is None:
+        data_store = DataStore()
+
+    if price_store is None:
+        price_store = PriceStore()
+
+    # Inputs and raw data of the last Submit of each browser session
+    session_cache = SessionCache()
+
+    # Filtered option chain tables per dataset version and filter set
+    table_queries = QueryCache()
 
     # Toggle collapsable content for ticker_data HTML element
     @app.callback(
@@ -52,107 +84,94 @@ def register_callbacks(app, API_KEY):
             return []
         
 
-    # Temporarily stores JSON data in the browser (generally safe to store up to 2MB of data)
-    @app.callback(Output('storage-historical', 'data'),
+    # Stores the fetched data server-side, the browser stores only hold a handle per dataset of the browser session
+    # Price history, quotes and option chain are requested concurrently, so a Submit waits for the slowest request only
+    # The fetched option chain also feeds the skew rows of the ticker table, so it is only requested once per Submit
+    # Watchlist tickers are read from the latest prefetched snapshot, with their volatility/option chain/skew computed once per refresh
+    # Only the stages whose inputs changed since the session's last Submit rerun (see SUBMIT_STAGES in lib/pipeline.py): a Submit with
+    # the same ticker reuses its raw data, and datasets of unchanged stages are not stored again (their charts are not redrawn)
+    # A Submit without any changed input fetches the data again
+    @app.callback([Output('storage-historical', 'data'), Output('storage-quotes', 'data'), Output('storage-option-chain-all', 'data'), Output('storage-ticker-data', 'data'),
+                   Output('data-freshness', 'children')],
                 [Input('submit-button-state', 'n_clicks')],
-                [State('memory-ticker', 'value'), State('memory-vol-period','value'), State('memory-volest-type','value')])
-    def get_historical_prices(n_clicks, ticker, volatility_period, vol_est_type):
+                [State('memory-ticker', 'value'), State('memory-vol-period','value'), State('memory-volest-type','value'), State('memory-expdays','value'), State('memory-confidence','value'),
+                 State('memory-roi', 'value'), State('memory-delta', 'value'), State('storage-historical', 'data')])
+    def get_ticker_data(n_clicks, ticker, volatility_period, vol_est_type, expday_range, confidence_lvl, roi_selection, delta_range, previous_handle):
 
         if ticker is None:
             raise PreventUpdate 
 
-        hist_data = tos_get_price_hist(ticker, apiKey=API_KEY)
+        # Datasets of a Submit replace the previous ones of the same browser session
+        session_id = data_store.session_id(previous_handle)
 
-        json_data = {}
-        json_data[ticker] = hist_data
+        inputs = {'ticker': ticker, 'volatility_period': volatility_period, 'vol_est_type': vol_est_type, 'expday_range': expday_range,
+                    'confidence_lvl': confidence_lvl, 'min_roi': roi_selection, 'max_delta': delta_range}
+        previous_inputs, previous_snapshot = session_cache.get(session_id) if previous_handle is not None else (None, None)
+        stages = changed_stages(previous_inputs, inputs) or set(SUBMIT_STAGES)
 
-        # Store estimated volatility value for downstream callbacks
-        price_df = pd.DataFrame(hist_data['candles'])
-        json_data['est_vol'] = get_hist_volatility(price_df, volatility_period, estimator=vol_est_type).iloc[-1]
+        # A session switching tickers stops streaming the previous one, even if this Submit fails
+        if quote_stream is not None and previous_inputs is not None and previous_inputs['ticker'] != ticker:
+            quote_stream.unwatch(session_id)
 
-        return json_data
+        snapshot, source = None if prefetcher is None else prefetcher.snapshot(ticker), 'Prefetched'
 
-    # Temporarily stores JSON data in the browser (generally safe to store up to 2MB of data)
-    @app.callback(Output('storage-quotes', 'data'),
-                [Input('submit-button-state', 'n_clicks')],
-                [State('memory-ticker', 'value')])
-    def get_price_quotes(n_clicks, ticker):
+        if snapshot is None and 'raw' not in stages:
+            snapshot, source = previous_snapshot, 'Reused'
+        elif snapshot is None:
+            with stage('fetch'):
+                price_df, quotes_data, option_chain_response = tos_get_ticker_data(ticker, apiKey=API_KEY, price_store=price_store)
 
-        if ticker is None:
-            raise PreventUpdate          
+            if price_df.empty:
+                raise PreventUpdate
 
-        return tos_get_quotes(ticker, apiKey=API_KEY)
+            fetched_at = time.time()
+            snapshot, source = TickerSnapshot(ticker, {'pricehistory': price_df, 'quotes': quotes_data[ticker], 'chains': option_chain_response},
+                                              dict.fromkeys(['pricehistory', 'quotes', 'chains'], fetched_at)), None
 
-    # Temporarily stores JSON data in the browser (generally safe to store up to 2MB of data)
-    @app.callback(Output('storage-option-chain-all', 'data'),
-                [Input('submit-button-state', 'n_clicks'), Input('storage-historical', 'data'), Input('storage-quotes', 'data')],
-                [State('memory-ticker', 'value'), State('memory-expdays','value'), State('memory-confidence','value')])
-    def get_option_chain_all(n_clicks, hist_data, quotes_data, ticker, expday_range, confidence_lvl):
-
-        if ticker is None:
-            raise PreventUpdate 
-
-        json_data = tos_get_option_chain(ticker, contractType='ALL', rangeType='ALL', apiKey=API_KEY)
+        # Newer raw data (a new prefetch refresh or a fetch) reruns every stage
+        if snapshot is not previous_snapshot:
+            stages = set(SUBMIT_STAGES)
 
-        insert = []
-        current_date = datetime.now()
-        price_df = pd.DataFrame(hist_data[ticker]['candles'])
+        session_cache.put(session_id, inputs, snapshot)
 
-        current_date = datetime.now()
-        hist_volatility = hist_data['est_vol']
-        stock_price = quotes_data[ticker]['lastPrice']
+        # Store estimated volatility value for downstream callbacks
+        with stage('volatility'):
+            hist_volatility = snapshot.volatility(volatility_period, vol_est_type)
 
         # Process API response data from https://developer.tdameritrade.com/option-chains/apis/get/marketdata/chains into Dataframe
-        for option_chain_type in ['call','put']:
-            for exp_date in json_data[f'{option_chain_type}ExpDateMap'].values():
-                for strike in exp_date.values():
-
-                    expiry_date = datetime.fromtimestamp(strike[0]["expirationDate"]/1000.0)
-                    option_type = strike[0]['putCall']
-                    strike_price = strike[0]['strikePrice']
-                    bid_size = strike[0]['bidSize']  
-                    ask_size = strike[0]['askSize']  
-                    delta_val = strike[0]['delta']
-                    total_volume = strike[0]['totalVolume']  
-                    open_interest= strike[0]['openInterest']  
-
-                    # strike[0]['daysToExpiration'] can return negative numbers to mess up prob_cone calculations
-                    # day_diff = strike[0]['daysToExpiration']                     
-                    day_diff = (expiry_date - current_date).days
-                    if day_diff < 0:
-                        continue
-                    elif day_diff > expday_range:
-                        break
-
-                    option_premium = round(strike[0]['bid'] * strike[0]['multiplier'],2)
-                    roi_val = round(option_premium/(strike_price*100)*100,2)
-
-                    # Option leverage: https://www.reddit.com/r/thetagang/comments/pq1v2v/using_delta_to_calculate_an_options_leverage/
-                    if delta_val == 'NaN' or option_premium == 0:
-                        option_leverage = 0.0
-                    else:
-                        option_leverage = round((abs(float(delta_val))*stock_price)/option_premium,3)
-
-                    if day_diff > 0:
-                        prob_val = get_prob(stock_price, strike_price, hist_volatility, day_diff)
-                    else:
-                        prob_val = 0.0
-
-                    lower_bound, upper_bound = prob_cone(stock_price, hist_volatility, day_diff, confidence_lvl)
-
-                    option_chain_row = [ticker, expiry_date, option_type, strike_price, day_diff, delta_val, prob_val, open_interest, total_volume, option_premium, option_leverage, bid_size, ask_size, roi_val, lower_bound, upper_bound]
-                    insert.append(option_chain_row)
-
-        # Create Empty Dataframe to be populated
-        df = pd.DataFrame(insert, columns=[column['name'] for column in base_df_columns])   
-
-        return df.to_json(orient='split')
+        with stage('chain_processing'):
+            if 'bounds' in stages:
+                # Columns are renamed on a shallow copy, the snapshot's Dataframe is shared
+                df = snapshot.option_chain(volatility_period, vol_est_type, expday_range, confidence_lvl).copy(deep=False)
+                df.columns = [column['name'] for column in base_df_columns]
+
+            if 'raw' in stages:
+                skew_row = snapshot.skew()
+                ticker_rows = [] if skew_row is None else [skew_row]
+
+        # The stream keeps its own processed copy of the chain, updated in place by ticks
+        if quote_stream is not None and 'bounds' in stages:
+            with stage('stream'):
+                quote_stream.watch(session_id, StreamingChain(snapshot.option_chain_response, ticker, snapshot.quote['lastPrice'], hist_volatility, expday_range, confidence_lvl))
+
+        with stage('store'):
+            hist_handle = quotes_handle = optionchain_handle = dash.no_update
+
+            if 'volatility' in stages:
+                hist_handle = data_store.put(session_id, 'historical', {ticker: snapshot.price_df, 'est_vol': hist_volatility})
+            if 'raw' in stages:
+                quotes_handle = data_store.put(session_id, 'quotes', {ticker: snapshot.quote})
+            if 'bounds' in stages:
+                optionchain_handle = data_store.put(session_id, 'option_chain', df)
+
+            return (hist_handle, quotes_handle, optionchain_handle, ticker_rows if 'raw' in stages else dash.no_update,
+                    describe_freshness(None if source is None else snapshot, source))
 
     # Update Price History Graph based on stored JSON value from API Response call 
     @app.callback(Output('price_chart', 'figure'),
                 [Input('storage-historical', 'data'), Input('tabs_price_chart', 'value')],
                 [State('memory-ticker', 'value')])
-    def on_data_set_price_history(hist_data, tab, ticker):
+    def on_data_set_price_history(hist_handle, tab, ticker):
 
         # Create a Python dict in which a new item will be created upon search (if it doesn't exist before)
         # Source: https://stackoverflow.com/questions/5900578/how-does-collections-defaultdict-work
@@ -163,30 +182,33 @@ def register_callbacks(app, API_KEY):
         if ticker is None:
             raise PreventUpdate 
 
+        # Daily candles are read from the local price store, intraday candles from the API
         if tab == 'price_tab_1': # 1 Day
-            hist_price = tos_get_price_hist(ticker, periodType='day', period=1, frequencyType='minute', frequency=1, apiKey=API_KEY)  
+            hist_price = pd.DataFrame(tos_get_price_hist(ticker, periodType='day', period=1, frequencyType='minute', frequency=1, apiKey=API_KEY).get('candles', []))
         elif tab == 'price_tab_2': # 5 Days
-            hist_price = tos_get_price_hist(ticker, periodType='day', period=5, frequencyType='minute', frequency=5, apiKey=API_KEY)
+            hist_price = pd.DataFrame(tos_get_price_hist(ticker, periodType='day', period=5, frequencyType='minute', frequency=5, apiKey=API_KEY).get('candles', []))
         elif tab == 'price_tab_3': # 1 Month
-            hist_price = tos_get_price_hist(ticker, periodType='month', period=1, frequencyType='daily', frequency=1, apiKey=API_KEY)
+            hist_price = price_store.load(ticker, periodType='month', period=1, frequencyType='daily', frequency=1, apiKey=API_KEY)
         elif tab == 'price_tab_4': # 1 Year
-            hist_price = hist_data[ticker]
+            hist_data = data_store.get(hist_handle)
 
-            if hist_price is None:
-                raise PreventUpdate   
+            if hist_data is None:
+                raise PreventUpdate
+            hist_price = hist_data[ticker]
         elif tab == 'price_tab_5': # 5 Years
-            hist_price = tos_get_price_hist(ticker, periodType='year', period=5, frequencyType='daily', frequency=1, apiKey=API_KEY)  
+            hist_price = price_store.load(ticker, periodType='year', period=5, frequencyType='daily', frequency=1, apiKey=API_KEY)
+
+        if hist_price is None or len(hist_price) == 0:
+            raise PreventUpdate
 
-        for candle in hist_price['candles']:
+        a = aggregation[str(ticker)]
 
-            a = aggregation[str(ticker)]
-            
-            a['name'] = str(ticker)
-            a['mode'] = 'lines'
+        a['name'] = str(ticker)
+        a['mode'] = 'lines'
 
-            # Price on y-axis, Time on x-axis
-            a['y'].append(candle['close'])
-            a['x'].append(datetime.fromtimestamp(candle['datetime']/1000.0)) 
+        # Price on y-axis, Time on x-axis
+        a['y'] = hist_price['close'].tolist()
+        a['x'] = [datetime.fromtimestamp(timestamp/1000.0) for timestamp in hist_price['datetime'].tolist()]
         
         return {
             'layout':{'title': {'text':'Price History'}},
@@ -197,35 +219,39 @@ def register_callbacks(app, API_KEY):
     @app.callback(Output('prob_cone_chart', 'figure'),
                 [Input('storage-option-chain-all', 'data'), Input('storage-historical', 'data'), Input('storage-quotes', 'data'), Input('tabs_prob_chart', 'value')],
                 [State('memory-ticker', 'value'), State('memory-expdays','value'), State('memory-confidence','value')])
-    def on_data_set_prob_cone(optionchain_data, hist_data, quotes_data, tab, ticker, expday_range, confidence_lvl):
+    def on_data_set_prob_cone(optionchain_handle, hist_handle, quotes_handle, tab, ticker, expday_range, confidence_lvl):
         
         # Define empty list to be accumulate into Pandas dataframe (Source: https://stackoverflow.com/questions/10715965/add-one-row-to-pandas-dataframe)
         insert = []   
         data = []
 
-        if hist_data is None or quotes_data is None:
+        optionchain_df = data_store.get(optionchain_handle)
+        hist_data = data_store.get(hist_handle)
+        quotes_data = data_store.get(quotes_handle)
+
+        if optionchain_df is None or hist_data is None or quotes_data is None:
             raise PreventUpdate 
 
-        optionchain_df = pd.read_json(optionchain_data, orient='split')
         mkt_pressure_df = optionchain_df.filter(['Ticker', 'Exp. Date (Local)', 'Option Type', 'Exp. Days', 'Strike', 'Open Int.', 'Total Vol.'])
         mkt_pressure_df['Day'] = mkt_pressure_df['Exp. Days'].apply(lambda x: date.today() + timedelta(days=x))
         mkt_pressure_df['StrikeOpenInterest'] = mkt_pressure_df['Strike'] * mkt_pressure_df['Open Int.']
         mkt_pressure_df['StrikeTotalVolume'] = mkt_pressure_df['Strike'] * mkt_pressure_df['Total Vol.']
 
-        price_df = pd.DataFrame(hist_data[ticker]['candles'])
+        price_df = hist_data[ticker]
 
         hist_volatility = hist_data['est_vol']
         stock_price = quotes_data[ticker]['lastPrice']
 
         if tab == 'prob_cone_tab': # Historical Volatlity            
 
-            for i_day in range(expday_range + 1):
-
-                lower_bound, upper_bound = prob_cone(stock_price, hist_volatility, i_day, probability=confidence_lvl)
+            # Whole cone from a single call over all days up to expday_range
+            days_ahead = np.arange(int(expday_range) + 1)
+            lower_bounds, upper_bounds = prob_cone(stock_price, hist_volatility, days_ahead, probability=confidence_lvl)
 
+            for i_day, lower_bound, upper_bound in zip(days_ahead.tolist(), lower_bounds.tolist(), upper_bounds.tolist()):
                 insert.append([ticker, (date.today() + timedelta(days=i_day)), stock_price, lower_bound, upper_bound, i_day])
 
-            agg_mkt_pressure_df = mkt_pressure_df.groupby('Day').sum()
+            agg_mkt_pressure_df = mkt_pressure_df.groupby('Day')[['Open Int.', 'Total Vol.', 'StrikeOpenInterest', 'StrikeTotalVolume']].sum()
             agg_mkt_pressure_df = agg_mkt_pressure_df.reset_index()
             agg_mkt_pressure_df['MktPressOpenInterest'] = agg_mkt_pressure_df['StrikeOpenInterest']/agg_mkt_pressure_df['Open Int.']
             agg_mkt_pressure_df['MktPressTotalVolume'] = agg_mkt_pressure_df['StrikeTotalVolume']/agg_mkt_pressure_df['Total Vol.']
@@ -238,9 +264,15 @@ def register_callbacks(app, API_KEY):
             q = 0.007 # dividend rate
             sigma = hist_volatility # annualized volatility
             steps = 1 # no need to have more than 1 for non-path dependent security
-            N = 1000000 # larger the better
+            N = 2**14 # scrambled Sobol paths: lower standard error than 1,000,000 pseudo-random paths (python -m benchmarks.bench_gbm_convergence)
+            sampler = 'sobol'
+
+            # Terminal price probabilities are not path dependent, so this resolves to the closed-form lognormal engine
+            # (N and sampler only apply to the 'monte_carlo' engine)
+            engine = select_engine(path_dependent=False)
 
-            x_ls, y_ls = gbm_sim(price_df, stock_price, T, r, q, sigma, steps, N, bin_size=10)
+            with stage('gbm_sim'):
+                x_ls, y_ls = gbm_sim(price_df, stock_price, T, r, q, sigma, steps, N, bin_size=10, engine=engine, sampler=sampler)
 
             data.append(go.Scatter(x=x_ls, y=y_ls, name='Price Probability', mode='lines+markers', line_shape='spline'))    
 
@@ -306,11 +338,10 @@ def register_callbacks(app, API_KEY):
     @app.callback(Output('vol_chart', 'figure'),
                 [Input('storage-historical', 'data'), Input('tabs_vol_chart', 'value')],
                 [State('memory-ticker', 'value')])
-    def on_data_set_vol_history(hist_data, tab, ticker):
+    def on_data_set_vol_history(hist_handle, tab, ticker):
 
-        if hist_data is None:
+        if hist_handle is None:
                 raise PreventUpdate  
-        price_df = pd.DataFrame(hist_data[ticker]['candles'])
 
         vol_tab_dict = {
             'vol_tab_2w': 14,
@@ -321,19 +352,30 @@ def register_callbacks(app, API_KEY):
 
         volatility_period = vol_tab_dict[tab]        
         
-        vol_est_ls = ['log_returns', 'garman_klass', 'hodges_tompkins', 'parkinson', 'rogers_satchell', 'yang_zhang']
-        
-        hist_volatility_dict = {}
+        vol_est_ls = VOL_ESTIMATORS
 
-        for vol_est in vol_est_ls:
-            # Pandas Series
-            hist_volatility = get_hist_volatility(price_df, volatility_period, estimator=vol_est)
+        # Volatility of every estimator and tab window is computed once per price history, tab switches only read it back
+        vol_matrix_data = data_store.get_dataset(hist_handle['session'], 'vol_matrix')
 
-            # Note: Volality Estimators in ('garman_klass', 'parkinson', 'rogers_satchell') have one extra value in Pandas Series, have to remove first entry to plot
-            if vol_est in ('garman_klass', 'parkinson', 'rogers_satchell'):
-                hist_volatility_dict[vol_est] = hist_volatility.iloc[1:]
-            else:
-                hist_volatility_dict[vol_est] = hist_volatility
+        if vol_matrix_data is None or vol_matrix_data['hist_version'] != hist_handle['version']:
+            hist_data = data_store.get(hist_handle)
+            if hist_data is None:
+                raise PreventUpdate  
+            price_df = hist_data[ticker]
+
+            with stage('volatility_matrix'):
+                vol_matrix_data = {
+                    'hist_version': hist_handle['version'],
+                    'windows': list(vol_tab_dict.values()),
+                    'matrix': get_hist_volatility_matrix(price_df, list(vol_tab_dict.values()), vol_est_ls),
+                }
+            data_store.put(hist_handle['session'], 'vol_matrix', vol_matrix_data)
+
+        # Shape: (estimator, day) for the selected window
+        vol_matrix = vol_matrix_data['matrix'][:, vol_matrix_data['windows'].index(volatility_period)]
+
+        # All estimators are defined from the day after the first full window of log returns
+        hist_volatility_dict = {vol_est: vol_matrix[i, volatility_period:] for i, vol_est in enumerate(vol_est_ls)}
 
         hist_volatility_dict['Day'] = range(1, len(hist_volatility_dict['log_returns']) + 1 ,1)
         
@@ -367,12 +409,12 @@ def register_callbacks(app, API_KEY):
     @app.callback([Output('open_ir_vol', 'figure'),Output('memory_exp_day_graph', 'options')],
                 [Input('storage-option-chain-all', 'data')],
                 [State('memory-ticker', 'value'), State('memory-expdays','value'), State('memory_exp_day_graph','value')])
-    def on_data_init_open_interest_vol(optionchain_data, ticker, expday_range, expday_graph_selection):
+    def on_data_init_open_interest_vol(optionchain_handle, ticker, expday_range, expday_graph_selection):
         
-        if optionchain_data is None:
+        optionchain_df = data_store.get(optionchain_handle)
+        if optionchain_df is None:
             raise PreventUpdate
 
-        optionchain_df = pd.read_json(optionchain_data, orient='split')
         df = optionchain_df.filter(['Ticker', 'Exp. Date (Local)', 'Type', 'Exp. Days', 'Strike', 'Open Int.', 'Total Vol.'])
 
         # For filtering open i/r graph base on expday options
@@ -423,114 +465,17 @@ def register_callbacks(app, API_KEY):
 
         return fig, expday_options
 
-    # Update Ticker Table from API Response call
+    # Update Ticker Table from the skew rows computed with the option chain (page/sort changes do not call the API)
     @app.callback(Output('ticker-data-table', 'data'),
-                [Input('submit-button-state', 'n_clicks'), Input('storage-historical', 'data'), Input('storage-option-chain-all', 'data'), Input('ticker-data-table', "page_current"), Input('ticker-data-table', "page_size"), Input('ticker-data-table', "sort_by")],
-                [State('memory-ticker', 'value')])
-    def on_data_set_ticker_table(n_clicks, hist_data, optionchain_data, page_current, page_size, sort_by, ticker):
-        
-        # Define empty list to be accumulate into Pandas dataframe (Source: https://stackoverflow.com/questions/10715965/add-one-row-to-pandas-dataframe)
-        insert = []
+                [Input('storage-ticker-data', 'data'), Input('ticker-data-table', "page_current"), Input('ticker-data-table', "page_size"), Input('ticker-data-table', "sort_by")])
+    def on_data_set_ticker_table(ticker_rows, page_current, page_size, sort_by):
 
-        if ticker is None:
-            raise PreventUpdate 
-
-        option_chain_response = tos_get_option_chain(ticker, contractType='ALL', rangeType='ALL', apiKey=API_KEY)
-        
-        # Sanity check on API response data
-        if option_chain_response is None or list(option_chain_response.keys())[0] == "error":
+        # Sanity check on API response data (no skew could be computed from the option chain)
+        if not ticker_rows:
             raise PreventUpdate 
 
-        stock_price = option_chain_response['underlyingPrice']
-        stock_price_110percent = stock_price * 1.1
-        stock_price_90percent = stock_price * 0.9
-
-        # Process API response data from https://developer.tdameritrade.com/option-chains/apis/get/marketdata/chains into Dataframe
-        # Calculation for put call skew: https://app.fdscanner.com/aboutskew 
-        low_call_strike, high_call_strike, low_put_strike, high_put_strike = None, None, None, None
-
-        for option_chain_type in ['call','put']:
-            for exp_date in option_chain_response[f'{option_chain_type}ExpDateMap'].keys():
-                
-                # Note: example of exp_date is '2020-12-24:8' where 8 is the days to expiry
-                day_diff = int(exp_date.split(':')[1])
-                if day_diff < 28 or day_diff >= 35:
-                    continue
-
-                # Define boolean variables because option chain is read in acsending order based on strike price
-                high_call_strike_found = False
-                high_put_strike_found = False
-
-                for strike in option_chain_response[f'{option_chain_type}ExpDateMap'][exp_date].values():
-
-                    strike_price = strike[0]['strikePrice']
-
-                    if option_chain_type == 'call':
-                        if strike_price < stock_price_90percent:
-                                low_call_strike = strike_price
-                                low_call_strike_bid = strike[0]['bid']
-                                low_call_strike_ask = strike[0]['ask']
-                        elif strike_price > stock_price_110percent:
-                            if not high_call_strike_found:
-                                high_call_strike = strike_price
-                                high_call_strike_bid = strike[0]['bid']
-                                high_call_strike_ask = strike[0]['ask']
-                                high_call_strike_found = True
-                        
-                    elif option_chain_type == 'put':
-                        if strike_price < stock_price_90percent:
-                                low_put_strike = strike_price
-                                low_put_strike_bid = strike[0]['bid']
-                                low_put_strike_ask = strike[0]['ask']
-                        elif strike_price > stock_price_110percent:
-                            if not high_put_strike_found:
-                                high_put_strike = strike_price
-                                high_put_strike_bid = strike[0]['bid']
-                                high_put_strike_ask = strike[0]['ask']
-                                high_put_strike_found = True                        
-
-        # Ensure if there is an error, will not be displayed
-        strike_checklist = [low_call_strike, high_call_strike, low_put_strike, high_put_strike]
-        if (all(item is None for item in strike_checklist)):
-            raise PreventUpdate
-
-        # Ensuring options pass liquidity checks
-        prevent_zero_div = lambda x, y: 0 if (y == 0 or y == None) else x/y
-        high_call_strike_askbid = prevent_zero_div(high_call_strike_ask, high_call_strike_bid)
-        high_put_strike_askbid = prevent_zero_div(high_put_strike_ask, high_put_strike_bid)
-        low_call_strike_askbid = prevent_zero_div(low_call_strike_ask, low_call_strike_bid)
-        low_put_strike_askbid = prevent_zero_div(low_put_strike_ask, low_put_strike_bid)
-
-        askbid_checklist = [high_call_strike_askbid, high_put_strike_askbid, low_call_strike_askbid, low_put_strike_askbid]
-
-        liquidity_check = all(askbid > 1.25 for askbid in askbid_checklist)
-        if liquidity_check:
-            liquidity = 'FAILED'
-        else:
-            liquidity = 'PASSED'
-
-        # Computing option midpoints
-        high_call_strike_midpoint = (high_call_strike_bid + high_call_strike_ask)/2
-        high_put_strike_midpoint = (high_put_strike_bid + high_put_strike_ask)/2
-        low_call_strike_midpoint = (low_call_strike_bid + low_call_strike_ask)/2
-        low_put_strike_midpoint = (low_put_strike_bid + low_put_strike_ask)/2        
-
-        # Computing Interpolated Price
-        call_110percent_price = low_call_strike_midpoint - (low_call_strike_midpoint - high_call_strike_midpoint)/(high_call_strike-low_call_strike) * (stock_price_110percent-low_call_strike)
-        put_90percent_price = low_put_strike_midpoint + (high_put_strike_midpoint - low_put_strike_midpoint)/(high_put_strike - low_put_strike) * (stock_price_90percent - low_put_strike)
-
-        # Calculate Skew
-        if put_90percent_price > call_110percent_price:
-            skew_category = 'Put Skew'
-            skew = round(put_90percent_price/call_110percent_price,3)
-        else:
-            skew_category = 'Call Skew'
-            skew = round(call_110percent_price/put_90percent_price,3)
-
-        insert.append([ticker, skew_category, skew, liquidity])
-    
-        # Create Empty Dataframe to be populated
-        df = pd.DataFrame(insert, columns=[column['id'] for column in ticker_df_columns])
+        # Create Dataframe from the stored skew rows
+        df = pd.DataFrame(ticker_rows, columns=[column['id'] for column in ticker_df_columns])
 
         if len(sort_by):
             dff = df.sort_values(
@@ -550,41 +495,146 @@ def register_callbacks(app, API_KEY):
         ].to_dict('records')
 
     # Update Option Chain Table based on stored JSON value from API Response call 
-    @app.callback(Output('option-chain-table', 'data'),
+    # The page is written to the table by the stream.table_data clientside callback (assets/stream.js), which also patches streamed changes
+    @app.callback(Output('storage-option-table-page', 'data'),
                 [Input('submit-button-state', 'n_clicks'), Input('storage-option-chain-all', 'data'), Input('storage-historical', 'data'), Input('option-chain-table', "page_current"), Input('option-chain-table', "page_size"), Input('option-chain-table', "sort_by")],
                 [State('memory-roi', 'value'), State('memory-delta', 'value')])
-    def on_data_set_table(n_clicks, optionchain_data, hist_data, page_current, page_size, sort_by, roi_selection, delta_range):
-        
+    def on_data_set_table(n_clicks, optionchain_handle, hist_handle, page_current, page_size, sort_by, roi_selection, delta_range):
 
-        if hist_data is None or optionchain_data is None:
+        if hist_handle is None or optionchain_handle is None:
             raise PreventUpdate 
 
-        base_df = pd.read_json(optionchain_data, convert_dates=['Exp. Date (Local)'], orient='split')
-        df = base_df.loc[(base_df['ROI']>=roi_selection) & (base_df['Delta'].abs()<=delta_range)]
-        df = df.loc[((df['Type']=='CALL') & (df['Strike'] >= df['Upper CI'])) | ((df['Type']=='PUT') & (df['Strike'] <= df['Lower CI']))]
-        df = df.drop(columns=['Upper CI', 'Lower CI'])
-        
-        # Remove floating point errors
-        df['ROI'] = df['ROI'].map('{:,.3f}'.format)
-        df['Leverage'] = df['Leverage'].map('{:,.3f}'.format)
-        df['Delta'] = df['Delta'].map('{:,.3f}'.format)
+        # A streamed chain holds the latest quotes of the Submit's contracts
+        chain = None if quote_stream is None else quote_stream.chain(optionchain_handle['session'])
 
-        # Rename df column names to column ids
-        df.columns = [column['id'] for column in option_chain_df_columns]
-        
-        if len(sort_by):
-            dff = df.sort_values(
-                [col['column_id'] for col in sort_by],
-                ascending=[
-                    col['direction'] == 'asc'
-                    for col in sort_by
-                ],
-                inplace=False
-            )
+        if chain is not None:
+            key = (chain.id, chain.version, roi_selection, delta_range)
+            load = chain.frame
         else:
-            # No sort is applied
-            dff = df
+            key = (optionchain_handle['session'], optionchain_handle['dataset'], optionchain_handle['version'], roi_selection, delta_range)
 
-        return dff.iloc[
-            page_current*page_size:(page_current+ 1)*page_size
-        ].to_dict('records')
\ No newline at end of file
+            def load():
+                base_df = data_store.get(optionchain_handle)
+                # Rename df column names to column ids
+                return None if base_df is None else base_df.set_axis([column['id'] for column in base_df_columns], axis=1)
+
+        # The filtered table of a dataset version and filter set is built once, page and sort changes only read it
+        def build():
+            df = load()
+            return None if df is None else TableQuery(filter_option_chain(df, roi_selection, delta_range), OPTION_TABLE_COLUMNS)
+
+        query = table_queries.get(key, build)
+        if query is None:
+            raise PreventUpdate
+
+        return query.records(page_current, page_size, sort_by)
+
+    # Start a screen of the watchlist tickers in the background, with the filters of the option chain table
+    @app.callback(Output('storage-screener', 'data'),
+                [Input('screener-button', 'n_clicks')],
+                [State('screener-tickers', 'value'), State('memory-vol-period','value'), State('memory-volest-type','value'), State('memory-expdays','value'),
+                 State('memory-confidence','value'), State('memory-roi', 'value'), State('memory-delta', 'value'), State('storage-historical', 'data'), State('storage-screener', 'data')])
+    def on_start_screener(n_clicks, tickers_text, volatility_period, vol_est_type, expday_range, confidence_lvl, roi_selection, delta_range, hist_handle, screener_data):
+
+        tickers = parse_tickers(tickers_text)
+        if not n_clicks or not tickers:
+            raise PreventUpdate
+
+        # The screen belongs to the browser session of the fetched datasets
+        session_id = data_store.session_id(screener_data if hist_handle is None else hist_handle)
+
+        job = start_screen(data_store, session_id, tickers, API_KEY, price_store=price_store, volatility_period=volatility_period, vol_est_type=vol_est_type,
+                            expday_range=expday_range, confidence_lvl=confidence_lvl, min_roi=roi_selection, max_delta=delta_range)
+
+        return {'session': session_id, 'job': job}
+
+    # Poll the progress of the running screen, publishing the handle of its result once finished
+    # A new screen enables the polling interval, which is disabled again once the screen is finished
+    @app.callback([Output('screener-progress', 'value'), Output('screener-progress', 'children'), Output('screener-status', 'children'),
+                   Output('screener-interval', 'disabled'), Output('storage-screener-result', 'data')],
+                [Input('screener-interval', 'n_intervals'), Input('storage-screener', 'data')])
+    def on_screener_progress(n_intervals, screener_data):
+
+        if screener_data is None:
+            raise PreventUpdate
+
+        progress = screen_progress(data_store, screener_data['session'])
+        if progress is None or progress['job'] != screener_data['job']:
+            raise PreventUpdate
+
+        percent = 100 * progress['done'] / progress['total'] if progress['total'] else 100
+        status = f"Screened {progress['done']}/{progress['total']} tickers in {progress['seconds']:.1f}s"
+        if progress['errors']:
+            status += f" ({len(progress['errors'])} failed: {', '.join(sorted(progress['errors']))[:200]})"
+
+        if progress['finished']:
+            return percent, f'{percent:.0f}%', status, True, progress['result']
+
+        return percent, f'{percent:.0f}%', status, False, dash.no_update
+
+    # Update Screener Table from the merged contracts of the finished screen
+    @app.callback(Output('screener-table', 'data'),
+                [Input('storage-screener-result', 'data'), Input('screener-table', "page_current"), Input('screener-table', "page_size"), Input('screener-table', "sort_by")])
+    def on_data_set_screener_table(result_handle, page_current, page_size, sort_by):
+
+        if result_handle is None:
+            raise PreventUpdate
+
+        def build():
+            df = data_store.get(result_handle)
+            return None if df is None else TableQuery(df, OPTION_TABLE_COLUMNS)
+
+        query = table_queries.get((result_handle['session'], result_handle['dataset'], result_handle['version']), build)
+        if query is None:
+            raise PreventUpdate
+
+        return query.records(page_current, page_size, sort_by)
+
+    # Option chain table pages go through a store, so streamed changes can patch the shown page without a server round trip
+    app.clientside_callback(
+        ClientsideFunction(namespace='stream', function_name='table_data'),
+        Output('option-chain-table', 'data'),
+        [Input('storage-option-table-page', 'data'), Input('storage-stream-diff', 'data')],
+        [State('option-chain-table', 'data')]
+    )
+
+    if quote_stream is None:
+        return
+
+    # Poll the stream while a Submit's chain is streamed
+    @app.callback(Output('stream-interval', 'disabled'),
+                [Input('storage-option-chain-all', 'data')])
+    def on_stream_start(optionchain_handle):
+        return optionchain_handle is None
+
+    # Send the changes of the streamed chain since the last diff: rows of the shown table page and the probability cone
+    @app.callback(Output('storage-stream-diff', 'data'),
+                [Input('stream-interval', 'n_intervals')],
+                [State('storage-option-chain-all', 'data'), State('option-chain-table', 'derived_viewport_row_ids'), State('storage-stream-diff', 'data')])
+    def on_stream_diff(n_intervals, optionchain_handle, row_ids, previous_diff):
+
+        chain = None if optionchain_handle is None else quote_stream.chain(optionchain_handle['session'])
+        if chain is None:
+            raise PreventUpdate
+
+        version = previous_diff['version'] if previous_diff is not None and previous_diff['chain'] == chain.id else 0
+        diff = chain.diff(version, row_ids or [])
+        if diff['version'] == version:
+            raise PreventUpdate
+
+        rows = diff['rows'].drop(columns=['lower_bound', 'upper_bound'])
+
+        cone = None
+        if diff['cone'] is not None:
+            days, lower_bounds, upper_bounds = diff['cone']
+            cone = {'x': [(date.today() + timedelta(days=i_day)).isoformat() for i_day in days.tolist()], 'lower': lower_bounds.tolist(), 'upper': upper_bounds.tolist()}
+
+        return {'chain': chain.id, 'version': diff['version'], 'stock_price': diff['stock_price'], 'rows': rows.to_dict('index'), 'cone': cone}
+
+    # Move the probability cone with the streamed stock price: extendData with maxPoints = cone length replaces both bound traces
+    app.clientside_callback(
+        ClientsideFunction(namespace='stream', function_name='cone_extend'),
+        Output('prob_cone_chart', 'extendData'),
+        [Input('storage-stream-diff', 'data')],
+        [State('tabs_prob_chart', 'value')]
+    )
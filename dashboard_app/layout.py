@@ -10,6 +10,7 @@ PAGE_SIZE = 30
 
 # Dash table value formatting
 decimal2 = Format(precision=2, scheme=Scheme.decimal)
+decimal3 = Format(precision=3, scheme=Scheme.fixed).group(True)
 money = FormatTemplate.money(0)
 money_full=FormatTemplate.money(2)
 percentage = FormatTemplate.percentage(2)
@@ -29,15 +30,15 @@ option_chain_df_columns=[
     dict(id='option_type', name='Type'),
     dict(id='strike_price', name='Strike', type='numeric', format=money_full),
     dict(id='exp_days', name='Exp. Days'),
-    dict(id='delta', name='Delta', type='numeric', format=decimal2),
+    dict(id='delta', name='Delta', type='numeric', format=decimal3),
     dict(id='prob_val', name='Conf. Prob', type='numeric', format=percentage),
     dict(id='open_interest', name='Open Int.', type='numeric', format=Format().group(True)),
     dict(id='total_volume', name='Total Vol.', type='numeric', format=Format().group(True)),
     dict(id='premium', name='Premium', type='numeric', format=money),
-    dict(id='option_leverage', name='Leverage', format=decimal2),
+    dict(id='option_leverage', name='Leverage', type='numeric', format=decimal3),
     dict(id='bid_size', name='Bid Size', type='numeric', format=Format().group(True)),
     dict(id='ask_size', name='Ask Size', type='numeric', format=Format().group(True)),
-    dict(id='roi_val', name='ROI')
+    dict(id='roi_val', name='ROI', type='numeric', format=decimal3)
 ]
 
 # Define column names in Base Reference Dataframe
@@ -65,9 +66,14 @@ base_df_columns=[
 
 app_layout = html.Div([
 
+    # Handles to the datasets kept in the server-side data store (lib/data_store.py)
     dcc.Store(id='storage-historical'),
     dcc.Store(id='storage-quotes'),
     dcc.Store(id='storage-option-chain-all'),
+    dcc.Store(id='storage-ticker-data'),
+    dcc.Store(id='storage-option-table-page'),
+    dcc.Store(id='storage-stream-diff'),
+    dcc.Interval(id='stream-interval', interval=1000, disabled=True),
     dbc.Navbar(
         [
             html.A(
@@ -282,6 +288,9 @@ app_layout = html.Div([
                 'margin':'auto'
                 }
         ),
+
+        # Age of the datasets shown (prefetched for watchlist tickers, see lib/prefetch.py)
+        html.Div(id='data-freshness', style={'textAlign':'center', 'font-size':'small', 'margin-top':'5px'}),
     ],
     className="pretty_container",
     # style={'padding-left': '50px',
@@ -510,5 +519,56 @@ app_layout = html.Div([
             'padding': '10px 5px',
             'margin': 'auto'
             }
+    ),
+
+    html.Div([
+        html.H5("Option Screener"),
+        # Screens every watchlist ticker with the filters above, merging the contracts into one table ranked by ROI
+        dbc.Row([
+            dbc.Col(
+                dcc.Textarea(
+                    id='screener-tickers',
+                    placeholder="Enter watchlist tickers separated by commas or spaces (Eg: AAPL, MSFT, TSLA).",
+                    style={'width': '100%', 'height': '60px'}
+                )
+            ),
+            dbc.Col(dbc.Button("Run Screener", id='screener-button', color="info"), width="auto"),
+        ]),
+        dbc.Progress(id='screener-progress', value=0, striped=True, style={'margin': '10px 0px'}),
+        html.Div(id='screener-status'),
+        dcc.Interval(id='screener-interval', interval=1000, disabled=True),
+        dcc.Loading(
+                id="loading_screener-table",
+                type="default",
+                children=html.Div([
+                    dash_table.DataTable(
+                        id='screener-table',
+                        columns=option_chain_df_columns,
+                        page_current=0,
+                        page_size=PAGE_SIZE,
+                        page_action='custom',
+                        sort_action='custom',
+                        sort_mode='multi',
+                        sort_by=[],
+                        style_cell={'textAlign': 'left'},
+                        style_data_conditional=[
+                            {
+                                'if': {'row_index': 'odd'},
+                                'backgroundColor': 'rgb(248, 248, 248)'
+                            }
+                        ],
+                        style_header={
+                            'backgroundColor': 'rgb(230, 230, 230)',
+                            'fontWeight': 'bold'
+                        }
+                    )
+                ])
+            ),
+        ],
+        style={
+            'max-width': '1450px',
+            'padding': '10px 5px',
+            'margin': 'auto'
+            }
     )
 ])
\ No newline at end of file
@@ -0,0 +1,277 @@
+import os
+import time
+import uuid
+import pickle
+import json
+import struct
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from lib.frame_codec import encode_frame, decode_frame
+
+# Default memory caps of the data store backends
+MAX_MEMORY_BYTES = 512 * 1024 * 1024
+MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+MAX_DISK_AGE = 24 * 60 * 60 # seconds
+
+# Default directory of the disk backend, private to the user running the dashboard (datasets are unpickled when read)
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.tos_dashboard', 'store')
+
+# Serialized dataset layout: kind (1 byte) | version (32 bytes) | body
+# Dataframes use the binary columnar format of lib/frame_codec.py, as do the Dataframes of dicts holding some (e.g. the
+# 'historical' dataset {ticker: price history, 'est_vol': volatility}), so Dataframes are never pickled
+# Dicts of Dataframes: header length (uint32, little endian) | JSON header (other values, frame keys and lengths) | encoded frames
+# Other values are pickled
+FRAME_KIND = b'F'
+FRAME_DICT_KIND = b'D'
+PICKLE_KIND = b'P'
+VERSION_LENGTH = 32
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+# Encodes a dict with str keys whose values are Dataframes or JSON values (TypeError for other values)
+def encode_frame_dict(value:dict) -> bytes:
+
+    frames = [(key, encode_frame(item)) for key, item in value.items() if isinstance(item, pd.DataFrame)]
+    values = {key: item for key, item in value.items() if not isinstance(item, pd.DataFrame)}
+
+    if not all(isinstance(key, str) for key in value):
+        raise TypeError('Dicts of Dataframes need str keys.')
+    header = json.dumps({'values': values, 'frames': [[key, len(data)] for key, data in frames], 'order': list(value)}).encode()
+
+    return b''.join([_HEADER_LENGTH.pack(len(header)), header] + [data for _, data in frames])
+
+def decode_frame_dict(data) -> dict:
+
+    data = memoryview(data)
+    header_length, = _HEADER_LENGTH.unpack_from(data, 0)
+    header = json.loads(bytes(data[_HEADER_LENGTH.size:_HEADER_LENGTH.size + header_length]))
+
+    items = dict(header['values'])
+    offset = _HEADER_LENGTH.size + header_length
+    for key, length in header['frames']:
+        items[key] = decode_frame(data[offset:offset + length])
+        offset += length
+
+    return {key: items[key] for key in header['order']}
+
+def serialize(version:str, value) -> bytes:
+
+    # Object values JSON cannot hold are stored as strings (see lib/frame_codec.py)
+    if isinstance(value, pd.DataFrame):
+        return FRAME_KIND + version.encode() + encode_frame(value)
+    if isinstance(value, dict) and any(isinstance(item, pd.DataFrame) for item in value.values()):
+        return FRAME_DICT_KIND + version.encode() + encode_frame_dict(value)
+
+    return PICKLE_KIND + version.encode() + pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+# Returns (version, value), the value is only decoded if its version is the expected one
+def deserialize(serialized:bytes, expected_version:str=None) -> tuple:
+
+    serialized = memoryview(serialized)
+    version = bytes(serialized[1:1 + VERSION_LENGTH]).decode()
+
+    if expected_version is not None and version != expected_version:
+        return version, None
+
+    body = serialized[1 + VERSION_LENGTH:]
+    kind = bytes(serialized[:1])
+    if kind == FRAME_KIND:
+        return version, decode_frame(body)
+    elif kind == FRAME_DICT_KIND:
+        return version, decode_frame_dict(body)
+    else:
+        return version, pickle.loads(body)
+
+# In-process backend: serialized datasets in a dict with LRU eviction once max_bytes is exceeded
+# Only visible to the worker process that wrote them
+class MemoryBackend:
+
+    def __init__(self, max_bytes:int=MAX_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict() # key: serialized value, least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key:str):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key:str, value:bytes):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+
+            self._entries[key] = value
+            self._size += len(value)
+
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def delete(self, key:str):
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+# Creates directory (mode 0o700) if needed and checks that no other user can write to it
+# Every file of the disk backend is unpickled, so a directory another user can write to would let them run code in the dashboard
+def private_directory(directory:str) -> str:
+
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    info = os.stat(directory)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise ValueError(f"Data store directory '{directory}' is not owned by the current user.")
+    if info.st_mode & 0o022:
+        raise ValueError(f"Data store directory '{directory}' is writable by other users (mode {oct(info.st_mode & 0o777)}), expected 0o700.")
+
+    return directory
+
+# On-disk backend: one file per dataset in a shared directory, so every worker process of the server sees the same data
+# Files are written atomically, least recently used files are removed once max_bytes is exceeded and files older than max_age expire
+# directory must be trusted: only the user running the dashboard may write to it (see private_directory)
+class DiskBackend:
+
+    def __init__(self, directory:str=None, max_bytes:int=MAX_DISK_BYTES, max_age:float=MAX_DISK_AGE):
+        self.directory = private_directory(DEFAULT_DIRECTORY if directory is None else directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evictions = 0
+
+    def _path(self, key:str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.bin')
+
+    def get(self, key:str):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                return None
+
+            with open(path, 'rb') as f:
+                value = f.read()
+
+            # Touch the file so eviction removes the least recently used datasets first
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return None
+
+    def put(self, key:str, value:bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+
+        self._evict()
+
+    def delete(self, key:str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _files(self) -> list:
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.bin'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError: # Removed by another worker
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(files)
+
+    def _evict(self):
+        files = self._files()
+        total_size = sum(size for _, size, _ in files)
+        now = time.time()
+
+        for mtime, size, path in files:
+            if total_size <= self.max_bytes and now - mtime <= self.max_age:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def stats(self) -> dict:
+        files = self._files()
+        return {'backend': 'disk', 'entries': len(files), 'bytes': sum(size for _, size, _ in files), 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+# Server-side store of the datasets used by the Dash callbacks, keyed by browser session and dataset name
+# The browser only holds the small handle returned by put(): {'session': ..., 'dataset': ..., 'version': ...}
+class DataStore:
+
+    def __init__(self, backend=None):
+        self.backend = MemoryBackend() if backend is None else backend
+
+    @staticmethod
+    def new_session_id() -> str:
+        return uuid.uuid4().hex
+
+    # Returns the session id of a handle, or a new session id if there is no handle yet
+    def session_id(self, handle) -> str:
+        if handle is None or 'session' not in handle:
+            return self.new_session_id()
+        return handle['session']
+
+    # Stores value under (session, dataset), replacing the previous value of the dataset, and returns its handle
+    def put(self, session:str, dataset:str, value) -> dict:
+        version = uuid.uuid4().hex
+        self.backend.put(f'{session}/{dataset}', serialize(version, value))
+
+        return {'session': session, 'dataset': dataset, 'version': version}
+
+    # Returns the value of a handle, or None if it was evicted or replaced by a newer version
+    def get(self, handle):
+        if handle is None:
+            return None
+
+        serialized = self.backend.get(f"{handle['session']}/{handle['dataset']}")
+        if serialized is None:
+            return None
+
+        _, value = deserialize(serialized, handle['version'])
+
+        return value
+
+    # Returns the latest value stored under (session, dataset) whatever its version, or None
+    def get_dataset(self, session:str, dataset:str):
+        serialized = self.backend.get(f'{session}/{dataset}')
+        if serialized is None:
+            return None
+
+        _, value = deserialize(serialized)
+
+        return value
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+# Creates a data store with the 'memory' (single worker) or 'disk' (multi-worker) backend
+def create_data_store(backend:str='memory', directory:str=None, max_bytes:int=None) -> DataStore:
+
+    if backend == 'memory':
+        return DataStore(MemoryBackend(MAX_MEMORY_BYTES if max_bytes is None else max_bytes))
+    elif backend == 'disk':
+        return DataStore(DiskBackend(directory, MAX_DISK_BYTES if max_bytes is None else max_bytes))
+    else:
+        raise ValueError(f"Unknown data store backend '{backend}', expected 'memory' or 'disk'.")
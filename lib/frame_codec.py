@@ -0,0 +1,106 @@
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+# Binary columnar format for Dataframes passed between callbacks:
+#   magic (4 bytes) | header length (uint32, little endian) | JSON header (schema) | column buffers (8-byte aligned)
+# Numeric/bool/datetime columns are stored as raw little endian buffers and decoded with np.frombuffer (no parsing, dtypes kept)
+# Object (string) columns are stored as int32 codes into a list of categories kept in the header
+# Categories JSON cannot hold (e.g. dates, Decimals) are stored as their str(), so decoding never runs anything but json.loads
+MAGIC = b'TOSF'
+ALIGNMENT = 8
+
+_HEADER_LENGTH = struct.Struct('<I')
+
+def _aligned(offset:int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+# Encodes a Dataframe into bytes (column names are converted to str, a non-default index is stored as a column)
+def encode_frame(df:pd.DataFrame) -> bytes:
+
+    index = None
+    if not (isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.index.step == 1):
+        index = df.index.name if df.index.name is not None else '__index__'
+        df = df.reset_index().rename(columns={'index': index})
+
+    schema = {'rows': len(df), 'index': index, 'columns': []}
+    buffers = []
+    offset = 0
+
+    for name, column in df.items():
+        values = column.to_numpy()
+        column_schema = {'name': str(name)}
+
+        if values.dtype == object:
+            codes, categories = pd.factorize(column)
+            values = codes.astype('<i4')
+            categories = categories.tolist()
+            try:
+                json.dumps(categories)
+            except (TypeError, ValueError):
+                categories = [str(category) for category in categories]
+            column_schema['categories'] = categories
+        elif values.dtype.kind == 'M':
+            column_schema['datetime'] = str(values.dtype)
+            values = values.view('<i8')
+        else:
+            values = values.astype(values.dtype.newbyteorder('<'), copy=False)
+
+        values = np.ascontiguousarray(values)
+        offset = _aligned(offset)
+
+        column_schema.update({'dtype': values.dtype.str, 'offset': offset, 'nbytes': values.nbytes})
+        schema['columns'].append(column_schema)
+        buffers.append((offset, values))
+        offset += values.nbytes
+
+    header = json.dumps(schema).encode()
+    data_start = _aligned(len(MAGIC) + _HEADER_LENGTH.size + len(header))
+
+    output = bytearray(data_start + offset)
+    output[:len(MAGIC)] = MAGIC
+    output[len(MAGIC):len(MAGIC) + _HEADER_LENGTH.size] = _HEADER_LENGTH.pack(len(header))
+    output[len(MAGIC) + _HEADER_LENGTH.size:len(MAGIC) + _HEADER_LENGTH.size + len(header)] = header
+
+    # Copy each column straight into the output buffer
+    for buffer_offset, values in buffers:
+        np.frombuffer(output, dtype=values.dtype, count=len(values), offset=data_start + buffer_offset)[:] = values
+
+    return bytes(output)
+
+# Decodes bytes from encode_frame() into a Dataframe
+# Numeric columns are read-only views on the input buffer until pandas consolidates them
+def decode_frame(data) -> pd.DataFrame:
+
+    data = memoryview(data)
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Data is not an encoded Dataframe.")
+
+    header_length, = _HEADER_LENGTH.unpack_from(data, len(MAGIC))
+    header_start = len(MAGIC) + _HEADER_LENGTH.size
+    schema = json.loads(bytes(data[header_start:header_start + header_length]))
+    data_start = _aligned(header_start + header_length)
+
+    columns = {}
+    for column_schema in schema['columns']:
+        dtype = np.dtype(column_schema['dtype'])
+        values = np.frombuffer(data, dtype=dtype, count=column_schema['nbytes'] // dtype.itemsize, offset=data_start + column_schema['offset'])
+
+        if 'categories' in column_schema:
+            categories = np.array(column_schema['categories'] + [None], dtype=object)
+            # Missing values have code -1, which picks the trailing None
+            values = categories[values]
+        elif 'datetime' in column_schema:
+            values = values.view(column_schema['datetime'])
+
+        columns[column_schema['name']] = values
+
+    df = pd.DataFrame(columns, columns=[column_schema['name'] for column_schema in schema['columns']])
+
+    if schema['index'] is not None:
+        df = df.set_index(schema['index'])
+        if schema['index'] == '__index__':
+            df.index.name = None
+
+    return df
@@ -1,9 +1,80 @@
 import numpy as np
 import statistics as stat
-import matplotlib.pyplot as plt
-from scipy.stats import norm
 
-def geo_brownian_paths(S, T, r, q, sigma, steps, N):
+from lib.lazy_import import lazy_module
+
+# Only used by show_plot debugging, matplotlib is not imported by the dashboard
+plt = lazy_module('matplotlib.pyplot')
+special = lazy_module('scipy.special')
+qmc = lazy_module('scipy.stats.qmc')
+
+# Samplers of the normal draws driving the simulated paths
+# 'pseudo': independent pseudo-random draws
+# 'antithetic': pseudo-random draws paired with their negation (path i + N//2 mirrors path i), which cancels the odd part of the error
+# 'sobol' / 'halton': scrambled quasi-random sequences with one dimension per time step, spread more evenly than random draws
+SAMPLERS = ('pseudo', 'antithetic', 'sobol', 'halton')
+
+# Independent batches the paths are split in to estimate the standard error of a Monte Carlo probability (see prob_curve_mc_stats)
+# Quasi-random points are not independent, so their error can only be measured across batches (each one a new scramble)
+MC_BATCHES = 16
+
+def normal_draws(steps, N, sampler='pseudo', rng=None):
+    '''
+    sampler: one of SAMPLERS
+    rng: np.random.Generator of the draws (scrambles of the quasi-random samplers)
+    None draws 'pseudo' normals from the global np.random state and seeds the other samplers from the OS
+
+    returns:
+    (steps, N) matrix of standard normal draws
+    '''
+    if sampler == 'pseudo':
+        return np.random.normal(size=(steps,N)) if rng is None else rng.standard_normal((steps,N))
+
+    rng = np.random.default_rng(rng)
+
+    if sampler == 'antithetic':
+        half = rng.standard_normal((steps,(N + 1)//2))
+        return np.concatenate([half, -half], axis=1)[:,:N]
+    elif sampler == 'sobol':
+        # Sobol points are balanced in blocks of a power of 2, the first N points of the enclosing block are used
+        points = qmc.Sobol(d=steps, scramble=True, seed=rng).random_base2(int(np.ceil(np.log2(max(N, 1)))))[:N]
+    elif sampler == 'halton':
+        points = qmc.Halton(d=steps, scramble=True, seed=rng).random(N)
+    else:
+        raise ValueError(f"Unknown sampler '{sampler}', expected one of {SAMPLERS}.")
+
+    # Inverse normal cdf of each coordinate, kept off 0 and 1 so no draw is infinite
+    return special.ndtri(np.clip(points.T, 1e-12, 1 - 1e-12))
+
+def brownian_bridge(draws):
+    '''
+    draws: (steps, N) matrix of independent standard normal draws
+    Builds the Brownian paths coarse to fine: the first draw sets the terminal value, the next ones the midpoints of the
+    intervals left (breadth first), so the first quasi-random dimensions carry most of the variance of the paths
+
+    returns:
+    (steps, N) matrix of standard normal increments (same distribution as draws, in path order)
+    '''
+    steps = draws.shape[0]
+
+    # Brownian motion in units of the time step (variance of W[i] is i)
+    W = np.empty((steps + 1,) + draws.shape[1:])
+    W[0] = 0
+    W[steps] = np.sqrt(steps)*draws[0]
+
+    intervals = [(0, steps)]
+    draw = 1
+    for left, right in intervals:
+        if right - left < 2:
+            continue
+        mid = (left + right)//2
+        W[mid] = ((right - mid)*W[left] + (mid - left)*W[right])/(right - left) + np.sqrt((mid - left)*(right - mid)/(right - left))*draws[draw]
+        draw += 1
+        intervals += [(left, mid), (mid, right)]
+
+    return np.diff(W, axis=0)
+
+def geo_brownian_paths(S, T, r, q, sigma, steps, N, sampler='pseudo', rng=None):
     '''
     S = Stock price
     T = time to maturity
@@ -11,6 +82,7 @@ def geo_brownian_paths(S, T, r, q, sigma, steps, N):
     q = dividend rate
     steps = time increments
     N = Number of trials
+    sampler, rng = normal draws of the paths (see normal_draws), quasi-random paths are built with a Brownian bridge
 
     returns:
     matrix of price paths
@@ -18,12 +90,16 @@ def geo_brownian_paths(S, T, r, q, sigma, steps, N):
 
     dt = T/steps
 
+    draws = normal_draws(steps, N, sampler, rng)
+    if sampler in ('sobol', 'halton') and steps > 1:
+        draws = brownian_bridge(draws)
+
     # ito integral
     ST = np.log(S) + np.cumsum(((r - q - sigma**2/2)*dt +\
 
     sigma*np.sqrt(dt) * \
 
-    np.random.normal(size=(steps,N))),axis=0)
+    draws),axis=0)
 
     return np.exp(ST)
 
@@ -63,6 +139,141 @@ def prob_under(value, S, T, r, q, sigma, steps, N, show_plot=True):
 
     return under/len(ST)
 
+# Probability engines for prob_curve
+# 'lognormal': exact closed form for the terminal price of a GBM (non-path-dependent payoffs)
+# 'monte_carlo': simulated terminal prices, kept for path-dependent payoffs or non-GBM models
+PROB_ENGINES = ('lognormal', 'monte_carlo')
+
+def select_engine(path_dependent=False, model='gbm'):
+    '''
+    path_dependent: True if the probability depends on the whole price path rather than S_T alone
+    model: price process of the underlying
+
+    returns:
+    name of the cheapest engine that is exact for the case
+    '''
+    if path_dependent or model != 'gbm':
+        return 'monte_carlo'
+    return 'lognormal'
+
+def tail_probs(ST, values, forward=None):
+    '''
+    ST: sorted sample of simulated terminal prices
+    values: array of prices to check S_T against
+    forward: known mean of S_T (S*exp((r - q)T) under GBM), when given S_T is used as a control variate:
+    p - beta*(mean(S_T) - forward) with beta = cov(1{S_T < value}, S_T)/var(S_T), which removes the part of the sampling error
+    explained by the sample mean missing the forward
+
+    returns:
+    tuple of arrays (p(S_T < value), p(S_T > value)) for each value
+    '''
+    # Number of samples strictly below / strictly above each value (same counting rule as prob_under/prob_over)
+    n = len(ST)
+    below = np.searchsorted(ST, values, side='left')
+    above = np.searchsorted(ST, values, side='right')
+    under, over = below/n, (n - above)/n
+
+    variance = ST.var() if forward is not None else 0
+    if variance == 0:
+        return under, over
+
+    # Sums of S_T over the samples below/above each value, from the prefix sums of the sorted sample
+    prefix = np.concatenate([[0.0], np.cumsum(ST)])
+    mean = prefix[-1]/n
+    beta_under = (prefix[below]/n - under*mean)/variance
+    beta_over = ((prefix[-1] - prefix[above])/n - over*mean)/variance
+
+    return np.clip(under - beta_under*(mean - forward), 0, 1), np.clip(over - beta_over*(mean - forward), 0, 1)
+
+def prob_curve_mc_stats(values, S, T, r, q, sigma, steps, N, sampler='pseudo', control_variate=False, batches=MC_BATCHES, seed=None):
+    '''
+    values: array of prices to check S_T against
+    sampler: one of SAMPLERS
+    control_variate: True to correct the probabilities with S_T as control variate (see tail_probs)
+    batches: independent batches the N paths are split in, the standard error is that of the batch estimates
+    seed: seed of the batches, None draws 'pseudo' normals from the global np.random state
+
+    returns:
+    tuple of arrays (p(S_T < value), p(S_T > value), standard error of p(S_T < value), standard error of p(S_T > value))
+    standard errors are NaN for a single batch
+    '''
+    values = np.asarray(values, dtype=float)
+    forward = S*np.exp((r - q)*T) if control_variate else None
+
+    batches = max(1, min(batches, N))
+    sizes = np.diff(np.linspace(0, N, batches + 1).astype(int))
+    if seed is None and sampler == 'pseudo':
+        rngs = [None]*batches
+    else:
+        rngs = [np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(batches)]
+
+    # Each batch simulates its terminal price sample once and answers every threshold with a rank lookup on the sorted sample
+    under = np.empty((batches, len(values)))
+    over = np.empty((batches, len(values)))
+    for i, (size, rng) in enumerate(zip(sizes, rngs)):
+        ST = np.sort(geo_brownian_paths(S, T, r, q, sigma, steps, size, sampler, rng)[-1])
+        under[i], over[i] = tail_probs(ST, values, forward)
+
+    weights = sizes/sizes.sum()
+    if batches == 1:
+        under_stderr = over_stderr = np.full(len(values), np.nan)
+    else:
+        under_stderr = under.std(axis=0, ddof=1)/np.sqrt(batches)
+        over_stderr = over.std(axis=0, ddof=1)/np.sqrt(batches)
+
+    return weights @ under, weights @ over, under_stderr, over_stderr
+
+def prob_curve_mc(values, S, T, r, q, sigma, steps, N, sampler='pseudo', control_variate=False, seed=None):
+    '''
+    values: array of prices to check S_T against
+    sampler, control_variate, seed: variance reduction of the simulation (see prob_curve_mc_stats)
+    Simulates the terminal price sample once and answers every threshold with a rank lookup on the sorted sample
+
+    returns:
+    tuple of arrays (p(S_T < value), p(S_T > value)) for each value
+    '''
+    under, over, _, _ = prob_curve_mc_stats(values, S, T, r, q, sigma, steps, N, sampler, control_variate, batches=1, seed=seed)
+    return under, over
+
+def prob_curve_lognormal(values, S, T, r, q, sigma):
+    '''
+    values: array of prices to check S_T against
+    Under GBM, log(S_T) ~ Normal(log(S) + (r - q - sigma^2/2)T, sigma^2 T), so both tails have a closed form
+
+    returns:
+    tuple of arrays (p(S_T < value), p(S_T > value)) for each value
+    '''
+    values = np.asarray(values, dtype=float)
+
+    mean = np.log(S) + (r - q - sigma**2/2)*T
+    std_dev = sigma*np.sqrt(T)
+
+    if std_dev == 0:
+        # No diffusion left (T = 0 or sigma = 0): S_T is known with certainty
+        terminal_price = S*np.exp((r - q - sigma**2/2)*T)
+        return (values > terminal_price).astype(float), (values < terminal_price).astype(float)
+
+    with np.errstate(divide='ignore'):
+        z_score = (np.log(values) - mean)/std_dev
+
+    # Standard normal cdf and survival function (what scipy.stats.norm.cdf/sf compute)
+    return special.ndtr(z_score), special.ndtr(-z_score)
+
+def prob_curve(values, S, T, r, q, sigma, steps, N, engine='monte_carlo', sampler='pseudo', control_variate=False):
+    '''
+    engine: one of PROB_ENGINES, use select_engine() to pick it for a given case
+    steps, N, sampler, control_variate: only used by the 'monte_carlo' engine (see prob_curve_mc_stats)
+
+    returns:
+    tuple of arrays (p(S_T < value), p(S_T > value)) for each value
+    '''
+    if engine == 'lognormal':
+        return prob_curve_lognormal(values, S, T, r, q, sigma)
+    elif engine == 'monte_carlo':
+        return prob_curve_mc(values, S, T, r, q, sigma, steps, N, sampler, control_variate)
+    else:
+        raise ValueError(f"Unknown probability engine '{engine}', expected one of {PROB_ENGINES}.")
+
 # Returns x_ls (price) and y_ls (probabilities)
 
 # GBM Variables
@@ -72,22 +283,21 @@ def prob_under(value, S, T, r, q, sigma, steps, N, show_plot=True):
 # sigma = hist_volatility # annualized volatility
 # steps = 1 # no need to have more than 1 for non-path dependent security
 # N = 1000000 # larger the better
-def gbm_sim(price_df, S, T, r, q, sigma, steps, N, bin_size=10):
-    x_ls, y_ls = [], []
+def gbm_sim(price_df, S, T, r, q, sigma, steps, N, bin_size=10, engine='monte_carlo', sampler='pseudo', control_variate=False):
 
     # Using pop stdev is correct: We have the entire popn data for N, thus we dont have to use sample std dev
     std_dev = stat.pstdev(price_df['close'].to_list())
     step = int((std_dev * 2)//bin_size)
 
-    for price in np.arange(start=S-std_dev, stop=S, step=step).tolist():
-                prob_val = prob_under(price, S, T, r, q, sigma, steps, N, show_plot=False)
-                x_ls.append(price)
-                y_ls.append(round(prob_val*100,1))
+    under_prices = np.arange(start=S-std_dev, stop=S, step=step)
+    over_prices = np.arange(start=S, stop=S+std_dev, step=step)
+
+    # One simulation serves every price bucket: p(S_T < price) below spot, p(S_T > price) from spot upwards
+    prob_under_ls, prob_over_ls = prob_curve(np.concatenate([under_prices, over_prices]), S, T, r, q, sigma, steps, N, engine=engine, sampler=sampler, control_variate=control_variate)
+    prob_ls = np.concatenate([prob_under_ls[:len(under_prices)], prob_over_ls[len(under_prices):]])
 
-    for price in np.arange(start=S, stop=S+std_dev, step=step).tolist():
-        prob_val = prob_over(price, S, T, r, q, sigma, steps, N, show_plot=False)
-        x_ls.append(price)
-        y_ls.append(round(prob_val*100,1))
+    x_ls = under_prices.tolist() + over_prices.tolist()
+    y_ls = [round(prob_val*100,1) for prob_val in prob_ls.tolist()]
 
     return x_ls, y_ls
 
@@ -0,0 +1,78 @@
+import sys
+import time
+import importlib
+import threading
+
+# Heavy dependencies only needed by some callbacks, loaded on first use instead of at import
+# Each with the attributes preload() accesses, plotly.graph_objects itself only loads its classes on first access
+LAZY_MODULES = {
+    'scipy.special': (),                                        # Normal distribution (lib/stats.py, lib/gbm.py, lib/tos_replay.py)
+    'plotly.graph_objects': ('Figure', 'Scatter', 'Bar'),       # Figures (dashboard_app/callbacks.py)
+}
+
+# Stand-in for a module, imported on the first attribute access and then forwarding every attribute to it
+# e.g. plt = lazy_module('matplotlib.pyplot') at module level, then plt.show() imports matplotlib.pyplot
+class LazyModule:
+
+    def __init__(self, name:str):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                module = self._module
+                if module is None:
+                    module = self.__dict__['_module'] = importlib.import_module(self._name)
+        return module
+
+    # True once the module was imported (by this proxy or by any other import of it)
+    def loaded(self) -> bool:
+        return self._module is not None or self._name in sys.modules
+
+    def __getattr__(self, attr:str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr:str, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        return f"<lazy module '{self._name}'{' (loaded)' if self.loaded() else ''}>"
+
+_modules = {}
+_modules_lock = threading.Lock()
+
+# Returns the (shared) lazy proxy of module name
+def lazy_module(name:str) -> LazyModule:
+
+    with _modules_lock:
+        module = _modules.get(name)
+        if module is None:
+            module = _modules[name] = LazyModule(name)
+    return module
+
+# Imports the lazy modules ahead of their first use (Default: LAZY_MODULES), e.g. in a background thread once the server is up
+# Returns the seconds each import took
+def preload(names:list=None) -> dict:
+
+    timings = {}
+    for name in LAZY_MODULES if names is None else names:
+        start = time.perf_counter()
+        module = lazy_module(name)._load()
+        for attribute in LAZY_MODULES.get(name, ()):
+            getattr(module, attribute)
+        timings[name] = time.perf_counter() - start
+
+    return timings
+
+# Starts preload() in a daemon thread
+def preload_in_background(names:list=None) -> threading.Thread:
+
+    thread = threading.Thread(target=preload, args=(names,), name='tos_preload', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,256 @@
+import os
+import time
+import math
+import cProfile
+import functools
+import threading
+from contextlib import contextmanager
+
+# Prometheus-style metrics of the dashboard (text exposition format served at /metrics by instrument_app())
+# Histograms count observations per bucket (upper bounds in seconds or bytes), counters only go up
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(1024 * 4**i for i in range(10)) # 1 KB to 256 MB
+
+def _format_labels(label_names:tuple, label_values:tuple, extra:str='') -> str:
+    labels = [f'{name}="{value}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+def _format_value(value:float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Histogram:
+
+    def __init__(self, name:str, documentation:str, label_names:tuple=(), buckets:tuple=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+        self._series = {} # label values: [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, *label_values):
+        label_values = tuple(map(str, label_values))
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+
+            # Buckets are stored non-cumulative and summed on render
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for upper_bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _format_value(upper_bound) + '"'
+                    lines.append(f'{self.name}_bucket{_format_labels(self.label_names, label_values, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, label_values)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, label_values)} {count}')
+
+        return lines
+
+class Counter:
+
+    def __init__(self, name:str, documentation:str, label_names:tuple=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount:float=1):
+        label_values = tuple(map(str, label_values))
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}')
+
+        return lines
+
+# Holds the metrics and collectors (functions returning exposition lines, for values read from other modules on scrape)
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for collector in self.collectors:
+            lines += collector()
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+CALLBACK_SECONDS = registry.histogram('tos_callback_seconds', 'Wall time of Dash callbacks', ('callback', 'outcome'))
+STAGE_SECONDS = registry.histogram('tos_stage_seconds', 'Wall time of the stages within Dash callbacks', ('callback', 'stage'))
+CALLBACK_REQUEST_BYTES = registry.histogram('tos_callback_request_bytes', 'Size of Dash callback request payloads', ('callback',), SIZE_BUCKETS)
+CALLBACK_RESPONSE_BYTES = registry.histogram('tos_callback_response_bytes', 'Size of Dash callback response payloads', ('callback',), SIZE_BUCKETS)
+API_CALL_SECONDS = registry.histogram('tos_api_call_seconds', 'Wall time of TOS API calls including the response cache lookup and JSON decoding', ('endpoint_type', 'cache'))
+API_REQUEST_SECONDS = registry.histogram('tos_api_request_seconds', 'Wall time of each HTTP request attempt to the TOS API', ('endpoint_type', 'status'))
+API_RESPONSE_BYTES = registry.histogram('tos_api_response_bytes', 'Size of TOS API response bodies', ('endpoint_type',), SIZE_BUCKETS)
+PROFILES = registry.counter('tos_profiles_total', 'cProfile dumps written for slow callbacks', ('callback',))
+
+# Name of the callback running in the current thread (label of the stages it times)
+_current = threading.local()
+
+def current_callback() -> str:
+    return getattr(_current, 'callback', '')
+
+# Times a stage of the running callback, e.g. with stage('fetch'): ...
+def stage(name:str):
+    return STAGE_SECONDS.time(current_callback(), name)
+
+# Wraps func to record its wall time and outcome ('ok', 'prevent_update' or 'error')
+# profile_dir: when set, each call runs under cProfile and calls slower than profile_threshold seconds are dumped there
+def instrument_callback(func, name:str=None, profile_dir:str=None, profile_threshold:float=1.0):
+
+    name = func.__name__ if name is None else name
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = current_callback()
+        _current.callback = name
+        _set_request_callback(name)
+
+        profiler = None
+        if profile_dir is not None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError: # Another profiler is active in this process
+                profiler = None
+
+        outcome = 'error'
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            outcome = 'ok'
+            return result
+        except Exception as error:
+            if type(error).__name__ == 'PreventUpdate':
+                outcome = 'prevent_update'
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.callback = previous
+            CALLBACK_SECONDS.observe(elapsed, name, outcome)
+
+            if profiler is not None:
+                profiler.disable()
+                if elapsed >= profile_threshold:
+                    os.makedirs(profile_dir, exist_ok=True)
+                    profiler.dump_stats(os.path.join(profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{name}_{int(elapsed * 1000)}ms.prof"))
+                    PROFILES.inc(name)
+
+    return wrapper
+
+def _set_request_callback(name:str):
+    try:
+        import flask
+        if flask.has_request_context():
+            flask.g.tos_callback = name
+    except ImportError:
+        pass
+
+# Stand-in for the Dash app passed to register_callbacks(): every callback registered through it is instrumented
+# Other attributes are those of the wrapped app
+class InstrumentedApp:
+
+    def __init__(self, app, profile_dir:str=None, profile_threshold:float=1.0):
+        self._app = app
+        self._profile_dir = profile_dir
+        self._profile_threshold = profile_threshold
+
+    def callback(self, *args, **kwargs):
+        register = self._app.callback(*args, **kwargs)
+
+        def decorator(func):
+            return register(instrument_callback(func, profile_dir=self._profile_dir, profile_threshold=self._profile_threshold))
+
+        return decorator
+
+    def __getattr__(self, name):
+        return getattr(self._app, name)
+
+def _cache_collector() -> list:
+    from lib.tos_cache import response_cache
+
+    stats = response_cache.stats()
+    lines = []
+
+    for stat in ('hits', 'misses', 'evictions'):
+        lines += [f'# HELP tos_api_cache_{stat}_total TOS API response cache {stat}', f'# TYPE tos_api_cache_{stat}_total counter']
+        lines += [f'tos_api_cache_{stat}_total{{endpoint_type="{endpoint_type}"}} {counters[stat]}' for endpoint_type, counters in sorted(stats['endpoints'].items())]
+
+    lines += ['# HELP tos_api_cache_bytes Size of the cached TOS API responses', '# TYPE tos_api_cache_bytes gauge', f"tos_api_cache_bytes {stats['bytes']}"]
+
+    return lines
+
+# Instruments a Dash app: returns an InstrumentedApp to register the callbacks on, records callback payload sizes and serves
+# the metrics at /metrics of the Flask server
+def instrument_app(app, profile_dir:str=None, profile_threshold:float=1.0, route:str='/metrics') -> InstrumentedApp:
+
+    import flask
+
+    server = app.server
+
+    @server.after_request
+    def record_payload_sizes(response):
+        callback = flask.g.get('tos_callback')
+        if callback is not None and not response.direct_passthrough:
+            CALLBACK_REQUEST_BYTES.observe(flask.request.content_length or 0, callback)
+            CALLBACK_RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback)
+        return response
+
+    def metrics():
+        return flask.Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    server.add_url_rule(route, 'tos_metrics', metrics)
+    registry.add_collector(_cache_collector)
+
+    return InstrumentedApp(app, profile_dir, profile_threshold)
@@ -0,0 +1,239 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from lib.stats import array_round, get_prob, prob_cone
+
+# Column ids of the processed option chain (same order as base_df_columns in dashboard_app/layout.py)
+OPTION_CHAIN_COLUMNS = ['ticker', 'exp_date', 'option_type', 'strike_price', 'exp_days', 'delta', 'prob_val', 'open_interest', 'total_volume',
+                        'premium', 'option_leverage', 'bid_size', 'ask_size', 'roi_val', 'lower_bound', 'upper_bound']
+
+# Contract fields read from each strike of the API response
+CONTRACT_FIELDS = ['putCall', 'strikePrice', 'bidSize', 'askSize', 'delta', 'totalVolume', 'openInterest', 'bid', 'multiplier']
+
+# Extracts contract fields of the option chain API response into NumPy arrays (one array per field)
+# Only expiry dates with 0 <= days to expiry <= expday_range are read
+def extract_option_chain(json_data:dict, expday_range:int, current_date=None) -> dict:
+
+    if current_date is None:
+        current_date = datetime.now()
+
+    columns = {field: [] for field in CONTRACT_FIELDS}
+    expiry_dates, day_diffs = [], []
+
+    # Process API response data from https://developer.tdameritrade.com/option-chains/apis/get/marketdata/chains
+    for option_chain_type in ['call','put']:
+        for exp_date in json_data[f'{option_chain_type}ExpDateMap'].values():
+
+            contracts = [strike[0] for strike in exp_date.values()]
+            if len(contracts) == 0:
+                continue
+
+            # All strikes of an expiry date share the same expiration timestamp
+            # strike[0]['daysToExpiration'] can return negative numbers to mess up prob_cone calculations
+            expiry_date = datetime.fromtimestamp(contracts[0]["expirationDate"]/1000.0)
+            day_diff = (expiry_date - current_date).days
+            if day_diff < 0 or day_diff > expday_range:
+                continue
+
+            for field in CONTRACT_FIELDS:
+                columns[field].extend([contract[field] for contract in contracts])
+
+            expiry_dates.extend([expiry_date] * len(contracts))
+            day_diffs.extend([day_diff] * len(contracts))
+
+    arrays = {
+        'exp_date': np.array(expiry_dates, dtype='datetime64[ns]'),
+        'exp_days': np.array(day_diffs, dtype=np.int64),
+        'option_type': np.array(columns['putCall'], dtype=object),
+        # delta can be returned as the string 'NaN', which is parsed to a float NaN
+        'delta': pd.to_numeric(pd.Series(columns['delta'], dtype=object), errors='coerce').to_numpy(dtype=float),
+    }
+
+    for field, column_id in [('strikePrice','strike_price'), ('bid','bid'), ('multiplier','multiplier')]:
+        arrays[column_id] = np.array(columns[field], dtype=float)
+
+    for field, column_id in [('bidSize','bid_size'), ('askSize','ask_size'), ('totalVolume','total_volume'), ('openInterest','open_interest')]:
+        arrays[column_id] = np.array(columns[field], dtype=np.int64)
+
+    return arrays
+
+# Premium (bid of one contract in dollars) and ROI (premium/cash secured, %) of contracts
+def premium_columns(bid, multiplier, strike_price) -> tuple:
+
+    option_premium = array_round(bid * multiplier, 2)
+    roi_val = array_round(option_premium/(strike_price*100)*100, 2)
+
+    return option_premium, roi_val
+
+# Option leverage: https://www.reddit.com/r/thetagang/comments/pq1v2v/using_delta_to_calculate_an_options_leverage/
+def leverage_column(delta_val, stock_price:float, option_premium):
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(np.isnan(delta_val) | (option_premium == 0), 0.0,
+                        array_round((np.abs(delta_val)*stock_price)/option_premium, 3))
+
+# Probability of staying OTM and probability cone bounds of contracts
+# The cone only depends on days to expiry, so it is calculated once per expiry
+def probability_columns(stock_price:float, strike_price, hist_volatility:float, day_diff, confidence_lvl:float, trading_periods:int=252) -> tuple:
+
+    # Probability is 0 for contracts expiring today
+    prob_val = get_prob(stock_price, strike_price, hist_volatility, day_diff, trading_periods)
+
+    days, expiry_index = np.unique(day_diff, return_inverse=True)
+    lower_bound, upper_bound = prob_cone(stock_price, hist_volatility, days, confidence_lvl, trading_periods)
+
+    return (np.atleast_1d(prob_val), np.atleast_1d(lower_bound)[expiry_index.reshape(-1)], np.atleast_1d(upper_bound)[expiry_index.reshape(-1)])
+
+# Processes the option chain API response into a Dataframe of OPTION_CHAIN_COLUMNS, computing derived columns with array math
+def process_option_chain(json_data:dict, ticker:str, stock_price:float, hist_volatility:float, expday_range:int, confidence_lvl:float,
+                        current_date=None, trading_periods:int=252) -> pd.DataFrame:
+
+    arrays = extract_option_chain(json_data, expday_range, current_date)
+
+    strike_price = arrays['strike_price']
+    day_diff = arrays['exp_days']
+    delta_val = arrays['delta']
+
+    option_premium, roi_val = premium_columns(arrays['bid'], arrays['multiplier'], strike_price)
+    option_leverage = leverage_column(delta_val, stock_price, option_premium)
+    prob_val, lower_bound, upper_bound = probability_columns(stock_price, strike_price, hist_volatility, day_diff, confidence_lvl, trading_periods)
+
+    df = pd.DataFrame({
+        'ticker': np.full(len(strike_price), ticker, dtype=object),
+        'exp_date': arrays['exp_date'],
+        'option_type': arrays['option_type'],
+        'strike_price': strike_price,
+        'exp_days': day_diff,
+        'delta': delta_val,
+        'prob_val': prob_val,
+        'open_interest': arrays['open_interest'],
+        'total_volume': arrays['total_volume'],
+        'premium': option_premium,
+        'option_leverage': option_leverage,
+        'bid_size': arrays['bid_size'],
+        'ask_size': arrays['ask_size'],
+        'roi_val': roi_val,
+        'lower_bound': lower_bound,
+        'upper_bound': upper_bound,
+    }, columns=OPTION_CHAIN_COLUMNS)
+
+    return df
+
+# Calculates the put/call skew of the option chain API response for the next monthly expiry (28 to 34 days to expiry)
+# Calculation for put call skew: https://app.fdscanner.com/aboutskew
+# Returns a dict with the ticker_df_columns ids, or None if the chain has no strikes 10% OTM on both sides
+def get_skew(option_chain_response:dict, ticker:str):
+
+    # Sanity check on API response data
+    if option_chain_response is None or list(option_chain_response.keys())[0] == "error":
+        return None
+
+    stock_price = option_chain_response['underlyingPrice']
+    stock_price_110percent = stock_price * 1.1
+    stock_price_90percent = stock_price * 0.9
+
+    low_call_strike, high_call_strike, low_put_strike, high_put_strike = None, None, None, None
+
+    for option_chain_type in ['call','put']:
+        for exp_date in option_chain_response[f'{option_chain_type}ExpDateMap'].keys():
+
+            # Note: example of exp_date is '2020-12-24:8' where 8 is the days to expiry
+            day_diff = int(exp_date.split(':')[1])
+            if day_diff < 28 or day_diff >= 35:
+                continue
+
+            # Define boolean variables because option chain is read in acsending order based on strike price
+            high_call_strike_found = False
+            high_put_strike_found = False
+
+            for strike in option_chain_response[f'{option_chain_type}ExpDateMap'][exp_date].values():
+
+                strike_price = strike[0]['strikePrice']
+
+                if option_chain_type == 'call':
+                    if strike_price < stock_price_90percent:
+                            low_call_strike = strike_price
+                            low_call_strike_bid = strike[0]['bid']
+                            low_call_strike_ask = strike[0]['ask']
+                    elif strike_price > stock_price_110percent:
+                        if not high_call_strike_found:
+                            high_call_strike = strike_price
+                            high_call_strike_bid = strike[0]['bid']
+                            high_call_strike_ask = strike[0]['ask']
+                            high_call_strike_found = True
+
+                elif option_chain_type == 'put':
+                    if strike_price < stock_price_90percent:
+                            low_put_strike = strike_price
+                            low_put_strike_bid = strike[0]['bid']
+                            low_put_strike_ask = strike[0]['ask']
+                    elif strike_price > stock_price_110percent:
+                        if not high_put_strike_found:
+                            high_put_strike = strike_price
+                            high_put_strike_bid = strike[0]['bid']
+                            high_put_strike_ask = strike[0]['ask']
+                            high_put_strike_found = True
+
+    # Ensure if there is an error, will not be displayed
+    strike_checklist = [low_call_strike, high_call_strike, low_put_strike, high_put_strike]
+    if any(item is None for item in strike_checklist):
+        return None
+
+    # Ensuring options pass liquidity checks
+    prevent_zero_div = lambda x, y: 0 if (y == 0 or y == None) else x/y
+    high_call_strike_askbid = prevent_zero_div(high_call_strike_ask, high_call_strike_bid)
+    high_put_strike_askbid = prevent_zero_div(high_put_strike_ask, high_put_strike_bid)
+    low_call_strike_askbid = prevent_zero_div(low_call_strike_ask, low_call_strike_bid)
+    low_put_strike_askbid = prevent_zero_div(low_put_strike_ask, low_put_strike_bid)
+
+    askbid_checklist = [high_call_strike_askbid, high_put_strike_askbid, low_call_strike_askbid, low_put_strike_askbid]
+
+    liquidity_check = all(askbid > 1.25 for askbid in askbid_checklist)
+    if liquidity_check:
+        liquidity = 'FAILED'
+    else:
+        liquidity = 'PASSED'
+
+    # Computing option midpoints
+    high_call_strike_midpoint = (high_call_strike_bid + high_call_strike_ask)/2
+    high_put_strike_midpoint = (high_put_strike_bid + high_put_strike_ask)/2
+    low_call_strike_midpoint = (low_call_strike_bid + low_call_strike_ask)/2
+    low_put_strike_midpoint = (low_put_strike_bid + low_put_strike_ask)/2
+
+    # Computing Interpolated Price
+    call_110percent_price = low_call_strike_midpoint - (low_call_strike_midpoint - high_call_strike_midpoint)/(high_call_strike-low_call_strike) * (stock_price_110percent-low_call_strike)
+    put_90percent_price = low_put_strike_midpoint + (high_put_strike_midpoint - low_put_strike_midpoint)/(high_put_strike - low_put_strike) * (stock_price_90percent - low_put_strike)
+
+    # Calculate Skew
+    if put_90percent_price > call_110percent_price:
+        skew_category = 'Put Skew'
+        skew = round(put_90percent_price/call_110percent_price,3)
+    else:
+        skew_category = 'Call Skew'
+        skew = round(call_110percent_price/put_90percent_price,3)
+
+    return {'ticker': ticker, 'skew_category': skew_category, 'skew': skew, 'liquidity': liquidity}
+
+# Returns the contracts of a processed option chain (OPTION_CHAIN_COLUMNS ids) with ROI >= min_roi and |delta| <= max_delta
+# that are outside of the probability cone: calls struck at or above its upper bound, puts at or below its lower bound
+def filter_option_chain(df:pd.DataFrame, min_roi:float, max_delta:float) -> pd.DataFrame:
+
+    option_type = df['option_type'].to_numpy()
+    strike_price = df['strike_price'].to_numpy()
+
+    # Contracts with a NaN delta are left out
+    with np.errstate(invalid='ignore'):
+        mask = (df['roi_val'].to_numpy() >= min_roi) & (np.abs(df['delta'].to_numpy()) <= max_delta)
+
+    mask &= ((option_type == 'CALL') & (strike_price >= df['upper_bound'].to_numpy())) | ((option_type == 'PUT') & (strike_price <= df['lower_bound'].to_numpy()))
+
+    return df.loc[mask]
+
+# Unique id of each contract, e.g. 'AAPL_CALL_2021-07-16_150.0' (row id of the option chain tables and key of streamed contract quotes)
+def contract_keys(ticker, option_type, exp_date, strike_price) -> np.ndarray:
+
+    dates = np.datetime_as_string(np.asarray(exp_date, dtype='datetime64[D]'))
+    keys = [f'{ticker_}_{option_type_}_{date_}_{float(strike_)}' for ticker_, option_type_, date_, strike_
+            in zip(np.broadcast_to(ticker, len(dates)), option_type, dates, strike_price)]
+
+    return np.array(keys, dtype=object)
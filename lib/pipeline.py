@@ -0,0 +1,63 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Stages of a Submit with the inputs and upstream stages they depend on, a stage reruns when any of them changed
+SUBMIT_STAGES = OrderedDict([
+    ('raw', (('ticker',), ())),                                         # Price history, quote and option chain (API calls)
+    ('volatility', (('volatility_period', 'vol_est_type'), ('raw',))),  # Historical volatility
+    ('bounds', (('expday_range', 'confidence_lvl'), ('volatility',))),  # Processed option chain: probabilities and confidence bounds
+    ('filter', (('min_roi', 'max_delta'), ('bounds',))),                # Option chain table filter
+])
+
+# Raw data older than this (in seconds) is fetched again, even if the ticker did not change
+RAW_DATA_MAX_AGE = 5 * 60
+
+# Browser sessions whose last Submit is kept (least recently used sessions are dropped first)
+SESSION_CACHE_SIZE = 16
+
+# Returns the stages to rerun when a Submit's inputs change from previous to inputs (dicts of input name: value)
+# Every stage reruns without previous inputs, no stage reruns for unchanged inputs
+def changed_stages(previous:dict, inputs:dict) -> set:
+
+    if previous is None:
+        return set(SUBMIT_STAGES)
+
+    changed = set()
+    for stage, (stage_inputs, upstream) in SUBMIT_STAGES.items():
+        if any(previous.get(name) != inputs.get(name) for name in stage_inputs) or changed.intersection(upstream):
+            changed.add(stage)
+
+    return changed
+
+# Inputs and raw data (lib.prefetch.TickerSnapshot) of the last Submit of each browser session, kept in the memory of this process
+# The snapshot also holds the values derived from its raw data, so a Submit reusing it only computes the stages whose inputs changed
+class SessionCache:
+
+    def __init__(self, size:int=SESSION_CACHE_SIZE, max_age:float=RAW_DATA_MAX_AGE):
+        self.size = size
+        self.max_age = max_age
+
+        self._entries = OrderedDict() # session: (inputs, snapshot)
+        self._lock = threading.Lock()
+
+    # Returns (inputs, snapshot) of the session's last Submit, (None, None) if unknown or if its raw data is older than max_age
+    def get(self, session:str) -> tuple:
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is None:
+                return None, None
+            self._entries.move_to_end(session)
+
+        inputs, snapshot = entry
+        if max(snapshot.ages(time.time()).values(), default=0) > self.max_age:
+            return None, None
+
+        return entry
+
+    def put(self, session:str, inputs:dict, snapshot):
+        with self._lock:
+            self._entries[session] = (dict(inputs), snapshot)
+            self._entries.move_to_end(session)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,271 @@
+import time
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from lib.tos_api_calls import tos_get_quotes, tos_get_option_chain, tos_get_price_hist
+from lib.tos_client import RATE_LIMIT
+from lib.tos_cache import response_cache
+from lib.stats import get_latest_volatility
+from lib.option_chain import process_option_chain, get_skew
+
+# Seconds between two refreshes of a dataset of the watchlist
+# Refreshes going through the response cache of lib/tos_cache.py are never more frequent than its TTL (see cached_intervals)
+PREFETCH_INTERVALS = {
+    'quotes': 15,                   # Quotes of the whole watchlist (batched requests)
+    'chains': 60,                   # Full option chain per ticker
+    'pricehistory': 15 * 60,        # 1Y daily candles per ticker (through the price store, which only fetches new candles)
+}
+
+# Response cache endpoint type of each dataset (lib.tos_cache.CACHE_TTL)
+CACHE_ENDPOINT_TYPES = {'quotes': 'quotes', 'chains': 'chains', 'pricehistory': 'pricehistory_daily'}
+
+# API requests per minute the scheduler may use on average, the rest of RATE_LIMIT is left to the callbacks
+# Intervals of large watchlists are stretched to stay within it
+PREFETCH_BUDGET = RATE_LIMIT // 2
+
+# Refreshes running concurrently
+PREFETCH_WORKERS = 4
+
+# Tickers per quotes request
+QUOTES_BATCH_SIZE = 100
+
+# Callback inputs (volatility period, estimator, days to expiry, confidence) whose derived data is computed on each refresh
+# Defaults of the dashboard_app/layout.py inputs, other inputs are computed on the first Submit and then reused until the next refresh
+DERIVED_PARAMS = [(14, 'log_returns', 28, 0.3)]
+
+# Datasets each derived value is computed from, a refresh of a dataset drops the derived values depending on it
+DERIVED_DEPENDENCIES = {
+    'volatility': ('pricehistory',),
+    'option_chain': ('pricehistory', 'quotes', 'chains'),
+    'skew': ('chains',),
+}
+
+# Prefetched datasets of one ticker with the time they were fetched at (time.time()) and the values derived from them
+# A snapshot is never modified once published: a refresh publishes a new one, so readers always see consistent datasets
+# Cached values are shared between callers and must not be modified
+class TickerSnapshot:
+
+    def __init__(self, ticker:str, datasets:dict=None, fetched_at:dict=None, derived:dict=None):
+        self.ticker = ticker
+        self.datasets = dict(datasets or {})
+        self.fetched_at = dict(fetched_at or {})
+
+        self._derived = dict(derived or {})
+        self._lock = threading.Lock()
+
+    @property
+    def price_df(self) -> pd.DataFrame:
+        return self.datasets.get('pricehistory')
+
+    @property
+    def quote(self) -> dict:
+        return self.datasets.get('quotes')
+
+    @property
+    def option_chain_response(self) -> dict:
+        return self.datasets.get('chains')
+
+    # True once every dataset was fetched
+    def complete(self) -> bool:
+        return all(dataset in self.datasets for dataset in PREFETCH_INTERVALS)
+
+    # Seconds since each dataset was fetched
+    def ages(self, now:float=None) -> dict:
+        now = time.time() if now is None else now
+        return {dataset: now - fetched_at for dataset, fetched_at in self.fetched_at.items()}
+
+    # New snapshot with dataset replaced, keeping the derived values that do not depend on it
+    def replace(self, dataset:str, value, fetched_at:float):
+        derived = {key: derived_value for key, derived_value in self._derived.items() if dataset not in DERIVED_DEPENDENCIES[key[0]]}
+        return TickerSnapshot(self.ticker, {**self.datasets, dataset: value}, {**self.fetched_at, dataset: fetched_at}, derived)
+
+    def _derive(self, key:tuple, compute):
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+
+        # Computed outside of the lock, concurrent callers at worst compute the same value twice
+        value = compute()
+        with self._lock:
+            return self._derived.setdefault(key, value)
+
+    def volatility(self, volatility_period:int, vol_est_type:str) -> float:
+        return self._derive(('volatility', volatility_period, vol_est_type),
+                            lambda: get_latest_volatility(self.price_df, volatility_period, estimator=vol_est_type))
+
+    # Processed option chain (lib.option_chain.OPTION_CHAIN_COLUMNS) for the callback inputs
+    def option_chain(self, volatility_period:int, vol_est_type:str, expday_range:int, confidence_lvl:float) -> pd.DataFrame:
+        def compute():
+            hist_volatility = self.volatility(volatility_period, vol_est_type)
+            return process_option_chain(self.option_chain_response, self.ticker, self.quote['lastPrice'], hist_volatility, expday_range, confidence_lvl)
+
+        return self._derive(('option_chain', volatility_period, vol_est_type, expday_range, confidence_lvl), compute)
+
+    def skew(self):
+        return self._derive(('skew',), lambda: get_skew(self.option_chain_response, self.ticker))
+
+# Stretches the intervals of the datasets fetched through the response cache to at least its TTL, shorter ones would only
+# get the cached response back. cached: datasets fetched through the cache (the price store's date range requests bypass it)
+def cached_intervals(intervals:dict, cached) -> dict:
+
+    return {dataset: max(interval, response_cache.ttl.get(CACHE_ENDPOINT_TYPES[dataset], 0)) if dataset in cached else interval
+            for dataset, interval in intervals.items()}
+
+# Stretches the intervals by the same factor so that the average request rate of tickers stays within budget (requests per minute)
+def scale_intervals(intervals:dict, tickers:int, budget:float) -> dict:
+
+    requests_per_refresh = {'quotes': -(-tickers // QUOTES_BATCH_SIZE), 'chains': tickers, 'pricehistory': tickers}
+    rate = sum(60.0 * requests_per_refresh[dataset] / interval for dataset, interval in intervals.items())
+
+    factor = max(1.0, rate / budget) if budget > 0 else 1.0
+    return {dataset: interval * factor for dataset, interval in intervals.items()}
+
+# Background scheduler refreshing the quotes, option chains and daily price histories of a watchlist on per-dataset intervals
+# Each refresh publishes a new TickerSnapshot (with the derived values of DERIVED_PARAMS) read by the callbacks through snapshot()
+# price_store: optional lib.price_store.PriceStore for the price histories
+# The snapshots live in the memory of this process, each worker process of a multi-process server runs its own scheduler
+class PrefetchScheduler:
+
+    def __init__(self, tickers:list, apiKey:str, price_store=None, intervals:dict=None, budget:float=PREFETCH_BUDGET,
+                    workers:int=PREFETCH_WORKERS, derived_params:list=None):
+        self.tickers = list(tickers)
+        self.apiKey = apiKey
+        self.price_store = price_store
+        cached = ('quotes', 'chains') if price_store is not None else ('quotes', 'chains', 'pricehistory')
+        intervals = cached_intervals(dict(PREFETCH_INTERVALS if intervals is None else intervals), cached)
+        self.intervals = scale_intervals(intervals, len(self.tickers), budget)
+        self.derived_params = list(DERIVED_PARAMS if derived_params is None else derived_params)
+        self.workers = workers
+
+        self._snapshots = {ticker: TickerSnapshot(ticker) for ticker in self.tickers}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'refreshes': 0, 'errors': 0, 'last_error': None}
+
+    # Latest complete snapshot of ticker, None if the ticker is not watched or not fully fetched yet
+    def snapshot(self, ticker:str):
+        with self._lock:
+            snapshot = self._snapshots.get(ticker)
+        return snapshot if snapshot is not None and snapshot.complete() else None
+
+    def _publish(self, ticker:str, dataset:str, value, fetched_at:float):
+        with self._lock:
+            snapshot = self._snapshots[ticker] = self._snapshots[ticker].replace(dataset, value, fetched_at)
+
+        # Derived values of the default inputs are computed here, so Submits with these inputs only read them
+        if snapshot.complete():
+            for params in self.derived_params:
+                snapshot.option_chain(*params)
+            snapshot.skew()
+
+    def _fetch(self, dataset:str, ticker:str):
+        if dataset == 'pricehistory':
+            if self.price_store is None:
+                return pd.DataFrame(tos_get_price_hist(ticker, apiKey=self.apiKey).get('candles', []))
+            return self.price_store.load(ticker, period=1, periodType='year', apiKey=self.apiKey)
+
+        response = tos_get_option_chain(ticker, contractType='ALL', rangeType='ALL', apiKey=self.apiKey)
+        if 'callExpDateMap' not in response:
+            raise ValueError(response.get('error', f'Invalid option chain response for {ticker}.'))
+        return response
+
+    # Fetches dataset ('quotes', 'chains' or 'pricehistory') of tickers (Default: the watchlist) and publishes the new snapshots
+    # Failed refreshes keep the previous snapshot, which then gets older
+    def refresh(self, dataset:str, tickers:list=None):
+        tickers = self.tickers if tickers is None else tickers
+
+        try:
+            if dataset == 'quotes':
+                for start in range(0, len(tickers), QUOTES_BATCH_SIZE):
+                    quotes = tos_get_quotes(','.join(tickers[start:start + QUOTES_BATCH_SIZE]), apiKey=self.apiKey)
+                    fetched_at = time.time()
+                    for ticker, quote in quotes.items():
+                        if ticker in self._snapshots and isinstance(quote, dict) and 'lastPrice' in quote:
+                            self._publish(ticker, 'quotes', quote, fetched_at)
+            else:
+                for ticker in tickers:
+                    value = self._fetch(dataset, ticker)
+                    if value is not None:
+                        self._publish(ticker, dataset, value, time.time())
+        except Exception as exception: # A failing refresh does not stop the scheduler
+            with self._lock:
+                self._stats['errors'] += 1
+                self._stats['last_error'] = f'{dataset}: {str(exception) or type(exception).__name__}'
+        finally:
+            with self._lock:
+                self._stats['refreshes'] += 1
+
+    # Refreshes every dataset of the watchlist once, e.g. to warm up before serving
+    def refresh_all(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            jobs = [executor.submit(self.refresh, 'quotes')]
+            jobs += [executor.submit(self.refresh, dataset, [ticker]) for dataset in ('chains', 'pricehistory') for ticker in self.tickers]
+            for job in jobs:
+                job.result()
+
+    def _run(self):
+        # Jobs are (due time, sequence, dataset, tickers), due at once on start
+        # A job is rescheduled an interval after it finishes, so the refreshes spread out as the rate limiter paces the first round
+        now = time.monotonic()
+        jobs = [(now, 0, 'quotes', None)]
+        jobs += [(now, i + 1, dataset, ticker) for i, (dataset, ticker) in enumerate((dataset, ticker) for dataset in ('chains', 'pricehistory') for ticker in self.tickers)]
+        heapq.heapify(jobs)
+        done = []
+        done_lock = threading.Lock()
+
+        def run_job(job):
+            _, sequence, dataset, ticker = job
+            self.refresh(dataset, None if ticker is None else [ticker])
+            with done_lock:
+                done.append((time.monotonic() + self.intervals[dataset], sequence, dataset, ticker))
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tos_prefetch') as executor:
+            while not self._stop.is_set():
+                with done_lock:
+                    for job in done:
+                        heapq.heappush(jobs, job)
+                    done.clear()
+
+                while jobs and jobs[0][0] <= time.monotonic():
+                    executor.submit(run_job, heapq.heappop(jobs))
+
+                # Finished jobs are picked up within a second
+                timeout = 1.0 if not jobs else min(1.0, max(0.0, jobs[0][0] - time.monotonic()))
+                self._stop.wait(timeout)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='tos_prefetch', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            ages = {ticker: snapshot.ages() for ticker, snapshot in self._snapshots.items()}
+            return {**self._stats, 'tickers': len(self.tickers), 'intervals': dict(self.intervals), 'ages': ages}
+
+# Describes how old the datasets of a Submit are, e.g. 'Prefetched data: quotes 4s, option chain 32s, price history 6m old'
+# snapshot: the TickerSnapshot the data was read from, None for data fetched live by the Submit
+# source: where the snapshot came from, e.g. 'Prefetched' (watchlist) or 'Reused' (previous Submit of the session)
+def describe_freshness(snapshot, source:str='Prefetched', now:float=None) -> str:
+
+    if snapshot is None:
+        return 'Live data: fetched on Submit'
+
+    def age(seconds):
+        seconds = max(0, int(seconds))
+        return f'{seconds}s' if seconds < 60 else f'{seconds // 60}m' if seconds < 3600 else f'{seconds // 3600}h'
+
+    ages = snapshot.ages(now)
+    names = [('quotes', 'quotes'), ('chains', 'option chain'), ('pricehistory', 'price history')]
+    return f'{source} data: ' + ', '.join(f'{name} {age(ages[dataset])}' for dataset, name in names) + ' old'
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import datetime
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+import requests
+
+from lib.tos_api_calls import tos_get_price_hist
+
+# Local store of price history candles, one partition per (frequency type, frequency) with one file per ticker:
+#   <directory>/<frequencyType>_<frequency>/<ticker>.npy   candles as a structured array sorted by datetime (no duplicates)
+#   <directory>/<frequencyType>_<frequency>/<ticker>.json  sync metadata: first covered datetime and time of the last sync
+# Candle files are memory-mapped on read, so repeat lookups neither parse nor copy the stored history
+CANDLE_DTYPE = np.dtype([('datetime', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')])
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.tos_dashboard', 'price_history')
+
+# Seconds before a stored history is synced again with the API (only candles newer than the last stored one are fetched)
+REFRESH_INTERVAL = {
+    'minute': 60,
+    'daily': 15 * 60,           # Today's candle keeps changing during market hours
+    'weekly': 60 * 60,
+    'monthly': 4 * 60 * 60,
+}
+DEFAULT_REFRESH_INTERVAL = 15 * 60
+
+# Converts the candles of a price history API response into a structured array sorted by datetime
+def candles_to_array(candles:list) -> np.ndarray:
+
+    array = np.array([(candle['datetime'], candle['open'], candle['high'], candle['low'], candle['close'], candle['volume']) for candle in candles], dtype=CANDLE_DTYPE)
+
+    return array[np.argsort(array['datetime'], kind='stable')]
+
+# Converts a structured candle array into a Dataframe with the columns of pd.DataFrame(response['candles'])
+def candles_to_frame(candles:np.ndarray) -> pd.DataFrame:
+
+    return pd.DataFrame({name: candles[name] for name in CANDLE_DTYPE.names}, columns=list(CANDLE_DTYPE.names))
+
+# Merges two sorted candle arrays, candles of new replace stored candles with the same datetime (e.g. today's partial candle)
+def merge_candles(stored:np.ndarray, new:np.ndarray) -> np.ndarray:
+
+    merged = np.concatenate([stored, new])
+    merged = merged[np.argsort(merged['datetime'], kind='stable')]
+
+    # Stable sort keeps the new candle last among equal datetimes
+    keep = np.append(merged['datetime'][1:] != merged['datetime'][:-1], True)
+
+    return merged[keep]
+
+# Returns the first datetime (milliseconds since epoch) covered by a request of period x periodType ending now
+def period_start(period:int, periodType:str, now:datetime.datetime=None) -> int:
+
+    if now is None:
+        now = datetime.datetime.now()
+
+    if periodType == 'day':
+        start = now - datetime.timedelta(days=period)
+    elif periodType == 'month':
+        start = now - pd.DateOffset(months=period)
+    elif periodType == 'year':
+        start = now - pd.DateOffset(years=period)
+    elif periodType == 'ytd':
+        start = datetime.datetime(now.year, 1, 1)
+    else:
+        raise ValueError(f"Unknown periodType '{periodType}', expected 'day', 'month', 'year' or 'ytd'.")
+
+    return int(start.timestamp() * 1000)
+
+class PriceStore:
+
+    def __init__(self, directory:str=None, refresh_interval:dict=None, fetch=tos_get_price_hist):
+        self.directory = DEFAULT_DIRECTORY if directory is None else directory
+        self.refresh_interval = dict(REFRESH_INTERVAL if refresh_interval is None else refresh_interval)
+        self.fetch = fetch
+
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._stats = {'hits': 0, 'full_fetches': 0, 'delta_fetches': 0, 'failed_fetches': 0}
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _paths(self, ticker:str, frequencyType:str, frequency:int) -> tuple:
+        partition = os.path.join(self.directory, f'{frequencyType}_{frequency}')
+        name = quote(ticker.upper(), safe='')
+        return partition, os.path.join(partition, name + '.npy'), os.path.join(partition, name + '.json')
+
+    def _lock(self, key:tuple) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _read_meta(self, meta_path:str):
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # Writes the candles and their metadata with atomic renames, readers holding a memory map of the previous file keep their view
+    def _write(self, partition:str, candles_path:str, meta_path:str, candles:np.ndarray, meta:dict):
+        os.makedirs(partition, exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=partition, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, candles)
+        os.replace(tmp_path, candles_path)
+
+        fd, tmp_path = tempfile.mkstemp(dir=partition, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    # Returns the stored candles of a ticker as a read-only memory-mapped structured array (CANDLE_DTYPE), or None if there are none
+    # start: first datetime in milliseconds since epoch, the result is a view on the stored array
+    def read(self, ticker:str, frequencyType:str='daily', frequency:int=1, start:int=None):
+        _, candles_path, _ = self._paths(ticker, frequencyType, frequency)
+
+        try:
+            candles = np.load(candles_path, mmap_mode='r')
+        except FileNotFoundError:
+            return None
+
+        if start is not None:
+            candles = candles[np.searchsorted(candles['datetime'], start, side='left'):]
+
+        return candles
+
+    # Fetches candles from the API, returns a structured array or None if the request failed or returned no candles
+    def _fetch(self, ticker:str, apiKey:str, **params):
+        try:
+            response = self.fetch(ticker, apiKey=apiKey, **params)
+        except (requests.RequestException, ValueError): # Connection errors, timeouts and invalid JSON responses (ValueError before requests 2.27)
+            response = None
+
+        if not isinstance(response, dict) or not response.get('candles'):
+            self._stats['failed_fetches'] += 1
+            return None
+
+        return candles_to_array(response['candles'])
+
+    # Returns the candles of period x periodType up to now as a memory-mapped structured array, or None if there is no data
+    # A cold ticker (or a longer period than stored) downloads the whole period once
+    # A warm ticker is only synced every refresh interval, fetching the candles from the last stored one onwards
+    def load_candles(self, ticker:str, period=1, periodType:str='year', frequencyType:str='daily', frequency:int=1, apiKey:str=None):
+
+        start = period_start(period, periodType)
+        partition, candles_path, meta_path = self._paths(ticker, frequencyType, frequency)
+
+        with self._lock((partition, candles_path)):
+            stored = self.read(ticker, frequencyType, frequency)
+            meta = self._read_meta(meta_path)
+            now = time.time()
+
+            if stored is None or meta is None or len(stored) == 0 or meta['covered_from'] > start:
+                new = self._fetch(ticker, apiKey, period=period, periodType=periodType, frequencyType=frequencyType, frequency=frequency)
+                if new is not None:
+                    self._stats['full_fetches'] += 1
+                    covered_from = start if meta is None else min(meta['covered_from'], start)
+                    merged = new if stored is None else merge_candles(stored, new)
+                    self._write(partition, candles_path, meta_path, merged, {'covered_from': covered_from, 'synced_at': now})
+
+            elif now - meta['synced_at'] > self.refresh_interval.get(frequencyType, DEFAULT_REFRESH_INTERVAL):
+                # Last stored candle is fetched again, it may have been a partial one
+                last = int(stored['datetime'][-1])
+                new = self._fetch(ticker, apiKey, periodType=periodType, frequencyType=frequencyType, frequency=frequency,
+                                    startDate=last, endDate=int(now * 1000))
+                if new is not None:
+                    self._stats['delta_fetches'] += 1
+                    self._write(partition, candles_path, meta_path, merge_candles(stored, new), {'covered_from': meta['covered_from'], 'synced_at': now})
+                # A failed sync serves the stored candles, the next load retries it
+
+            else:
+                self._stats['hits'] += 1
+
+        return self.read(ticker, frequencyType, frequency, start)
+
+    # Same as load_candles() as a Dataframe with the columns of pd.DataFrame(response['candles']), or None if there is no data
+    def load(self, ticker:str, period=1, periodType:str='year', frequencyType:str='daily', frequency:int=1, apiKey:str=None):
+
+        candles = self.load_candles(ticker, period, periodType, frequencyType, frequency, apiKey)
+        if candles is None:
+            return None
+
+        return candles_to_frame(candles)
+
+    def stats(self) -> dict:
+        return dict(self._stats, directory=self.directory)
@@ -0,0 +1,330 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lib.tos_api_calls import tos_get_quotes, tos_get_option_chain
+from lib.stats import prob_cone
+from lib.pipeline import SESSION_CACHE_SIZE
+from lib.option_chain import (OPTION_CHAIN_COLUMNS, extract_option_chain, premium_columns, leverage_column, probability_columns,
+                                contract_keys)
+
+# Stream sources: 'simulated' (local random walk of the subscribed quotes) or 'polling' (TOS API quotes and option chains)
+STREAM_SOURCES = ['simulated', 'polling']
+
+# Seconds between two batches of ticks of a source
+STREAM_INTERVAL = {'simulated': 1.0, 'polling': 5.0}
+
+# Seconds a session's chain keeps streaming without being read (the browser reads its diff every second, slower in background tabs)
+STREAM_IDLE_TIMEOUT = 5 * 60
+
+# Seconds between two option chain polls of the polling source (option chains are cached for 30 seconds, see lib/tos_cache.py)
+CHAIN_POLL_INTERVAL = 30.0
+
+# Columns recomputed by ticks: the quote of the underlying changes the columns depending on the stock price,
+# the bid of a contract changes the columns depending on its premium
+UNDERLYING_COLUMNS = ['option_leverage', 'prob_val', 'lower_bound', 'upper_bound']
+CONTRACT_COLUMNS = ['premium', 'roi_val', 'option_leverage']
+STREAM_COLUMNS = list(dict.fromkeys(CONTRACT_COLUMNS + UNDERLYING_COLUMNS))
+
+# Processed option chain of one ticker kept in memory and updated in place by ticks
+# Ticks are dicts keyed by 'key': {'key': ticker, 'lastPrice': ...} for the underlying, {'key': contract key, 'bid': ...} for a contract
+# Every batch of ticks bumps version, rows remember the version they last changed at so diffs only hold the rows changed since a version
+class StreamingChain:
+
+    def __init__(self, option_chain_response:dict, ticker:str, stock_price:float, hist_volatility:float, expday_range:int, confidence_lvl:float,
+                    current_date=None, trading_periods:int=252):
+        self.id = uuid.uuid4().hex
+        self.ticker = ticker
+        self.stock_price = stock_price
+        self.hist_volatility = hist_volatility
+        self.expday_range = expday_range
+        self.confidence_lvl = confidence_lvl
+        self.trading_periods = trading_periods
+
+        arrays = extract_option_chain(option_chain_response, expday_range, current_date)
+        self.arrays = arrays
+        self.keys = contract_keys(ticker, arrays['option_type'], arrays['exp_date'], arrays['strike_price'])
+        self._index = {key: i for i, key in enumerate(self.keys.tolist())}
+
+        arrays['premium'], arrays['roi_val'] = premium_columns(arrays['bid'], arrays['multiplier'], arrays['strike_price'])
+        arrays['option_leverage'] = leverage_column(arrays['delta'], stock_price, arrays['premium'])
+        arrays['prob_val'], arrays['lower_bound'], arrays['upper_bound'] = probability_columns(stock_price, arrays['strike_price'], hist_volatility,
+                                                                                                arrays['exp_days'], confidence_lvl, trading_periods)
+
+        self.version = 0
+        self.price_version = 0
+        self.row_version = np.zeros(len(self.keys), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    # Bids of the contracts, the initial state of a stream source
+    def contract_bids(self) -> dict:
+        return dict(zip(self.keys.tolist(), self.arrays['bid'].tolist()))
+
+    # Applies a batch of ticks, recomputing only the columns they affect, returns the new version (unchanged if nothing changed)
+    def apply(self, ticks:list) -> int:
+        with self._lock:
+            arrays = self.arrays
+            version = self.version + 1
+
+            stock_price = self.stock_price
+            rows, bids = [], []
+            for tick in ticks:
+                if tick['key'] == self.ticker:
+                    stock_price = tick.get('lastPrice', stock_price)
+                else:
+                    row = self._index.get(tick['key'])
+                    if row is not None and 'bid' in tick and tick['bid'] != arrays['bid'][row]:
+                        rows.append(row)
+                        bids.append(tick['bid'])
+
+            if rows:
+                rows = np.array(rows)
+                arrays['bid'][rows] = bids
+                arrays['premium'][rows], arrays['roi_val'][rows] = premium_columns(arrays['bid'][rows], arrays['multiplier'][rows], arrays['strike_price'][rows])
+                arrays['option_leverage'][rows] = leverage_column(arrays['delta'][rows], self.stock_price, arrays['premium'][rows])
+                self.row_version[rows] = version
+
+            if stock_price != self.stock_price:
+                self.stock_price = stock_price
+                arrays['option_leverage'] = leverage_column(arrays['delta'], stock_price, arrays['premium'])
+                arrays['prob_val'], arrays['lower_bound'], arrays['upper_bound'] = probability_columns(stock_price, arrays['strike_price'], self.hist_volatility,
+                                                                                                        arrays['exp_days'], self.confidence_lvl, self.trading_periods)
+                self.price_version = version
+                self.row_version[:] = version
+
+            if len(rows) or self.price_version == version:
+                self.version = version
+
+            return self.version
+
+    # Current processed option chain (OPTION_CHAIN_COLUMNS ids)
+    def frame(self) -> pd.DataFrame:
+        with self._lock:
+            arrays = self.arrays
+            columns = {column: arrays[column].copy() for column in OPTION_CHAIN_COLUMNS if column != 'ticker'}
+            columns['ticker'] = np.full(len(self.keys), self.ticker, dtype=object)
+            return pd.DataFrame(columns, columns=OPTION_CHAIN_COLUMNS)
+
+    # Changes since version: {'version', 'stock_price', 'rows': Dataframe of STREAM_COLUMNS indexed by contract key, 'cone': (days, lower, upper) or None}
+    # keys: optional contract keys (e.g. the rows shown in a table page), other changed rows are left out
+    # The cone (0 to expday_range days ahead) is only included when the stock price changed since version
+    def diff(self, version:int, keys:list=None) -> dict:
+        with self._lock:
+            changed = self.row_version > version
+            if keys is not None:
+                rows = np.array([self._index[key] for key in keys if key in self._index], dtype=np.int64)
+                rows = rows[changed[rows]]
+            else:
+                rows = np.flatnonzero(changed)
+
+            frame = pd.DataFrame({column: self.arrays[column][rows] for column in STREAM_COLUMNS}, index=self.keys[rows])
+
+            cone = None
+            if self.price_version > version:
+                days = np.arange(int(self.expday_range) + 1)
+                lower, upper = prob_cone(self.stock_price, self.hist_volatility, days, self.confidence_lvl, self.trading_periods)
+                cone = (days, np.atleast_1d(lower), np.atleast_1d(upper))
+
+            return {'version': self.version, 'stock_price': self.stock_price, 'rows': frame, 'cone': cone}
+
+# Base class of the tick sources: a thread pushing batches of ticks of the subscribed tickers to on_ticks(ticks), like a websocket feed
+# Subclasses implement poll(), returning the next batch of ticks
+class QuoteSource:
+
+    def __init__(self, interval:float):
+        self.interval = interval
+
+        self.subscriptions = {} # ticker: {'lastPrice', 'bids': {contract key: bid}}
+        self.on_ticks = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Subscribes to the quote of ticker and the bids of its contracts ({contract key: bid})
+    def subscribe(self, ticker:str, stock_price:float, bids:dict):
+        with self._lock:
+            self.subscriptions[ticker] = {'lastPrice': stock_price, 'bids': dict(bids)}
+
+    def unsubscribe(self, ticker:str):
+        with self._lock:
+            self.subscriptions.pop(ticker, None)
+
+    def poll(self) -> list:
+        raise NotImplementedError
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                ticks = self.poll()
+            except Exception: # A failed poll is retried on the next interval
+                continue
+            if ticks and self.on_ticks is not None:
+                self.on_ticks(ticks)
+
+    def start(self, on_ticks):
+        self.on_ticks = on_ticks
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f'tos_stream_{type(self).__name__}', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+# Local stand-in of a streaming quote feed: each poll moves the subscribed stock prices by a random walk step (volatility per tick)
+# and changes the bid of a random share of their contracts (contract_share) by up to bid_move
+class SimulatedQuoteSource(QuoteSource):
+
+    def __init__(self, interval:float=STREAM_INTERVAL['simulated'], seed:int=0, volatility:float=0.001, contract_share:float=0.05, bid_move:float=0.05):
+        super().__init__(interval)
+        self.volatility = volatility
+        self.contract_share = contract_share
+        self.bid_move = bid_move
+        self._rng = np.random.default_rng(seed)
+
+    def poll(self) -> list:
+        ticks = []
+
+        with self._lock:
+            for ticker, subscription in sorted(self.subscriptions.items()):
+                stock_price = round(subscription['lastPrice'] * float(np.exp(self._rng.normal(0, self.volatility))), 2)
+                subscription['lastPrice'] = stock_price
+                ticks.append({'key': ticker, 'lastPrice': stock_price})
+
+                keys = list(subscription['bids'])
+                for i in np.flatnonzero(self._rng.random(len(keys)) < self.contract_share).tolist():
+                    bid = subscription['bids'][keys[i]]
+                    bid = max(0.0, round(bid * (1 + self._rng.uniform(-self.bid_move, self.bid_move)), 2))
+                    subscription['bids'][keys[i]] = bid
+                    ticks.append({'key': keys[i], 'bid': bid})
+
+        return ticks
+
+# Stream source on the TOS REST API: polls the quotes of the subscribed tickers (batched) every interval and their option chains
+# every chain_interval, pushing the quotes and bids that changed
+class PollingQuoteSource(QuoteSource):
+
+    def __init__(self, apiKey:str, interval:float=STREAM_INTERVAL['polling'], chain_interval:float=CHAIN_POLL_INTERVAL):
+        super().__init__(interval)
+        self.apiKey = apiKey
+        self.chain_interval = chain_interval
+        self._polls = 0
+
+    def poll(self) -> list:
+        with self._lock:
+            subscriptions = {ticker: subscription for ticker, subscription in self.subscriptions.items()}
+
+        if not subscriptions:
+            return []
+
+        ticks = []
+        quotes = tos_get_quotes(','.join(sorted(subscriptions)), apiKey=self.apiKey)
+        for ticker, subscription in subscriptions.items():
+            quote = quotes.get(ticker)
+            if isinstance(quote, dict) and quote.get('lastPrice', subscription['lastPrice']) != subscription['lastPrice']:
+                subscription['lastPrice'] = quote['lastPrice']
+                ticks.append({'key': ticker, 'lastPrice': quote['lastPrice']})
+
+        self._polls += 1
+        if self._polls % max(1, round(self.chain_interval / self.interval)) == 0:
+            for ticker, subscription in subscriptions.items():
+                response = tos_get_option_chain(ticker, contractType='ALL', rangeType='ALL', apiKey=self.apiKey)
+                if 'callExpDateMap' not in response:
+                    continue
+                arrays = extract_option_chain(response, np.iinfo(np.int32).max)
+                keys = contract_keys(ticker, arrays['option_type'], arrays['exp_date'], arrays['strike_price'])
+                for key, bid in zip(keys.tolist(), arrays['bid'].tolist()):
+                    if key in subscription['bids'] and subscription['bids'][key] != bid:
+                        subscription['bids'][key] = bid
+                        ticks.append({'key': key, 'bid': bid})
+
+        return ticks
+
+# Routes the ticks of a source to the StreamingChain watched by each browser session
+# At most size sessions are streamed (least recently used ones are dropped first), chains not read for idle_timeout seconds are dropped
+class QuoteStream:
+
+    def __init__(self, source:QuoteSource, size:int=SESSION_CACHE_SIZE, idle_timeout:float=STREAM_IDLE_TIMEOUT):
+        self.source = source
+        self.size = size
+        self.idle_timeout = idle_timeout
+
+        self._chains = OrderedDict() # session: (StreamingChain, last read time), least recently used first
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.source.start(self._on_ticks)
+        return self
+
+    def stop(self):
+        self.source.stop()
+
+    def _on_ticks(self, ticks:list):
+        if self._expire():
+            self._unsubscribe_unwatched()
+        with self._lock:
+            chains = [chain for chain, _ in self._chains.values()]
+        for chain in chains:
+            chain.apply(ticks)
+
+    # Drops the chains over size and those idle for longer than idle_timeout, returns True if any was dropped
+    def _expire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            count = len(self._chains)
+            for session in [session for session, (_, last_read) in self._chains.items() if now - last_read > self.idle_timeout]:
+                del self._chains[session]
+            while len(self._chains) > self.size:
+                self._chains.popitem(last=False)
+            return len(self._chains) < count
+
+    # Drops the subscriptions of tickers no session watches anymore
+    def _unsubscribe_unwatched(self):
+        with self._lock:
+            watched = {chain.ticker for chain, _ in self._chains.values()}
+        for ticker in set(self.source.subscriptions) - watched:
+            self.source.unsubscribe(ticker)
+
+    # Streams chain to session, replacing the chain of its previous Submit
+    # The subscription of its ticker restarts from chain, so sessions watching the same ticker share the newest quotes
+    def watch(self, session:str, chain:StreamingChain):
+        with self._lock:
+            self._chains[session] = (chain, time.monotonic())
+            self._chains.move_to_end(session)
+        self.source.subscribe(chain.ticker, chain.stock_price, chain.contract_bids())
+        self._expire()
+        self._unsubscribe_unwatched()
+
+    def unwatch(self, session:str):
+        with self._lock:
+            self._chains.pop(session, None)
+        self._unsubscribe_unwatched()
+
+    # Chain streamed to session (None if it is not or no longer streamed), reading it keeps it streaming
+    def chain(self, session:str):
+        with self._lock:
+            entry = self._chains.get(session)
+            if entry is None:
+                return None
+            self._chains[session] = (entry[0], time.monotonic())
+            self._chains.move_to_end(session)
+            return entry[0]
+
+# Creates the QuoteStream of a STREAM_SOURCES source, None for 'off'
+def create_quote_stream(source:str, apiKey:str=None, seed:int=0):
+
+    if source == 'off':
+        return None
+    if source == 'simulated':
+        return QuoteStream(SimulatedQuoteSource(seed=seed))
+    if source == 'polling':
+        return QuoteStream(PollingQuoteSource(apiKey))
+
+    raise ValueError(f"Unknown stream source '{source}', expected 'off' or one of {STREAM_SOURCES}.")
@@ -0,0 +1,171 @@
+import re
+import time
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from lib.tos_api_calls import tos_get_quotes, tos_get_option_chain, tos_get_price_hist
+from lib.stats import get_latest_volatility
+from lib.option_chain import OPTION_CHAIN_COLUMNS, process_option_chain, filter_option_chain
+
+# Tickers screened concurrently (requests are still bounded by the API rate limit of lib/tos_client.py)
+SCREENER_WORKERS = 8
+
+# Tickers per quotes request (quotes of a whole watchlist are fetched in a few requests instead of one per ticker)
+QUOTES_BATCH_SIZE = 100
+
+# Merged screener results are ranked by these columns, in descending order
+RANK_COLUMNS = ['roi_val', 'prob_val']
+
+# Splits a watchlist text (tickers separated by commas, spaces or new lines) into unique upper case tickers, in order
+def parse_tickers(text:str) -> list:
+
+    if not text:
+        return []
+
+    return list(dict.fromkeys(ticker.upper() for ticker in re.split(r'[\s,;]+', text) if ticker))
+
+# Last prices of tickers from batched quotes requests, tickers without a quote are left out
+def get_last_prices(tickers:list, apiKey:str) -> dict:
+
+    prices = {}
+
+    for start in range(0, len(tickers), QUOTES_BATCH_SIZE):
+        quotes = tos_get_quotes(','.join(tickers[start:start + QUOTES_BATCH_SIZE]), apiKey=apiKey)
+        prices.update({ticker: quote['lastPrice'] for ticker, quote in quotes.items() if isinstance(quote, dict) and 'lastPrice' in quote})
+
+    return prices
+
+# Fetches and processes the option chain of one ticker, returns its contracts that pass the option chain table filter
+def screen_ticker(ticker:str, stock_price:float, apiKey:str, price_store=None, volatility_period:int=30, vol_est_type:str='log_returns',
+                    expday_range:int=30, confidence_lvl:float=0.7, min_roi:float=0, max_delta:float=1) -> pd.DataFrame:
+
+    if price_store is None:
+        price_df = pd.DataFrame(tos_get_price_hist(ticker, apiKey=apiKey).get('candles', []))
+    else:
+        price_df = price_store.load(ticker, period=1, periodType='year', apiKey=apiKey)
+
+    if price_df is None or len(price_df) <= volatility_period:
+        raise ValueError(f'Not enough price history for a {volatility_period} day volatility window.')
+
+    hist_volatility = get_latest_volatility(price_df, volatility_period, estimator=vol_est_type)
+
+    # Contracts passing the filter are outside of the probability cone, i.e. OTM, so ITM strikes and later expiries are not requested
+    to_date = datetime.date.today() + datetime.timedelta(days=int(expday_range) + 1)
+    option_chain_response = tos_get_option_chain(ticker, contractType='ALL', rangeType='OTM', toDate=to_date, apiKey=apiKey)
+
+    if 'callExpDateMap' not in option_chain_response:
+        raise ValueError(option_chain_response.get('error', 'Invalid option chain response.'))
+
+    df = process_option_chain(option_chain_response, ticker, stock_price, hist_volatility, expday_range, confidence_lvl)
+
+    return filter_option_chain(df, min_roi, max_delta)
+
+# Screens tickers in parallel and returns (merged contracts ranked by RANK_COLUMNS, {ticker: error message})
+# progress: optional function called with (done, total, ticker, error) after each ticker
+# cancel: optional threading.Event, tickers not started yet are skipped once it is set
+def screen_tickers(tickers:list, apiKey:str, price_store=None, volatility_period:int=30, vol_est_type:str='log_returns', expday_range:int=30,
+                    confidence_lvl:float=0.7, min_roi:float=0, max_delta:float=1, workers:int=SCREENER_WORKERS, progress=None, cancel=None) -> tuple:
+
+    errors = {}
+    frames = []
+
+    prices = get_last_prices(tickers, apiKey)
+    for ticker in tickers:
+        if ticker not in prices:
+            errors[ticker] = 'No quote found.'
+
+    def task(ticker):
+        if cancel is not None and cancel.is_set():
+            return None
+        return screen_ticker(ticker, prices[ticker], apiKey, price_store, volatility_period, vol_est_type, expday_range, confidence_lvl, min_roi, max_delta)
+
+    done = len(errors)
+    if progress is not None:
+        progress(done, len(tickers), None, None)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tos_screener') as executor:
+        futures = {executor.submit(task, ticker): ticker for ticker in tickers if ticker in prices}
+
+        for future in as_completed(futures):
+            ticker = futures[future]
+            error = None
+            try:
+                df = future.result()
+                if df is not None:
+                    frames.append(df)
+            except Exception as exception: # One failing ticker does not stop the screen
+                error = errors[ticker] = str(exception) or type(exception).__name__
+
+            done += 1
+            if progress is not None:
+                progress(done, len(tickers), ticker, error)
+
+    if frames:
+        result = pd.concat(frames, ignore_index=True)
+        result = result.sort_values(RANK_COLUMNS, ascending=False, kind='stable', ignore_index=True)
+    else:
+        result = pd.DataFrame(columns=OPTION_CHAIN_COLUMNS)
+
+    return result, errors
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Runs screen_tickers() in a background thread, publishing its progress as the 'screener_progress' dataset of the session
+# in data_store (lib.data_store.DataStore): {'job', 'total', 'done', 'errors', 'finished', 'seconds', 'result'}
+# 'result' is the handle of the 'screener_result' dataset once the screen is finished
+# A new screen of the same session cancels the previous one (within this process), returns the job id
+def start_screen(data_store, session:str, tickers:list, apiKey:str, **kwargs) -> str:
+
+    job = uuid.uuid4().hex
+    cancel = threading.Event()
+    start = time.perf_counter()
+
+    with _jobs_lock:
+        previous = _jobs.get(session)
+        if previous is not None:
+            previous.set()
+        _jobs[session] = cancel
+
+    status = {'job': job, 'total': len(tickers), 'done': 0, 'errors': {}, 'finished': False, 'seconds': 0.0, 'result': None}
+    data_store.put(session, 'screener_progress', dict(status))
+
+    def progress(done, total, ticker, error):
+        # A cancelled screen no longer publishes, its session's progress belongs to the newer screen
+        if cancel.is_set():
+            return
+        status['done'] = done
+        status['seconds'] = time.perf_counter() - start
+        if error is not None:
+            status['errors'][ticker] = error
+        data_store.put(session, 'screener_progress', dict(status))
+
+    def run():
+        try:
+            result, errors = screen_tickers(tickers, apiKey, progress=progress, cancel=cancel, **kwargs)
+            status['errors'] = errors
+            if not cancel.is_set():
+                status['result'] = data_store.put(session, 'screener_result', result)
+        except Exception as exception:
+            status['errors'][''] = str(exception) or type(exception).__name__
+        finally:
+            status['finished'] = True
+            status['seconds'] = time.perf_counter() - start
+            if not cancel.is_set():
+                data_store.put(session, 'screener_progress', dict(status))
+
+            with _jobs_lock:
+                if _jobs.get(session) is cancel:
+                    del _jobs[session]
+
+    threading.Thread(target=run, name=f'tos_screener_{job[:8]}', daemon=True).start()
+
+    return job
+
+# Returns the latest progress of the session's screen, or None if no screen was started
+def screen_progress(data_store, session:str):
+    return data_store.get_dataset(session, 'screener_progress')
@@ -1,9 +1,36 @@
 # pip install mysql-connector-python-rf
-import mysql.connector
-from mysql.connector import Error # Insert new data in MYSQL DB
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import mysql.connector
+    from mysql.connector import Error # Insert new data in MYSQL DB
+except ImportError: # Only needed for MySQL databases, SQLite pools work without it
+    mysql = None
+    Error = sqlite3.Error
+
+# Errors reported (and not raised) by the import/export functions
+DB_ERRORS = (Error, sqlite3.Error)
+
+# Default number of open connections kept per pool
+POOL_SIZE = 5
+
+# Default seconds to wait for a connection when all of them are in use
+POOL_TIMEOUT = 30
+
+# Default number of rows sent per executemany() call and read per fetchmany() call
+BATCH_SIZE = 1000
+CHUNK_SIZE = 10000
 
 # Import Functionality
 def db_connect(db_user, db_pass, db_name, db_url = 'localhost'):
+    if mysql is None:
+        raise ImportError("mysql-connector-python is required for MySQL connections (pip install mysql-connector-python-rf).")
+
     connection = mysql.connector.connect(
         host=db_url,
         database=db_name,
@@ -12,30 +39,232 @@ def db_connect(db_user, db_pass, db_name, db_url = 'localhost'):
     )
     return connection
 
-def sql_import(query, data, user, passwd, db_name):
-    try: 
-        db_conn = db_connect(user, passwd, db_name)
-        cursor = db_conn.cursor()
+# Pool of reusable database connections created by connect() (any DB-API 2.0 connection factory)
+# paramstyle: placeholder used in the queries built by sql_import_frame(), '%s' for MySQL and '?' for SQLite
+# timeout: seconds to wait for a connection when pool_size connections are in use, TimeoutError after that
+class ConnectionPool:
+
+    def __init__(self, connect, pool_size:int=POOL_SIZE, paramstyle:str='%s', timeout:float=POOL_TIMEOUT):
+        self.connect = connect
+        self.pool_size = pool_size
+        self.paramstyle = paramstyle
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        # Reuse the most recently released connection (LIFO), or open a new one while under pool_size
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if create:
+                return self._connect()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f'Connection pool exhausted: all {self.pool_size} connections in use for {self.timeout}s.') from None
+
+        # Connections dropped by the server are replaced, keeping their slot in the pool
+        if hasattr(conn, 'is_connected') and not conn.is_connected():
+            self._close(conn)
+            conn = self._connect()
+
+        return conn
+
+    # Opens the connection of a slot already counted in _created, the slot is freed if connect() fails
+    def _connect(self):
+        try:
+            return self.connect()
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception: # Broken connections may fail to close
+            pass
+
+    def _release(self, conn):
+        self._idle.put_nowait(conn)
+
+    # Closes a broken connection instead of releasing it, a new one is opened in its place on demand
+    def _discard(self, conn):
+        self._close(conn)
+        with self._lock:
+            self._created -= 1
+
+    # Borrows a connection for the duration of a with block, uncommitted changes are rolled back on errors
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception: # Rollbacks fail on broken connections, which are dropped
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Returns the shared MySQL connection pool of (user, db_name, db_url), created on first use
+def get_pool(user, passwd, db_name, db_url = 'localhost', pool_size:int=POOL_SIZE) -> ConnectionPool:
+
+    key = (db_url, db_name, user)
+
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(lambda: db_connect(user, passwd, db_name, db_url), pool_size, paramstyle='%s')
+        return _pools[key]
+
+# Returns a connection pool of a SQLite database file, a local stand-in for the MySQL database
+def create_sqlite_pool(database:str, pool_size:int=POOL_SIZE) -> ConnectionPool:
+
+    return ConnectionPool(lambda: sqlite3.connect(database, check_same_thread=False), pool_size, paramstyle='?')
+
+def _pool(user, passwd, db_name, pool):
+    return pool if pool is not None else get_pool(user, passwd, db_name)
+
+def sql_import(query, data, user=None, passwd=None, db_name=None, pool=None):
+    try:
+        with _pool(user, passwd, db_name, pool).connection() as db_conn:
+            cursor = db_conn.cursor()
 
-        print('Executing Query...')
-        cursor.execute(query, data)
+            print('Executing Query...')
+            cursor.execute(query, data)
 
-        # Make sure data is committed to the database
-        db_conn.commit()
-        db_conn.close()
+            # Make sure data is committed to the database
+            db_conn.commit()
+            cursor.close()
 
         print('Data Import Status: Successful!')
-        return 
-    except Error as error:
+        return
+    except DB_ERRORS as error:
         print(error)
 
-def sql_export(query, user, passwd, db_name):
-    try: 
-        db_conn = db_connect(user, passwd, db_name)
-        cursor = db_conn.cursor()
-        cursor.execute(query)
-        data = cursor.fetchall()
-        db_conn.close()
+# Inserts rows (iterable of tuples) with one executemany() call and one commit per batch_size rows, returns the number of rows inserted
+# MySQL Connector rewrites executemany() of an INSERT into multi-row INSERT statements
+def sql_import_many(query, rows, user=None, passwd=None, db_name=None, batch_size:int=BATCH_SIZE, pool=None) -> int:
+
+    inserted = 0
+
+    try:
+        with _pool(user, passwd, db_name, pool).connection() as db_conn:
+            cursor = db_conn.cursor()
+            batch = []
+
+            for row in rows:
+                batch.append(row)
+                if len(batch) == batch_size:
+                    cursor.executemany(query, batch)
+                    db_conn.commit()
+                    inserted += len(batch)
+                    batch = []
+
+            if batch:
+                cursor.executemany(query, batch)
+                db_conn.commit()
+                inserted += len(batch)
+
+            cursor.close()
+    except DB_ERRORS as error:
+        print(error)
+
+    return inserted
+
+# Inserts the rows of a Dataframe into table (columns named after the Dataframe columns), returns the number of rows inserted
+# NaN/NaT values are inserted as NULL
+def sql_import_frame(table:str, df:pd.DataFrame, user=None, passwd=None, db_name=None, batch_size:int=BATCH_SIZE, pool=None) -> int:
+
+    pool = _pool(user, passwd, db_name, pool)
+
+    columns = ', '.join(str(column) for column in df.columns)
+    placeholders = ', '.join([pool.paramstyle] * len(df.columns))
+    query = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+
+    # Rows are converted one batch at a time into Python values, which both database drivers accept
+    def rows():
+        for start in range(0, len(df), batch_size):
+            batch = df.iloc[start:start + batch_size]
+            values = [batch[column].astype(object).where(batch[column].notna(), None).tolist() for column in batch.columns]
+            yield from zip(*values)
+
+    return sql_import_many(query, rows(), batch_size=batch_size, pool=pool)
+
+def sql_export(query, user=None, passwd=None, db_name=None, pool=None):
+    try:
+        with _pool(user, passwd, db_name, pool).connection() as db_conn:
+            cursor = db_conn.cursor()
+            cursor.execute(query)
+            data = cursor.fetchall()
+            cursor.close()
         return data
-    except Error as error:
-        print(error)
\ No newline at end of file
+    except DB_ERRORS as error:
+        print(error)
+
+# Runs query and yields (column names, list of row tuples) per fetchmany() call of chunk_size rows
+def _export_chunks(query, params, pool, chunk_size):
+
+    with pool.connection() as db_conn:
+        cursor = db_conn.cursor()
+        try:
+            if params is None:
+                cursor.execute(query)
+            else:
+                cursor.execute(query, params)
+
+            columns = [description[0] for description in cursor.description]
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield columns, rows
+        finally:
+            # Rows left unread by a generator closed early must be consumed before the MySQL connection can be reused
+            if hasattr(db_conn, 'consume_results'):
+                db_conn.consume_results()
+            cursor.close()
+
+# Streams the result rows of query with fetchmany(), holding at most chunk_size rows in memory
+# Yields lists of row tuples; the pooled connection is returned once the generator is exhausted or closed
+def sql_export_chunks(query, params=None, user=None, passwd=None, db_name=None, chunk_size:int=CHUNK_SIZE, pool=None):
+
+    for _, rows in _export_chunks(query, params, _pool(user, passwd, db_name, pool), chunk_size):
+        yield rows
+
+# Same as sql_export_chunks(), yielding one row tuple at a time
+def sql_export_iter(query, params=None, user=None, passwd=None, db_name=None, chunk_size:int=CHUNK_SIZE, pool=None):
+
+    for _, rows in _export_chunks(query, params, _pool(user, passwd, db_name, pool), chunk_size):
+        yield from rows
+
+# Same as sql_export_chunks(), yielding Dataframes of up to chunk_size rows named after the result columns
+def sql_export_frames(query, params=None, user=None, passwd=None, db_name=None, chunk_size:int=CHUNK_SIZE, pool=None):
+
+    for columns, rows in _export_chunks(query, params, _pool(user, passwd, db_name, pool), chunk_size):
+        yield pd.DataFrame.from_records(rows, columns=columns)
@@ -1,33 +1,68 @@
 import math
+from collections import deque
 import numpy as np
 import pandas as pd 
-import scipy.stats as st
+
+from lib.lazy_import import lazy_module
+
+# Standard normal cdf (ndtr) and quantile function (ndtri), the same functions scipy.stats.norm uses without loading scipy.stats
+special = lazy_module('scipy.special')
+
+# Rounds an array of floats to the same values as Python's built-in round()
+# np.round scales by 10**decimals first, which can round values sitting on a .5 tie the other way, so ties are redone with round()
+def array_round(values, decimals:int=0):
+
+    values = np.asarray(values, dtype=float)
+    rounded = np.atleast_1d(np.round(values, decimals))
+
+    scaled = np.atleast_1d(values) * 10.0**decimals
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+
+    if near_tie.any():
+        rounded[near_tie] = [round(value, decimals) for value in np.atleast_1d(values)[near_tie].tolist()]
+
+    return rounded.reshape(values.shape)
+
+# Returns 0-d arrays as Python floats, so scalar inputs keep returning scalars
+def _scalar_or_array(values):
+
+    if np.ndim(values) == 0:
+        return float(values)
+    return values
 
 # Calculates the upper and lower bound for the underlying spot price based on volatility
 # probability param: if probability=0.7, probability of stock price in prob_cone is 70%
-def prob_cone(stock_price:float, volatility:float, days_ahead:int, probability=0.7, trading_periods:int=252) -> tuple:
+# All params broadcast against each other, e.g. days_ahead=np.arange(29) returns the whole cone and
+# probability=np.array([[0.3], [0.7]]) with the same days_ahead returns a (2, 29) fan of cones
+def prob_cone(stock_price, volatility, days_ahead, probability=0.7, trading_periods:int=252) -> tuple:
 
     # z_score param indicates the number of std deviations from the mean (i.e. 1.5 std dev covers about 87%)
     # Source: https://stackoverflow.com/questions/20864847/probability-to-z-score-and-vice-versa
-    z_score = st.norm.ppf(1-((1-probability)/2))
+    z_score = special.ndtri(1-((1-np.asarray(probability, dtype=float))/2))
 
     # Source: https://www.biocrudetech.com/index.php?option=com_blankcomponent&view=default&Itemid=670
-    std_dev = z_score * stock_price * volatility * math.sqrt(days_ahead/trading_periods)
+    std_dev = z_score * stock_price * volatility * np.sqrt(np.asarray(days_ahead, dtype=float)/trading_periods)
 
-    upper_bound = round(stock_price + std_dev, 2)
-    lower_lound = round(stock_price - std_dev, 2)
+    upper_bound = array_round(stock_price + std_dev, 2)
+    lower_lound = array_round(stock_price - std_dev, 2)
 
-    return (lower_lound,upper_bound)
+    return (_scalar_or_array(lower_lound), _scalar_or_array(upper_bound))
 
-def get_prob(stock_price:float, strike_price:float, volatility:float, days_ahead:int, trading_periods:int=252) -> float:
+# Probability that the spot price stays within the strike price distance, 0 where any param is 0
+# All params broadcast against each other (e.g. arrays of strikes and days to expiry of an option chain)
+def get_prob(stock_price, strike_price, volatility, days_ahead, trading_periods:int=252):
 
-    if None or 0 not in (stock_price, strike_price, volatility, days_ahead):        
+    stock_price, strike_price, volatility, days_ahead = np.broadcast_arrays(*[np.asarray(param, dtype=float) for param in (stock_price, strike_price, volatility, days_ahead)])
 
-        z_score = abs(stock_price - strike_price)/(stock_price * volatility * math.sqrt(days_ahead/trading_periods))
+    valid = (stock_price != 0) & (strike_price != 0) & (volatility != 0) & (days_ahead != 0)
 
-        return 2 * st.norm.cdf(z_score) - 1
-    else:
-        return 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_score = np.abs(stock_price - strike_price)/(stock_price * volatility * np.sqrt(days_ahead/trading_periods))
+
+    return _scalar_or_array(np.where(valid, 2 * special.ndtr(z_score) - 1, 0.0))
+
+# Volatility estimators supported by get_hist_volatility and get_hist_volatility_matrix
+VOL_ESTIMATORS = ['log_returns', 'garman_klass', 'hodges_tompkins', 'parkinson', 'rogers_satchell', 'yang_zhang']
 
 # Calculates annualized historical volatility using log returns to return Pandas Series
 def get_hist_volatility(price_df, window=30, estimator='log_returns', trading_periods:int=252, clean=True):
@@ -65,11 +100,9 @@ def get_hist_volatility(price_df, window=30, estimator='log_returns', trading_pe
         log_co = (price_df['close'] / price_df['open']).apply(np.log)
 
         rs = 0.5 * log_hl**2 - (2*math.log(2)-1) * log_co**2
-        
-        def f(v):
-            return (trading_periods * v.mean())**0.5
-        
-        result = rs.rolling(window=window, center=False).apply(func=f)
+
+        # Rolling mean is computed by pandas' windowed sum kernel instead of calling back into Python per window
+        result = np.sqrt(trading_periods * rs.rolling(window=window, center=False).mean())
 
     elif estimator =='hodges_tompkins':
         log_return = (price_df['close'] / price_df['close'].shift(1)).apply(np.log)
@@ -89,13 +122,10 @@ def get_hist_volatility(price_df, window=30, estimator='log_returns', trading_pe
     elif estimator =='parkinson':
         rs = (1.0 / (4.0 * math.log(2.0))) * ((price_df['high'] / price_df['low']).apply(np.log))**2.0
 
-        def f(v):
-            return (trading_periods * v.mean())**0.5
-        
-        result = rs.rolling(
+        result = np.sqrt(trading_periods * rs.rolling(
             window=window,
             center=False
-        ).apply(func=f)
+        ).mean())
 
     elif estimator =='rogers_satchell':
         log_ho = (price_df['high'] / price_df['open']).apply(np.log)
@@ -104,13 +134,10 @@ def get_hist_volatility(price_df, window=30, estimator='log_returns', trading_pe
         
         rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
 
-        def f(v):
-            return (trading_periods * v.mean())**0.5
-        
-        result = rs.rolling(
+        result = np.sqrt(trading_periods * rs.rolling(
             window=window,
             center=False
-        ).apply(func=f)
+        ).mean())
 
     elif estimator =='yang_zhang':
         log_ho = (price_df['high'] / price_df['open']).apply(np.log)
@@ -144,4 +171,208 @@ def get_hist_volatility(price_df, window=30, estimator='log_returns', trading_pe
     if clean:
         return result.dropna()
     else:
-        return result
\ No newline at end of file
+        return result
+
+# Calculates annualized historical volatility of several estimators and windows in one pass, returning a NumPy array of shape
+# (len(estimators), len(windows), len(price_df)) where [i, j] is get_hist_volatility(price_df, windows[j], estimators[i], clean=False)
+# Log returns and high/low/open/close ratios are computed once, and the rolling sums of every range based term share one call per window
+def get_hist_volatility_matrix(price_df, windows, estimators=None, trading_periods:int=252) -> np.ndarray:
+
+    if estimators is None:
+        estimators = VOL_ESTIMATORS
+
+    unknown = [estimator for estimator in estimators if estimator not in VOL_ESTIMATORS]
+    if unknown:
+        raise ValueError(f"Unknown volatility estimator(s) {unknown}, expected one of {VOL_ESTIMATORS}.")
+
+    log_hl = np.log(price_df['high'] / price_df['low'])
+    log_ho = np.log(price_df['high'] / price_df['open'])
+    log_lo = np.log(price_df['low'] / price_df['open'])
+    log_co = np.log(price_df['close'] / price_df['open'])
+    log_oc = np.log(price_df['open'] / price_df['close'].shift(1))
+    log_cc = np.log(price_df['close'] / price_df['close'].shift(1))
+
+    terms = pd.DataFrame({
+        'garman_klass': 0.5 * log_hl**2 - (2*math.log(2)-1) * log_co**2,
+        'parkinson': (1.0 / (4.0 * math.log(2.0))) * log_hl**2.0,
+        'rogers_satchell': log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co),
+        'open_sq': log_oc**2,
+        'close_sq': log_cc**2,
+    })
+
+    n_returns = log_cc.count()
+    matrix = np.full((len(estimators), len(windows), len(price_df)), np.nan)
+
+    for j, window in enumerate(windows):
+
+        # Rolling mean of pandas is the rolling sum divided by the window length, so both come from a single rolling sum
+        window_sum = terms.rolling(window=window, center=False).sum()
+
+        if 'log_returns' in estimators or 'hodges_tompkins' in estimators:
+            close_to_close = log_cc.rolling(window=window, center=False).std() * math.sqrt(trading_periods)
+
+        for i, estimator in enumerate(estimators):
+
+            if estimator == 'log_returns':
+                vol = close_to_close
+
+            elif estimator == 'hodges_tompkins':
+                h = window
+                n = (n_returns - h) + 1
+                vol = close_to_close * (1.0 / (1.0 - (h / n) + ((h**2 - 1) / (3 * n**2))))
+
+            elif estimator in ('garman_klass', 'parkinson', 'rogers_satchell'):
+                vol = np.sqrt(trading_periods * (window_sum[estimator] / window))
+
+            elif estimator == 'yang_zhang':
+                k = 0.34 / (1.34 + (window + 1) / (window - 1))
+                open_vol = window_sum['open_sq'] * (1.0 / (window - 1.0))
+                close_vol = window_sum['close_sq'] * (1.0 / (window - 1.0))
+                window_rs = window_sum['rogers_satchell'] * (1.0 / (window - 1.0))
+                vol = np.sqrt(open_vol + k * close_vol + (1 - k) * window_rs) * math.sqrt(trading_periods)
+
+            matrix[i, j] = vol.to_numpy()
+
+    return matrix
+
+# Calculates the latest annualized historical volatility only (same value as get_hist_volatility(...).iloc[-1])
+# Only the last window + 1 candles are used, so the cost does not grow with the length of the price history
+def get_latest_volatility(price_df, window=30, estimator='log_returns', trading_periods:int=252) -> float:
+
+    if estimator not in VOL_ESTIMATORS:
+        raise ValueError(f"Unknown volatility estimator '{estimator}', expected one of {VOL_ESTIMATORS}.")
+
+    # Close to close estimators need the close before the first candle of the window
+    tail_df = price_df.iloc[-(window + 1):].reset_index(drop=True)
+
+    if estimator == 'hodges_tompkins':
+        # The adjustment factor depends on the number of log returns of the whole history, not only those of the window
+        vol = get_hist_volatility(tail_df, window, estimator='log_returns', trading_periods=trading_periods, clean=False).iloc[-1]
+
+        h = window
+        n = (price_df['close'].count() - 1 - h) + 1
+
+        return float(vol * (1.0 / (1.0 - (h / n) + ((h**2 - 1) / (3 * n**2)))))
+
+    return float(get_hist_volatility(tail_df, window, estimator=estimator, trading_periods=trading_periods, clean=False).iloc[-1])
+
+# Streaming annualized historical volatility estimator: update() takes one candle and returns the volatility over the last window candles in O(1)
+# Matches get_hist_volatility(...).iloc[-1] over the same candles, e.g. to keep the volatility of a watchlist current as candles arrive
+# Window means are updated Welford-style (adding the new term and removing the oldest), never from running sums of squares
+class OnlineVolatility:
+
+    def __init__(self, window:int=30, estimator:str='log_returns', trading_periods:int=252):
+
+        if estimator not in VOL_ESTIMATORS:
+            raise ValueError(f"Unknown volatility estimator '{estimator}', expected one of {VOL_ESTIMATORS}.")
+
+        self.window = window
+        self.estimator = estimator
+        self.trading_periods = trading_periods
+
+        self._terms = deque()
+        self._means = None  # Mean of each term over the window
+        self._m2 = 0.0      # Sum of squared deviations of the log returns from their window mean (log_returns, hodges_tompkins)
+        self._prev_close = None
+
+        # Number of log returns seen (used by the Hodges Tompkins adjustment factor)
+        self.n_returns = 0
+        self.value = float('nan')
+
+    # Creates an estimator seeded with the last window + 1 candles of a price history (open, high, low, close columns)
+    @classmethod
+    def from_price_df(cls, price_df, window:int=30, estimator:str='log_returns', trading_periods:int=252):
+
+        online_vol = cls(window, estimator, trading_periods)
+
+        for candle in price_df.iloc[-(window + 1):][['open', 'high', 'low', 'close']].itertuples(index=False):
+            online_vol.update(*candle)
+
+        online_vol.n_returns = price_df['close'].count() - 1
+        online_vol.value = online_vol._volatility()
+
+        return online_vol
+
+    # Per candle terms whose window sums give the estimator
+    def _candle_terms(self, open_price, high, low, close) -> tuple:
+
+        log_cc = math.log(close / self._prev_close) if self._prev_close is not None else None
+
+        if self.estimator in ('log_returns', 'hodges_tompkins'):
+            return None if log_cc is None else (log_cc,)
+
+        log_hl = math.log(high / low)
+        log_co = math.log(close / open_price)
+
+        if self.estimator == 'garman_klass':
+            return (0.5 * log_hl**2 - (2*math.log(2)-1) * log_co**2,)
+        elif self.estimator == 'parkinson':
+            return ((1.0 / (4.0 * math.log(2.0))) * log_hl**2.0,)
+
+        log_ho = math.log(high / open_price)
+        log_lo = math.log(low / open_price)
+        rs = log_ho * (log_ho - log_co) + log_lo * (log_lo - log_co)
+
+        if self.estimator == 'rogers_satchell':
+            return (rs,)
+
+        # yang_zhang
+        if log_cc is None:
+            return None
+        log_oc = math.log(open_price / self._prev_close)
+        return (log_oc**2, log_cc**2, rs)
+
+    def _volatility(self) -> float:
+
+        if len(self._terms) < self.window:
+            return float('nan')
+
+        window = self.window
+
+        if self.estimator in ('log_returns', 'hodges_tompkins'):
+            variance = max(self._m2 / (window - 1), 0.0)
+            vol = math.sqrt(variance) * math.sqrt(self.trading_periods)
+
+            if self.estimator == 'hodges_tompkins':
+                h = window
+                n = (self.n_returns - h) + 1
+                vol = vol * (1.0 / (1.0 - (h / n) + ((h**2 - 1) / (3 * n**2))))
+
+            return vol
+
+        elif self.estimator == 'yang_zhang':
+            open_vol, close_vol, window_rs = [mean * window / (window - 1.0) for mean in self._means]
+            k = 0.34 / (1.34 + (window + 1) / (window - 1))
+            return math.sqrt(open_vol + k * close_vol + (1 - k) * window_rs) * math.sqrt(self.trading_periods)
+
+        return math.sqrt(self.trading_periods * max(self._means[0], 0.0))
+
+    # Adds a candle and returns the updated volatility (NaN until a full window of candles has been seen)
+    def update(self, open_price:float, high:float, low:float, close:float) -> float:
+
+        terms = self._candle_terms(open_price, high, low, close)
+        if self._prev_close is not None:
+            self.n_returns += 1
+        self._prev_close = close
+
+        if terms is None:
+            return self.value
+
+        if self._means is None:
+            self._means = [0.0] * len(terms)
+
+        self._terms.append(terms)
+        previous_means = self._means
+
+        if len(self._terms) > self.window:
+            # Sliding window: the new term replaces the oldest one
+            removed = self._terms.popleft()
+            self._means = [mean + (term - old) / self.window for mean, term, old in zip(previous_means, terms, removed)]
+            self._m2 += (terms[0] - removed[0]) * (terms[0] - self._means[0] + removed[0] - previous_means[0])
+        else:
+            count = len(self._terms)
+            self._means = [mean + (term - mean) / count for mean, term in zip(previous_means, terms)]
+            self._m2 += (terms[0] - previous_means[0]) * (terms[0] - self._means[0])
+
+        self.value = self._volatility()
+        return self.value
@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lib.option_chain import contract_keys
+
+# Filtered tables kept per query cache (least recently used tables are dropped first)
+QUERY_CACHE_SIZE = 32
+
+# Sort orders kept per table (single column orders are always kept)
+SORT_CACHE_SIZE = 16
+
+# Sorts and pages the rows of a filtered option chain (OPTION_CHAIN_COLUMNS ids) for a Dash DataTable with custom paging/sorting
+# Columns keep their dtypes, sort orders are computed once per column from dense ranks and combined for multi-column sorts,
+# so a page of a sorted table is only a slice of a cached permutation
+class TableQuery:
+
+    def __init__(self, df:pd.DataFrame, columns:list=None):
+        self.df = df.reset_index(drop=True) if columns is None else df[list(columns)].reset_index(drop=True)
+
+        self._ranks = {}                # column: dense rank of each row (ascending, NaN ranked last)
+        self._orders = OrderedDict()    # ((column, direction), ...): row permutation
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def _rank(self, column:str) -> np.ndarray:
+        rank = self._ranks.get(column)
+        if rank is None:
+            values = self.df[column]
+            rank = self._ranks[column] = values.rank(method='dense', na_option='bottom').to_numpy(dtype=np.int64)
+        return rank
+
+    # Row permutation of sort_by (DataTable sort_by: [{'column_id', 'direction'}]), stable like DataFrame.sort_values with NaN last
+    def order(self, sort_by:list) -> np.ndarray:
+        key = tuple((sort['column_id'], sort['direction']) for sort in sort_by)
+
+        with self._lock:
+            order = self._orders.get(key)
+            if order is not None:
+                self._orders.move_to_end(key)
+                return order
+
+            # np.lexsort sorts by the last key first and is stable, descending columns sort by negated ranks with NaN kept last
+            sort_keys = []
+            for column, direction in reversed(key):
+                rank = self._rank(column)
+                if direction != 'asc':
+                    nan_rank = rank.max(initial=0) if self.df[column].isna().any() else None
+                    rank = np.where(rank == nan_rank, np.iinfo(np.int64).max, -rank) if nan_rank is not None else -rank
+                sort_keys.append(rank)
+
+            order = np.lexsort(sort_keys) if sort_keys else np.arange(len(self.df))
+
+            self._orders[key] = order
+            multi_column = [cached for cached in self._orders if len(cached) > 1]
+            if len(multi_column) > SORT_CACHE_SIZE:
+                del self._orders[multi_column[0]]
+
+            return order
+
+    # Rows of a page as DataTable records, with the contract key as row id (see lib.option_chain.contract_keys)
+    def records(self, page_current:int, page_size:int, sort_by:list) -> list:
+        rows = self.order(sort_by or [])[page_current*page_size:(page_current + 1)*page_size]
+        page = self.df.take(rows)
+
+        records = page.to_dict('records')
+        for record, key in zip(records, contract_keys(page['ticker'].to_numpy(), page['option_type'].to_numpy(), page['exp_date'].to_numpy(), page['strike_price'].to_numpy())):
+            record['id'] = key
+
+        return records
+
+# LRU cache of TableQuery objects per key (e.g. the dataset version and filters the table was built from)
+class QueryCache:
+
+    def __init__(self, size:int=QUERY_CACHE_SIZE):
+        self.size = size
+
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the cached query of key, or the one returned by build() (None results are not cached)
+    def get(self, key, build):
+        with self._lock:
+            query = self._queries.get(key)
+            if query is not None:
+                self._queries.move_to_end(key)
+                return query
+
+        query = build()
+        if query is None:
+            return None
+
+        with self._lock:
+            self._queries[key] = query
+            while len(self._queries) > self.size:
+                self._queries.popitem(last=False)
+
+        return query
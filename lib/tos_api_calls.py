@@ -1,5 +1,37 @@
-import requests
+import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from lib.tos_cache import response_cache
+from lib.tos_client import tos_request
+from lib.metrics import API_CALL_SECONDS
+
+# Thread pool for concurrent API requests (network bound, the GIL is released while waiting on responses)
+FETCH_WORKERS = 8
+_fetch_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix='tos_fetch')
+
+# Makes a GET request to the TOS API and returns the JSON response, serving repeated requests from the response cache
+# endpoint_type selects the TTL of the cached response (see CACHE_TTL in lib/tos_cache.py)
+def _cached_get_json(endpoint_type:str, endpoint:str, payload:dict):
+
+    start = time.perf_counter()
+
+    found, data = response_cache.get(endpoint_type, endpoint, payload)
+    if found:
+        API_CALL_SECONDS.observe(time.perf_counter() - start, endpoint_type, 'hit')
+        return data
+
+    # Make a request (pooled session with timeouts and retries)
+    content = tos_request(endpoint_type, endpoint, payload)
+    data = content.json()
+
+    # Error responses are not cached so the next call retries the API
+    if content.status_code == 200 and not (isinstance(data, dict) and 'error' in data):
+        response_cache.put(endpoint_type, endpoint, payload, data, len(content.content))
+
+    API_CALL_SECONDS.observe(time.perf_counter() - start, endpoint_type, 'miss')
+
+    return data
 
 # TOS API call to get close 1Y price history of specified ticker symbol, outputs list of close prices 
 def tos_get_price_hist(ticker_symbol:str, period=1, periodType='year', frequencyType='daily', frequency=1, startDate=None, endDate=None, apiKey=None):
@@ -11,23 +43,26 @@ def tos_get_price_hist(ticker_symbol:str, period=1, periodType='year', frequency
     endpoint = f'https://api.tdameritrade.com/v1/marketdata/{ticker_symbol}/pricehistory'
 
     if isinstance(startDate,datetime.datetime) and isinstance(endDate,datetime.datetime):
-        startDate = startDate.timestamp() * 1000 # convert date time object into milliseconds before epoch format
-        endDate = endDate.timestamp() * 1000  
+        startDate = int(startDate.timestamp() * 1000) # convert date time object into milliseconds before epoch format
+        endDate = int(endDate.timestamp() * 1000)
+
+    # A date range replaces the period, the API rejects requests with both
+    if startDate is not None and endDate is not None:
+        period = None
 
     payload = {'apikey':apiKey, 
                 'periodType':periodType,                   # Values: day (default), month, year, or ytd (year to date)
                 'period':period,                           # Values: (periodType = 'day') 1, 2, 3, 4, 5, 10* (periodType = 'month') 1*, 2, 3, 6 (periodType = 'year') 1*, 2, 3, 5, 10, 15, 20 (periodType = 'ytd') 1*
                 'frequencyType':frequencyType,             # Values: (periodType = 'day') minute*, (periodType = 'month') daily, weekly*, (periodType = 'year') daily, weekly, monthly*, (periodType = 'ytd') daily, weekly*
                 'frequency':frequency,                     # Values: (frequencyType = 'minute') 1*, 5, 10, 15, 30, (frequencyType = 'daily') 1*, (frequencyType = 'weekly') 1*, (frequencyType = 'monthly') 1*
-                'endDate':startDate,                       # in milliseconds since epoch
-                'startDate':endDate,                       # in milliseconds since epoch
+                'startDate':startDate,                     # in milliseconds since epoch
+                'endDate':endDate,                         # in milliseconds since epoch
                 'needExtendedHoursData': True
                 }
 
-    # Make a request
-    content = requests.get(url = endpoint, params = payload)
+    endpoint_type = 'pricehistory_intraday' if frequencyType == 'minute' else 'pricehistory_daily'
 
-    return content.json()
+    return _cached_get_json(endpoint_type, endpoint, payload)
 
 # TOS API call to get real-time quote data for multiple tickers
 def tos_get_quotes(ticker_symbols:str, apiKey=None): 
@@ -43,10 +78,7 @@ def tos_get_quotes(ticker_symbols:str, apiKey=None):
         'symbol':ticker_symbols
     }
 
-     # Make a request
-    content = requests.get(url = endpoint, params = payload)
-
-    return content.json()
+    return _cached_get_json('quotes', endpoint, payload)
 
 # TOS API call to search or retrieve instrument data, including fundamental data.
 def tos_search(symbol:str, projection='desc-search', apiKey=None): 
@@ -63,17 +95,19 @@ def tos_search(symbol:str, projection='desc-search', apiKey=None):
         'projection': projection
     }
 
-     # Make a request
-    content = requests.get(url = endpoint, params = payload)
-
-    return content.json()
+    return _cached_get_json('instruments', endpoint, payload)
 
 # Makes API call and returns a list of historical prices of the specified ticker
-def tos_load_price_hist(ticker_symbol:str, period=1, startDate=None, endDate=None, apiKey=None) -> list:
+# price_store: optional lib.price_store.PriceStore serving the last period years of daily candles (when no date range is given)
+def tos_load_price_hist(ticker_symbol:str, period=1, startDate=None, endDate=None, apiKey=None, price_store=None) -> list:
 
     if apiKey is None:
             raise ValueError("TOS Option API Key is not defined.")
 
+    if price_store is not None and startDate is None and endDate is None:
+        price_df = price_store.load(ticker_symbol, period=period, periodType='year', apiKey=apiKey)
+        return [] if price_df is None else price_df['close'].tolist()
+
     price_ls = []
 
     data = tos_get_price_hist(ticker_symbol, period=period, startDate=startDate, endDate=endDate, apiKey=apiKey)
@@ -84,7 +118,8 @@ def tos_load_price_hist(ticker_symbol:str, period=1, startDate=None, endDate=Non
     return price_ls
 
 # TOS API call to get OTM option type (Call/Put)
-def tos_get_option_chain(ticker_symbol:str, contractType='ALL', rangeType='OTM', apiKey=None):
+# toDate: optional last expiry date (datetime.date or 'yyyy-MM-dd'), later expiries are left out of the response
+def tos_get_option_chain(ticker_symbol:str, contractType='ALL', rangeType='OTM', toDate=None, apiKey=None):
 
     if apiKey is None:
         raise ValueError("TOS Option API Key is not defined.")
@@ -92,6 +127,9 @@ def tos_get_option_chain(ticker_symbol:str, contractType='ALL', rangeType='OTM',
     # Price History
     endpoint = 'https://api.tdameritrade.com/v1/marketdata/chains'
 
+    if isinstance(toDate, datetime.date):
+        toDate = toDate.isoformat()
+
     payload = {'apikey':apiKey, 
                 'symbol':ticker_symbol,
                 'contractType':contractType,               # Values: CALL, PUT, ALL*
@@ -99,15 +137,12 @@ def tos_get_option_chain(ticker_symbol:str, contractType='ALL', rangeType='OTM',
                 'strategy':'SINGLE',                        # Values: SINGLE, ANALYTICAL, COVERED, VERTICAL, CALENDAR, STRANGLE, STRADDLE, BUTTERFLY, CONDOR, DIAGONAL, COLLAR, ROLL
                 'range':rangeType,                             # Values: ITM, NTM (Near-the-money), OTM, SAK (Strikes Above Market), SBK (Strikes Below Market), SNK (Strikes Near Market), ALL (All Strikes)
                 'fromDate':None,                           # Values: Valid ISO-8601 formats are: yyyy-MM-dd and yyyy-MM-dd'T'HH:mm:ssz.'
-                'toDate':None,                             # Values: Valid ISO-8601 formats are: yyyy-MM-dd and yyyy-MM-dd'T'HH:mm:ssz.'
+                'toDate':toDate,                           # Values: Valid ISO-8601 formats are: yyyy-MM-dd and yyyy-MM-dd'T'HH:mm:ssz.'
                 'expMonth':'ALL',                          # Values: (frequencyType = 'minute') 1*, 5, 10, 15, 30, (frequencyType = 'daily') 1*, (frequencyType = 'weekly') 1*, (frequencyType = 'monthly') 1*
                 'optionType':'S'                           # Values: S (Standard contracts), NS (Non-standard contracts), ALL (All contracts)
                 }
 
-    # Make a request
-    content = requests.get(url = endpoint, params = payload)
-
-    return content.json()    
+    return _cached_get_json('chains', endpoint, payload)
 
 # TOS API call to get fundamental data using Ticker symbol 
 def tos_get_fundamental_data(ticker_symbol:str, apiKey=None, search='fundamental', raw=False):
@@ -122,15 +157,32 @@ def tos_get_fundamental_data(ticker_symbol:str, apiKey=None, search='fundamental
                 'symbol':ticker_symbol,
                 'projection':search,               # Values: symbol-search, symbol-regex, desc-search, desc-regex, fundamental
                 }
-    
-    # Make a request
-    content = requests.get(url = endpoint, params = payload)
 
     if raw:
-        return content
+        # Raw responses are returned as is without caching
+        return tos_request('fundamental', endpoint, payload)
     else:
-        return content.json() 
+        return _cached_get_json('fundamental', endpoint, payload)
     
 
+# TOS API calls to get the 1Y daily price history, quote and full option chain of a ticker symbol concurrently
+# Returns (price history Dataframe, quotes, option chain) responses, the total wait is that of the slowest request
+# The price history has the columns of pd.DataFrame(response['candles']) and is empty if there is no data
+# price_store: optional lib.price_store.PriceStore the price history is loaded from (only fetching its newest candles)
+def tos_get_ticker_data(ticker_symbol:str, apiKey=None, price_store=None) -> tuple:
+
+    if apiKey is None:
+        raise ValueError("TOS Option API Key is not defined.")
+
+    def price_history():
+        if price_store is None:
+            return pd.DataFrame(tos_get_price_hist(ticker_symbol, apiKey=apiKey).get('candles', []))
+
+        price_df = price_store.load(ticker_symbol, period=1, periodType='year', apiKey=apiKey)
+        return pd.DataFrame() if price_df is None else price_df
 
+    hist_future = _fetch_executor.submit(price_history)
+    quotes_future = _fetch_executor.submit(tos_get_quotes, ticker_symbol, apiKey=apiKey)
+    option_chain_future = _fetch_executor.submit(tos_get_option_chain, ticker_symbol, contractType='ALL', rangeType='ALL', apiKey=apiKey)
 
+    return hist_future.result(), quotes_future.result(), option_chain_future.result()
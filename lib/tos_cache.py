@@ -0,0 +1,103 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Time-to-live (in seconds) of cached TOS API responses per endpoint
+CACHE_TTL = {
+    'quotes': 5,                            # Real-time quotes
+    'chains': 30,                           # Option chains (quotes of every contract)
+    'pricehistory_intraday': 60,            # Minute candles
+    'pricehistory_daily': 4 * 60 * 60,      # Daily/weekly/monthly candles
+    'instruments': 24 * 60 * 60,            # Symbol/description search
+    'fundamental': 24 * 60 * 60,            # Fundamental data
+}
+
+# Upper bound on the total size of cached responses (in bytes of the raw response body)
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Query params that do not change the response and are left out of the cache key
+IGNORED_PARAMS = ('apikey',)
+
+# In-memory cache of API responses with a TTL per endpoint and LRU eviction once max_bytes is exceeded
+# Cached values are shared between callers and must not be modified
+class ResponseCache:
+
+    def __init__(self, max_bytes:int=MAX_CACHE_BYTES, ttl:dict=None):
+        self.max_bytes = max_bytes
+        self.ttl = dict(CACHE_TTL if ttl is None else ttl)
+
+        self._entries = OrderedDict() # key: (expires_at, size, value, endpoint_type), least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    # Normalizes the query params into a hashable key: ignored and empty params are dropped, the rest sorted by name
+    @staticmethod
+    def make_key(endpoint:str, params:dict) -> tuple:
+        items = tuple(sorted((name, str(value)) for name, value in params.items() if value is not None and name not in IGNORED_PARAMS))
+        return (endpoint, items)
+
+    def _count(self, endpoint_type:str, stat:str):
+        endpoint_stats = self._stats.setdefault(endpoint_type, {'hits': 0, 'misses': 0, 'evictions': 0})
+        endpoint_stats[stat] += 1
+
+    # Returns (True, value) for a live cached response, else (False, None)
+    def get(self, endpoint_type:str, endpoint:str, params:dict) -> tuple:
+        key = self.make_key(endpoint, params)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] < time.monotonic():
+                # Expired responses are dropped on access
+                self._size -= entry[1]
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self._count(endpoint_type, 'misses')
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._count(endpoint_type, 'hits')
+            return True, entry[2]
+
+    def put(self, endpoint_type:str, endpoint:str, params:dict, value, size:int):
+        ttl = self.ttl.get(endpoint_type, 0)
+
+        # Responses without a TTL or larger than the whole cache are not stored
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        key = self.make_key(endpoint, params)
+
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = (time.monotonic() + ttl, size, value, endpoint_type)
+            self._size += size
+
+            # Evict least recently used responses until the cache fits in memory again
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _, evicted_type) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self._count(evicted_type, 'evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    # Returns hit/miss/eviction counters per endpoint type with the current number of entries and size in bytes
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'endpoints': {endpoint_type: dict(counters) for endpoint_type, counters in self._stats.items()},
+            }
+
+# Cache shared by every function in lib/tos_api_calls.py
+response_cache = ResponseCache()
@@ -0,0 +1,184 @@
+import time
+import random
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from lib.metrics import API_REQUEST_SECONDS, API_RESPONSE_BYTES
+
+# (connect, read) timeouts in seconds per endpoint type
+REQUEST_TIMEOUT = {
+    'quotes': (3.05, 5),
+    'chains': (3.05, 30),                   # Full option chains can be several MB
+    'pricehistory_intraday': (3.05, 15),
+    'pricehistory_daily': (3.05, 15),
+    'instruments': (3.05, 10),
+    'fundamental': (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Retry policy: responses with these status codes (rate limited/server errors) and connection errors are retried
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5      # seconds
+BACKOFF_MAX = 8.0       # seconds
+
+# Number of keep-alive connections kept open per host
+POOL_SIZE = 10
+
+# URL prefix of every TOS API endpoint
+API_PREFIX = 'https://api.tdameritrade.com/'
+
+# Request rate limit of the TOS API (per API key), every request attempt waits for a token of the shared limiter
+RATE_LIMIT = 120         # requests
+RATE_PERIOD = 60.0       # seconds
+
+# Number of recent request latencies kept per endpoint type for the percentiles in latency_stats()
+LATENCY_HISTORY = 1000
+
+# Token bucket: up to rate requests in a burst, then one request every period/rate seconds
+class RateLimiter:
+
+    def __init__(self, rate:int=RATE_LIMIT, period:float=RATE_PERIOD):
+        self.rate = rate
+        self.period = period
+
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    # Blocks until a request may be made
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.period)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) * self.period / self.rate
+                self.waited += delay
+
+            time.sleep(delay)
+
+_session = None
+_session_lock = threading.Lock()
+
+_rate_limiter = RateLimiter()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+# Returns the HTTP session shared by all TOS API calls (keep-alive connection pool, created on first use)
+def get_session() -> requests.Session:
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # Retries are handled in tos_request() so they can be counted and jittered
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+
+    return _session
+
+# Replaces the shared rate limiter, a rate of None or 0 disables rate limiting
+def set_rate_limit(rate:int=RATE_LIMIT, period:float=RATE_PERIOD):
+    global _rate_limiter
+
+    _rate_limiter = RateLimiter(rate, period) if rate else None
+
+# Replaces the transport adapter of the TOS API endpoints (e.g. the record/replay adapters of lib/tos_replay.py)
+# Requests still go through tos_request(), so retries, timeouts and latency stats apply to them
+def mount_adapter(adapter, prefix:str=API_PREFIX):
+
+    get_session().mount(prefix, adapter)
+
+# Full jitter exponential backoff (Source: https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/)
+# The Retry-After header of 429/503 responses is honoured when the server sends one
+def _backoff_delay(attempt:int, response=None) -> float:
+
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return min(float(retry_after), BACKOFF_MAX)
+
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+def _record(endpoint_type:str, latency:float, status, retries:int):
+
+    API_REQUEST_SECONDS.observe(latency, endpoint_type, 'connection_error' if status is None else status)
+
+    with _stats_lock:
+        endpoint_stats = _stats.setdefault(endpoint_type, {
+            'requests': 0, 'errors': 0, 'retries': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+            'latencies': deque(maxlen=LATENCY_HISTORY)
+        })
+        endpoint_stats['requests'] += 1
+        endpoint_stats['retries'] += retries
+        endpoint_stats['total_seconds'] += latency
+        endpoint_stats['max_seconds'] = max(endpoint_stats['max_seconds'], latency)
+        endpoint_stats['latencies'].append(latency)
+
+        if status is None or status >= 400:
+            endpoint_stats['errors'] += 1
+
+# Makes a GET request to the TOS API through the shared session, within the rate limit
+# Retries 429/5xx responses and connection errors up to MAX_RETRIES times, and records the latency of each attempt
+def tos_request(endpoint_type:str, endpoint:str, params:dict, timeout=None) -> requests.Response:
+
+    session = get_session()
+    if timeout is None:
+        timeout = REQUEST_TIMEOUT.get(endpoint_type, DEFAULT_TIMEOUT)
+
+    for attempt in range(MAX_RETRIES + 1):
+        if _rate_limiter is not None:
+            _rate_limiter.acquire()
+
+        start = time.perf_counter()
+        try:
+            response = session.get(url = endpoint, params = params, timeout = timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            _record(endpoint_type, time.perf_counter() - start, None, int(attempt > 0))
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(_backoff_delay(attempt))
+            continue
+
+        _record(endpoint_type, time.perf_counter() - start, response.status_code, int(attempt > 0))
+        API_RESPONSE_BYTES.observe(len(response.content), endpoint_type)
+
+        if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+            time.sleep(_backoff_delay(attempt, response))
+            continue
+
+        return response
+
+# Returns request counts and latency summary (in seconds) per endpoint type
+def latency_stats() -> dict:
+
+    summary = {}
+
+    with _stats_lock:
+        for endpoint_type, endpoint_stats in _stats.items():
+            latencies = sorted(endpoint_stats['latencies'])
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+            summary[endpoint_type] = {
+                'requests': endpoint_stats['requests'],
+                'errors': endpoint_stats['errors'],
+                'retries': endpoint_stats['retries'],
+                'mean_seconds': endpoint_stats['total_seconds'] / endpoint_stats['requests'],
+                'max_seconds': endpoint_stats['max_seconds'],
+                'p50_seconds': percentile(0.5),
+                'p95_seconds': percentile(0.95),
+            }
+
+    return summary
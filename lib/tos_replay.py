@@ -0,0 +1,459 @@
+import os
+import json
+import time
+import zlib
+import random
+import hashlib
+import datetime
+import tempfile
+import threading
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from lib.tos_client import mount_adapter
+from lib.price_store import period_start
+from lib.lazy_import import lazy_module
+
+# Black-Scholes prices of the synthetic option chains use the standard normal cdf
+special = lazy_module('scipy.special')
+
+# Offline stand-ins for the TD Ameritrade API, mounted on the session of lib/tos_client.py:
+#   RecordingAdapter  forwards requests to the API and saves every successful response in a recordings directory
+#   ReplayAdapter     serves recorded responses (or SyntheticMarket data) with configurable latency and error injection
+API_MODES = ('live', 'record', 'replay', 'synthetic')
+
+DEFAULT_RECORDINGS_DIR = os.path.join(os.path.expanduser('~'), '.tos_dashboard', 'recordings')
+
+# Query params that do not change the response and are left out of the recording key
+IGNORED_PARAMS = ('apikey',)
+
+# Returns the recording key of a request: URL path and sorted query params (ignored and empty params dropped)
+def recording_key(path:str, params:dict) -> str:
+
+    items = sorted((name, str(value)) for name, value in params.items() if value not in (None, '') and name not in IGNORED_PARAMS)
+    return json.dumps([path, items])
+
+def _split_url(url:str) -> tuple:
+    parts = urlsplit(url)
+    return parts.path, dict(parse_qsl(parts.query))
+
+def _json_response(request, status_code:int, data) -> requests.Response:
+
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = 'OK' if status_code == 200 else 'Error'
+    response.headers = CaseInsensitiveDict({'Content-Type': 'application/json'})
+    response._content = json.dumps(data).encode() if not isinstance(data, bytes) else data
+    response.encoding = 'utf-8'
+    response.url = request.url
+    response.request = request
+
+    return response
+
+# Forwards requests to the API (through adapter, a pooled HTTPAdapter by default) and saves each 200 response as
+# <directory>/<sha1 of the recording key>.json, replacing an earlier recording of the same request
+class RecordingAdapter(BaseAdapter):
+
+    def __init__(self, directory:str=None, adapter=None):
+        super().__init__()
+        self.directory = DEFAULT_RECORDINGS_DIR if directory is None else directory
+        self.adapter = HTTPAdapter() if adapter is None else adapter
+        self.recorded = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+
+        if response.status_code == 200:
+            path, params = _split_url(request.url)
+            key = recording_key(path, params)
+            record = {
+                'path': path,
+                'params': {name: value for name, value in params.items() if name not in IGNORED_PARAMS},
+                'status_code': response.status_code,
+                'body': response.content.decode(response.encoding or 'utf-8'),
+            }
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json'))
+            self.recorded += 1
+
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+# Serves API requests locally: recorded responses first, then SyntheticMarket data (if market is given), else a 404 error response
+# latency + uniform(0, jitter) seconds are slept per request, longer than the read timeout raises requests.ReadTimeout
+# error_rate: share of requests answered with error_status, connection_error_rate: share raising requests.ConnectionError
+# Injected latency and errors are drawn from a random generator seeded with seed, so runs are reproducible
+class ReplayAdapter(BaseAdapter):
+
+    def __init__(self, directory:str=None, market=None, latency:float=0.0, jitter:float=0.0, error_rate:float=0.0, error_status:int=503,
+                    connection_error_rate:float=0.0, seed:int=0):
+        super().__init__()
+        self.directory = directory
+        self.market = market
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.connection_error_rate = connection_error_rate
+
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.stats = {'requests': 0, 'recorded': 0, 'synthetic': 0, 'not_found': 0, 'errors': 0}
+
+        self.reload()
+
+    # Loads the recordings directory into memory
+    def reload(self):
+        self.recordings = {}
+        self._price_histories = {}
+
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            with open(entry.path) as f:
+                record = json.load(f)
+            self.recordings[recording_key(record['path'], record['params'])] = record
+
+            if record['path'].endswith('/pricehistory'):
+                self._price_histories.setdefault(record['path'], []).append(record)
+
+    # Price history requests with a date range (e.g. delta syncs of lib/price_store.py) are served from the longest recording
+    # of the same ticker and frequency, keeping the candles within the range
+    def _replay_price_history(self, path:str, params:dict):
+
+        frequency = (params.get('frequencyType'), params.get('frequency'))
+        records = [record for record in self._price_histories.get(path, []) if (record['params'].get('frequencyType'), record['params'].get('frequency')) == frequency]
+        if not records:
+            return None
+
+        data = max((json.loads(record['body']) for record in records), key=lambda data: len(data.get('candles', [])))
+
+        if 'startDate' in params and 'endDate' in params:
+            start, end = int(params['startDate']), int(params['endDate'])
+        else:
+            start, end = period_start(int(params.get('period', 1)), params.get('periodType', 'day')), int(time.time() * 1000)
+
+        data['candles'] = [candle for candle in data.get('candles', []) if start <= candle['datetime'] <= end]
+        return data
+
+    def _respond(self, request):
+        path, params = _split_url(request.url)
+
+        record = self.recordings.get(recording_key(path, params))
+        if record is not None:
+            self.stats['recorded'] += 1
+            return _json_response(request, record['status_code'], record['body'].encode())
+
+        if path.endswith('/pricehistory'):
+            data = self._replay_price_history(path, params)
+            if data is not None:
+                self.stats['recorded'] += 1
+                return _json_response(request, 200, data)
+
+        if self.market is not None:
+            data = self.market.respond(path, params)
+            if data is not None:
+                self.stats['synthetic'] += 1
+                return _json_response(request, 200, data)
+
+        self.stats['not_found'] += 1
+        return _json_response(request, 404, {'error': f'No recorded response for {path}'})
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        with self._random_lock:
+            self.stats['requests'] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            draw = self._random.random()
+
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.ReadTimeout(f'Injected latency of {delay:.2f}s exceeds the read timeout', request=request)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if draw < self.connection_error_rate:
+            self.stats['errors'] += 1
+            raise requests.ConnectionError('Injected connection error', request=request)
+
+        if draw < self.connection_error_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return _json_response(request, self.error_status, {'error': 'Injected error'})
+
+        return self._respond(request)
+
+    def close(self):
+        pass
+
+# First business day of the synthetic daily price paths, each path is generated from this day so its candles do not
+# depend on the requested range (delta syncs line up with full downloads)
+ANCHOR_DATE = '2000-01-03'
+
+# Deterministic synthetic market data in the format of the API responses, seeded per symbol
+# expiries: number of weekly expiries followed by monthly expiries (up to 2 * expiries in total), strikes: strikes per expiry
+class SyntheticMarket:
+
+    def __init__(self, seed:int=0, expiries:int=12, strikes:int=60):
+        self.seed = seed
+        self.expiries = expiries
+        self.strikes = strikes
+
+        self._daily = {}
+        self._daily_lock = threading.Lock()
+
+    def _rng(self, *key) -> np.random.Generator:
+        return np.random.default_rng([self.seed] + [zlib.crc32(str(part).encode()) for part in key])
+
+    # Annualized volatility and first price of the symbol's price path
+    def _profile(self, symbol:str) -> tuple:
+        crc = zlib.crc32(symbol.encode())
+        return 0.15 + (crc % 45) / 100, 20.0 + crc % 400
+
+    # Daily candles of the symbol from ANCHOR_DATE to today (Dataframe with the columns of the API candles)
+    def daily(self, symbol:str) -> pd.DataFrame:
+
+        today = datetime.date.today()
+        with self._daily_lock:
+            cached = self._daily.get(symbol)
+            if cached is not None and cached[0] == today:
+                return cached[1]
+
+        dates = pd.bdate_range(ANCHOR_DATE, today)
+        volatility, first_price = self._profile(symbol)
+        rng = self._rng(symbol, 'daily')
+
+        daily_sigma = volatility / np.sqrt(252)
+        close = first_price * np.exp(np.cumsum(rng.normal(0.0003, daily_sigma, len(dates))))
+        open_ = close * np.exp(rng.normal(0, daily_sigma / 4, len(dates)))
+        high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, daily_sigma / 2, len(dates))))
+        low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, daily_sigma / 2, len(dates))))
+
+        # Daily candles are stamped at midnight exchange time, like the API
+        timestamps = ((dates.tz_localize('America/Chicago') - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).to_numpy()
+
+        df = pd.DataFrame({
+            'open': np.round(open_, 2), 'high': np.round(high, 2), 'low': np.round(low, 2), 'close': np.round(close, 2),
+            'volume': rng.integers(10**5, 10**7, len(dates)), 'datetime': timestamps,
+        })
+
+        with self._daily_lock:
+            self._daily[symbol] = (today, df)
+
+        return df
+
+    def last_price(self, symbol:str) -> float:
+        return float(self.daily(symbol)['close'].iloc[-1])
+
+    # Intraday candles every frequency minutes of the regular session (9:30 to 16:00 New York time) of each business day,
+    # each day bridging the previous daily close to the daily close
+    def intraday(self, symbol:str, frequency:int, start:int, end:int) -> pd.DataFrame:
+
+        daily = self.daily(symbol)
+        volatility, _ = self._profile(symbol)
+        session_minutes = np.arange(0, 390, frequency)
+        frames = []
+
+        first_day = max(1, int(np.searchsorted(daily['datetime'].to_numpy(), start)) - 1)
+        for i in range(first_day, len(daily)):
+            day = pd.Timestamp(daily['datetime'].iloc[i], unit='ms', tz='UTC').tz_convert('America/New_York').normalize()
+            session_start = (day + pd.Timedelta(hours=9, minutes=30)).value // 10**6
+            timestamps = session_start + session_minutes * 60 * 1000
+
+            rng = self._rng(symbol, 'intraday', frequency, i)
+            walk = np.cumsum(rng.normal(0, volatility / np.sqrt(252 * len(session_minutes)), len(session_minutes)))
+            bridge = walk - walk[-1] * np.arange(1, len(walk) + 1) / len(walk)
+            log_prices = np.log(daily['close'].iloc[i - 1]) + (np.log(daily['close'].iloc[i] / daily['close'].iloc[i - 1])) * np.arange(1, len(walk) + 1) / len(walk) + bridge
+            close = np.exp(log_prices)
+            open_ = np.concatenate([[daily['close'].iloc[i - 1]], close[:-1]])
+
+            frames.append(pd.DataFrame({
+                'open': np.round(open_, 2), 'high': np.round(np.maximum(open_, close), 2), 'low': np.round(np.minimum(open_, close), 2),
+                'close': np.round(close, 2), 'volume': rng.integers(10**3, 10**5, len(walk)), 'datetime': timestamps,
+            }))
+
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['open', 'high', 'low', 'close', 'volume', 'datetime'])
+        return df[(df['datetime'] >= start) & (df['datetime'] <= end)]
+
+    # Price history response (https://developer.tdameritrade.com/price-history/apis/get/marketdata/%7Bsymbol%7D/pricehistory)
+    def price_history(self, symbol:str, period=None, periodType:str='day', frequencyType:str=None, frequency=1, startDate=None, endDate=None) -> dict:
+
+        if frequencyType is None:
+            frequencyType = {'day': 'minute', 'month': 'weekly', 'year': 'monthly', 'ytd': 'weekly'}[periodType]
+
+        if startDate is not None and endDate is not None:
+            start, end = int(startDate), int(endDate)
+        else:
+            if period is None:
+                period = 10 if periodType == 'day' else 1
+            start, end = period_start(int(period), periodType), int(time.time() * 1000)
+
+        if frequencyType == 'minute':
+            df = self.intraday(symbol, int(frequency), start, end)
+        else:
+            df = self.daily(symbol)
+            df = df[(df['datetime'] >= start) & (df['datetime'] <= end)]
+
+            if frequencyType in ('weekly', 'monthly'):
+                periods = pd.to_datetime(df['datetime'], unit='ms').dt.to_period('W' if frequencyType == 'weekly' else 'M')
+                df = df.groupby(periods.to_numpy()).agg({'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum', 'datetime': 'first'})
+
+        candles = [{'open': o, 'high': h, 'low': l, 'close': c, 'volume': int(v), 'datetime': int(t)}
+                   for o, h, l, c, v, t in zip(df['open'].tolist(), df['high'].tolist(), df['low'].tolist(), df['close'].tolist(), df['volume'].tolist(), df['datetime'].tolist())]
+
+        return {'candles': candles, 'symbol': symbol, 'empty': len(candles) == 0}
+
+    def quote(self, symbol:str) -> dict:
+
+        daily = self.daily(symbol)
+        last, previous = daily.iloc[-1], daily.iloc[-2]
+        volatility, _ = self._profile(symbol)
+        year = daily.iloc[-252:]
+
+        return {
+            'symbol': symbol, 'description': f'{symbol} Synthetic Equity', 'assetType': 'EQUITY',
+            'bidPrice': round(last['close'] - 0.01, 2), 'askPrice': round(last['close'] + 0.01, 2), 'lastPrice': float(last['close']),
+            'openPrice': float(last['open']), 'highPrice': float(last['high']), 'lowPrice': float(last['low']), 'closePrice': float(previous['close']),
+            'netChange': round(last['close'] - previous['close'], 2), 'totalVolume': int(last['volume']), 'volatility': volatility,
+            '52WkHigh': float(year['high'].max()), '52WkLow': float(year['low'].min()), 'quoteTimeInLong': int(time.time() * 1000),
+        }
+
+    # Expiry dates: the next expiries Fridays, then the third Friday of the following months
+    def _expiry_dates(self, today:datetime.date) -> list:
+
+        fridays = pd.date_range(today, periods=self.expiries, freq='W-FRI')
+        third_fridays = pd.date_range(fridays[-1] + pd.Timedelta(days=1), periods=self.expiries, freq='WOM-3FRI')
+
+        return sorted(set(fridays) | set(third_fridays))
+
+    # Option chain response (https://developer.tdameritrade.com/option-chains/apis/get/marketdata/chains), priced with Black-Scholes
+    def option_chain(self, symbol:str, contractType:str='ALL', now:datetime.datetime=None) -> dict:
+
+        if now is None:
+            now = datetime.datetime.now()
+
+        stock_price = self.last_price(symbol)
+        volatility, _ = self._profile(symbol)
+        rng = self._rng(symbol, 'chain', now.date())
+
+        # Strikes within about +-50% of the stock price, on a step rounded to 0.5
+        step = max(0.5, float(np.round(stock_price / self.strikes * 2) / 2))
+        strikes = np.round(stock_price / step) * step + step * (np.arange(self.strikes) - self.strikes // 2)
+        strikes = np.round(strikes[strikes > 0], 2)
+
+        chain = {'symbol': symbol, 'status': 'SUCCESS', 'underlying': None, 'strategy': 'SINGLE', 'isDelayed': False,
+                    'interestRate': 0.01, 'underlyingPrice': stock_price, 'volatility': volatility * 100,
+                    'numberOfContracts': 0, 'callExpDateMap': {}, 'putExpDateMap': {}}
+
+        for expiry in self._expiry_dates(now.date()):
+            expiration = datetime.datetime.combine(expiry.date(), datetime.time(16, 0))
+            days = (expiration.date() - now.date()).days
+            T = max((expiration - now).total_seconds(), 60.0) / (365 * 24 * 60 * 60)
+
+            # Volatility smile: higher implied volatility away from the money
+            implied_volatility = volatility * (1 + 0.5 * np.log(strikes / stock_price)**2 / T**0.5)
+            d1 = (np.log(stock_price / strikes) + (0.01 + implied_volatility**2 / 2) * T) / (implied_volatility * np.sqrt(T))
+            d2 = d1 - implied_volatility * np.sqrt(T)
+            discount = np.exp(-0.01 * T)
+
+            for option_type, map_name in [('CALL', 'callExpDateMap'), ('PUT', 'putExpDateMap')]:
+                if contractType not in ('ALL', option_type):
+                    continue
+
+                if option_type == 'CALL':
+                    price = stock_price * special.ndtr(d1) - strikes * discount * special.ndtr(d2)
+                    delta = special.ndtr(d1)
+                else:
+                    price = strikes * discount * special.ndtr(-d2) - stock_price * special.ndtr(-d1)
+                    delta = special.ndtr(d1) - 1
+
+                spread = np.maximum(0.01, price * 0.04)
+                bid = np.round(np.maximum(0.0, price - spread / 2), 2)
+                ask = np.round(price + spread / 2, 2)
+                open_interest = rng.integers(0, 5000, len(strikes))
+                total_volume = rng.integers(0, 2000, len(strikes))
+                bid_size = rng.integers(1, 200, len(strikes))
+                ask_size = rng.integers(1, 200, len(strikes))
+
+                chain[map_name][f'{expiry.date()}:{days}'] = {
+                    f'{strike:.1f}': [{
+                        'putCall': option_type,
+                        'symbol': f"{symbol}_{expiry.strftime('%m%d%y')}{option_type[0]}{strike:g}",
+                        'description': f"{symbol} {expiry.strftime('%b %d %Y')} {strike:g} {option_type.title()}",
+                        'bid': bid[i], 'ask': ask[i], 'last': round((bid[i] + ask[i]) / 2, 2), 'mark': round((bid[i] + ask[i]) / 2, 2),
+                        'bidSize': int(bid_size[i]), 'askSize': int(ask_size[i]),
+                        'totalVolume': int(total_volume[i]), 'openInterest': int(open_interest[i]),
+                        'volatility': round(implied_volatility[i] * 100, 3), 'delta': round(float(delta[i]), 3),
+                        'strikePrice': float(strike), 'expirationDate': int(expiration.timestamp() * 1000), 'daysToExpiration': days,
+                        'multiplier': 100.0, 'inTheMoney': bool(strike < stock_price) if option_type == 'CALL' else bool(strike > stock_price),
+                    }]
+                    for i, strike in enumerate(strikes.tolist())
+                }
+                chain['numberOfContracts'] += len(strikes)
+
+        return chain
+
+    def instruments(self, symbol:str, projection:str='symbol-search') -> dict:
+
+        symbol = symbol.upper()
+        instrument = {'cusip': f'{zlib.crc32(symbol.encode()):09d}'[:9], 'symbol': symbol, 'description': f'{symbol} Synthetic Equity',
+                        'exchange': 'NASDAQ', 'assetType': 'EQUITY'}
+
+        if projection == 'fundamental':
+            quote = self.quote(symbol)
+            instrument['fundamental'] = {'symbol': symbol, 'high52': quote['52WkHigh'], 'low52': quote['52WkLow'],
+                                            'peRatio': 20.0, 'dividendYield': 0.7, 'beta': 1.0, 'marketCap': 10000.0}
+
+        return {symbol: instrument}
+
+    # Returns the synthetic response of an API path and its query params, or None for an unknown endpoint
+    def respond(self, path:str, params:dict):
+
+        parts = path.strip('/').split('/')
+
+        if path.endswith('/pricehistory'):
+            return self.price_history(parts[-2], params.get('period'), params.get('periodType', 'day'), params.get('frequencyType'),
+                                        params.get('frequency', 1), params.get('startDate'), params.get('endDate'))
+        elif path.endswith('/marketdata/quotes'):
+            return {symbol: self.quote(symbol) for symbol in params.get('symbol', '').split(',') if symbol}
+        elif path.endswith('/marketdata/chains'):
+            return self.option_chain(params['symbol'], params.get('contractType', 'ALL'))
+        elif path.endswith('/instruments'):
+            return self.instruments(params['symbol'], params.get('projection', 'symbol-search'))
+
+        return None
+
+# Mounts the adapter of an API mode on the shared TOS API session and returns it (None for 'live')
+#   record: live API, responses saved to directory       replay: recorded responses only
+#   synthetic: recorded responses if directory is given, else SyntheticMarket data
+def configure_api_mode(mode:str='live', directory:str=None, latency:float=0.0, jitter:float=0.0, error_rate:float=0.0, seed:int=0):
+
+    if mode == 'live':
+        return None
+    elif mode == 'record':
+        adapter = RecordingAdapter(directory)
+    elif mode == 'replay':
+        adapter = ReplayAdapter(DEFAULT_RECORDINGS_DIR if directory is None else directory, None, latency, jitter, error_rate, seed=seed)
+    elif mode == 'synthetic':
+        adapter = ReplayAdapter(directory, SyntheticMarket(seed), latency, jitter, error_rate, seed=seed)
+    else:
+        raise ValueError(f"Unknown API mode '{mode}', expected one of {', '.join(API_MODES)}.")
+
+    mount_adapter(adapter)
+
+    return adapter